@@ -5,6 +5,8 @@ from pydantic_settings import BaseSettings
 class Settings(BaseSettings):
     API_TITLE: str = "RAG AI API"
     REDIS_URL: str
+    REDIS_MAX_CONNECTIONS: int = 50  # async pool shared by the API routes
+    HEARTBEAT_CACHE_SECONDS: int = 5
     EXPOSED_PORT: int
     RAGFLOW_BASE_URL: str
     RAGFLOW_API_KEY: str
@@ -15,10 +17,94 @@ class Settings(BaseSettings):
     PUBLIC_LLM_MODEL: str
     NULL_RAGFLOW_ANSWER: str
     PROCESSED_FILE_DIR: str
+    UPLOAD_SPOOL_DIR: str = "uploaded_files"  # shared by the API and the workers
+    UPLOAD_CHUNK_SIZE: int = 1048576  # bytes
     Q_COLUMN_WIDTH: int
     A_COLUMN_WIDTH: int
     REF_COLUMN_WIDTH: int
     GEMINI_API_KEY: str
+    # Max in-flight requests per backend while answering one upload (1 = sequential)
+    RAGFLOW_MAX_CONCURRENCY: int = 1
+    PUBLIC_LLM_MAX_CONCURRENCY: int = 1
+    # Pack public LLM fallback questions into batched calls returning a JSON array
+    PUBLIC_LLM_BATCH_MODE: bool = False
+    PUBLIC_LLM_BATCH_MAX_CHARS: int = 12000
+    PUBLIC_LLM_BATCH_MAX_ITEMS: int = 50
+    # Budget of estimated tokens per prompt, longer requirements are not asked (0 = no budget)
+    PROMPT_MAX_TOKENS: int = 0
+    # Public LLM provider: gemini, openai (any OpenAI-compatible server) or stub (offline)
+    PUBLIC_LLM_PROVIDER: str = "gemini"
+    # Hedging: also ask this provider when the public LLM is slower than the delay
+    PUBLIC_LLM_HEDGE_PROVIDER: str = ""  # empty = no hedging
+    PUBLIC_LLM_HEDGE_MODEL: str = ""  # empty = PUBLIC_LLM_MODEL
+    PUBLIC_LLM_HEDGE_DELAY: float = 2.0  # seconds
+    GEMINI_TIMEOUT: float = 60.0  # seconds per request
+    OPENAI_BASE_URL: str = ""  # empty = api.openai.com
+    OPENAI_API_KEY: str = ""
+    OPENAI_TIMEOUT: float = 60.0  # seconds per request
+    STUB_LLM_ANSWER: str = "No public LLM is configured to answer this requirement."
+    # Worker-level RAGFlow client/assistant cache and session pool
+    RAGFLOW_CLIENT_TTL: int = 600  # seconds
+    RAGFLOW_SESSION_POOL_SIZE: int = 4
+    RAGFLOW_HTTP_POOL_SIZE: int = 10
+    # Redis-backed cache of final answers keyed by normalized requirement text
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_TTL: int = 604800  # seconds
+    ANSWER_CACHE_MAX_ENTRIES: int = 100000
+    # Reuse the answers of similar requirements found in a local embedding index
+    SEMANTIC_INDEX_ENABLED: bool = False
+    SEMANTIC_EMBEDDER: str = "hashing"  # or "module:factory" returning an embedder
+    SEMANTIC_EMBEDDING_DIM: int = 384  # dimensions of the hashing embedder
+    SEMANTIC_SIMILARITY_THRESHOLD: float = 0.9  # cosine similarity
+    SEMANTIC_INDEX_MAX_ENTRIES: int = 20000
+    # Per-question checkpoints let an interrupted or redelivered job resume
+    CHECKPOINT_TTL: int = 86400  # seconds
+    # An unacknowledged job is redelivered by the Redis broker after this delay,
+    # it must exceed the longest job duration (acks_late)
+    BROKER_VISIBILITY_TIMEOUT: int = 43200  # seconds
+    # Jobs with more pending questions than this are split into chunk tasks (0 = never)
+    CHUNK_SIZE: int = 0
+    BATCH_MAX_FILES: int = 100  # workbooks accepted by one batch upload
+    BATCH_MAX_UNCOMPRESSED_BYTES: int = 524288000  # of a zip archive, 0 = no limit
+    # An identical upload within UPLOAD_DEDUP_TTL returns the job of the first one
+    UPLOAD_DEDUP_ENABLED: bool = True
+    UPLOAD_DEDUP_TTL: int = 86400  # seconds, at most the celery result expiry (1 day)
+    # Processed outputs: content-addressed store swept by a Celery beat task
+    OUTPUT_RETENTION_SECONDS: int = 604800  # 0 = keep forever
+    OUTPUT_STORE_MAX_BYTES: int = 10737418240  # 0 = no size budget
+    OUTPUT_SWEEP_INTERVAL: int = 3600  # seconds
+    # Hand downloads to the reverse proxy (e.g. nginx X-Accel-Redirect) under this prefix
+    DOWNLOAD_ACCEL_REDIRECT_PREFIX: str = ""
+    # Job routing: jobs up to FAST_LANE_MAX_ROWS rows go to the fast queue, others to bulk
+    FAST_QUEUE: str = "ragai.fast"
+    BULK_QUEUE: str = "ragai.bulk"
+    FAST_LANE_MAX_ROWS: int = 200
+    FAST_QUEUE_CONCURRENCY: int = 4  # worker processes for each queue
+    BULK_QUEUE_CONCURRENCY: int = 2
+    # Fair share: running jobs per tenant, extra jobs are requeued behind other tenants
+    TENANT_MAX_ACTIVE_JOBS: int = 2  # 0 = unlimited
+    TENANT_RETRY_SECONDS: int = 10  # interval of the check for parked jobs to requeue
+    TENANT_SLOT_TTL: int = 7200  # seconds without progress before the slot of a job is freed
+    # Throttle progress writes: store at most every interval seconds or step percent
+    PROGRESS_UPDATE_INTERVAL: float = 1.0
+    PROGRESS_UPDATE_STEP: float = 5.0
+    # Backend resilience: Redis token buckets (requests/second, 0 = unlimited),
+    # jittered exponential backoff retries and per-worker circuit breakers
+    RAGFLOW_RATE_LIMIT: float = 0
+    RAGFLOW_RATE_BURST: int = 10
+    PUBLIC_LLM_RATE_LIMIT: float = 0
+    PUBLIC_LLM_RATE_BURST: int = 10
+    # a throttled backend (429) lowers its rate by this factor, then the rate recovers
+    # linearly over RATE_LIMIT_RECOVERY_SECONDS
+    RATE_LIMIT_BACKOFF_FACTOR: float = 0.5
+    RATE_LIMIT_RECOVERY_SECONDS: float = 60.0
+    BACKEND_MAX_RETRIES: int = 3
+    BACKEND_RETRY_BASE_DELAY: float = 0.5  # seconds
+    BACKEND_RETRY_MAX_DELAY: float = 10.0  # seconds
+    CIRCUIT_BREAKER_THRESHOLD: int = 5  # consecutive failures, 0 = never open
+    CIRCUIT_BREAKER_RESET_SECONDS: float = 30.0
+    # Prometheus metrics: /metrics on the API, and an HTTP server per worker (0 = off)
+    WORKER_METRICS_PORT: int = 9100
 
     class Config:
         env_file = ".env"
@@ -2,13 +2,14 @@ import os
 from app.config.logging_config import setup_logging
 from app.routers import ragflowtasks
 from app.utils.redis_client import redis_client  # Import the Redis client
+from app.utils.metrics import render_metrics
 
 # Get the absolute path to the logging configuration file
 base_dir = os.path.dirname(os.path.abspath(__file__))
 app_logging_config_path = os.path.join(base_dir, "config/logging_app.yaml")
 setup_logging(app_logging_config_path)  # apply YAML config to the logging module
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 
@@ -33,3 +34,10 @@ app.add_middleware(
 )
 
 app.include_router(ragflowtasks.router, prefix="/api")
+
+
+# Prometheus scrape endpoint, the workers serve theirs on WORKER_METRICS_PORT
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    (body, content_type) = render_metrics()
+    return Response(content=body, media_type=content_type)
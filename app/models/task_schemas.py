@@ -17,6 +17,19 @@ class TaskStatus(str, Enum):
     ERRORED = "ERROR"  # Custom status for error tasks
 
 
+class OutputFormat(str, Enum):
+    XLSX = "xlsx"
+    CSV = "csv"
+    PARQUET = "parquet"  # written with pyarrow
+    JSONL = "jsonl"
+
+
+class JobPriority(str, Enum):
+    AUTO = "auto"  # routed by the size of the upload
+    INTERACTIVE = "interactive"  # always the fast lane
+    BULK = "bulk"  # always the bulk queue
+
+
 class TaskResult(BaseModel):
     task_id: str
     status: TaskStatus
@@ -25,3 +38,16 @@ class TaskResult(BaseModel):
     error: Optional[str] = None
     filename: Optional[str] = None  # Original uploaded filename
     processed_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None  # When a worker started the job
+    cached_rows: list[int] = []  # Indexes of requirements served from the answer cache
+    semantic_rows: list[int] = []  # Indexes of requirements reusing a similar answer
+    over_budget_rows: list[int] = []  # Indexes of requirements over PROMPT_MAX_TOKENS, not asked
+    deduplicated_calls: int = 0  # Backend calls saved by collapsing duplicate requirements
+    checkpoint_key: Optional[str] = None  # Redis hash holding the per-question answers
+    resumed_calls: int = 0  # Questions answered by an earlier run and resumed from checkpoint
+    skipped_state_writes: int = 0  # Progress updates coalesced by the throttled reporter
+    outputs: list[str] = []  # Per-file outputs of a batch, bundled in download_path
+    skipped_files: list[str] = []  # Batch files without any readable 'Requirement' sheet
+    output_format: str = OutputFormat.XLSX.value  # Format of the generated output files
+    annotate: bool = False  # Answers written into a copy of the input workbook
+    tenant_id: Optional[str] = None  # Tenant sharing the fair-share job slots
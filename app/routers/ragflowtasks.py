@@ -1,14 +1,48 @@
+import os
+import glob
+import json
+import time
+import uuid
+import hashlib
+import asyncio
+import contextlib
 import logging
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import FileResponse
-from celery.result import AsyncResult  # Import AsyncResult
-from app.tasks.process_task import process_excel  # Import the Celery task
+import importlib.util
+from typing import Any, AsyncIterator, Optional
+from fastapi import APIRouter, UploadFile, File, HTTPException, Request, Response
+from starlette.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
 from app.tasks.celery_worker import celery_app  # Import the Celery app
-from app.models.task_schemas import TaskResult, TaskStatus
+from app.models.task_schemas import JobPriority, OutputFormat, TaskResult, TaskStatus
+from app.config.setting import settings
+from app.utils.checkpoint import TaskCheckpoint, load_checkpoint_rows
+from app.utils.metrics import REUSED_UPLOADS, UPLOADS
+from app.utils.output_store import output_store
+from app.utils.progress import download_url, events_channel
+from app.utils.redis_client import redis_client
+from app.utils.scheduling import choose_queue
+from app.utils.upload_dedup import claim_upload, release_upload, upload_key
+from app.utils.file_client import (
+    MEDIA_TYPES,
+    estimate_rows,
+    get_processed_file_directory,
+    get_processed_file_root,
+    remove_spooled_upload,
+    spool_upload,
+    write_output,
+)
 
 
 logger = logging.getLogger(__name__)
 
+SSE_KEEPALIVE_SECONDS = 15
+# queued jobs have no state in the result backend yet: a marker tells them from
+# unknown task ids until their result expires
+QUEUED_PREFIX = "ragai:queued"
+# jobs are sent by task name, so the API never imports the task modules and their backends
+PROCESS_EXCEL_TASK = "app.tasks.process_task.process_excel"
+PROCESS_BATCH_TASK = "app.tasks.process_task.process_batch"
+
 
 router = APIRouter(
     prefix="/ragflowai",
@@ -17,26 +51,192 @@ router = APIRouter(
 )
 
 
+# result of the last heartbeat check, reused for HEARTBEAT_CACHE_SECONDS
+_heartbeat = {"checked_at": None, "error": None}
+_heartbeat_lock = asyncio.Lock()
+
+
 # add heartbeat endpoint to check if the server is running
 @router.get("/heartbeat")
 async def heartbeat():
-    # check if redis is running
+    # check if redis is running, at most once per HEARTBEAT_CACHE_SECONDS
+    async with _heartbeat_lock:
+        checked_at = _heartbeat["checked_at"]
+        if (
+            checked_at is None
+            or time.monotonic() - checked_at >= settings.HEARTBEAT_CACHE_SECONDS
+        ):
+            try:
+                await redis_client.redis_client.ping()
+                # the celery control ping blocks, keep it off the event loop
+                await run_in_threadpool(celery_app.control.ping, timeout=1)
+                _heartbeat["error"] = None
+            except Exception as e:
+                _heartbeat["error"] = str(e)
+            _heartbeat["checked_at"] = time.monotonic()
+    if _heartbeat["error"]:
+        logger.error(f"Redis is not running: {_heartbeat['error']}")
+        raise HTTPException(status_code=500, detail="Redis is not running")
+    logger.debug("Redis is running")
+    return {"status": "ok"}
+
+
+async def read_task_meta(task_id: str) -> tuple[str, Any]:
+    """
+    Read the state and info of a task straight from the Celery result backend
+    through the async Redis pool, so the event loop is never blocked.
+
+    Returns:
+        tuple[str, Any]: The task state (PENDING if unknown) and its info.
+    """
+    backend = celery_app.backend
+    payload = await redis_client.redis_client.get(backend.get_key_for_task(task_id))
+    if not payload:
+        return (TaskStatus.PENDING, None)
+    meta = backend.decode_result(payload)
+    return (meta["status"], meta["result"])
+
+
+def _check_output_format(output_format: OutputFormat, annotate: bool):
+    # fail the upload now rather than the job once all questions are answered
+    if annotate and output_format != OutputFormat.XLSX:
+        raise HTTPException(
+            status_code=400, detail="Annotated outputs can only be xlsx workbooks"
+        )
+    if output_format == OutputFormat.PARQUET and not importlib.util.find_spec("pyarrow"):
+        raise HTTPException(
+            status_code=400, detail="Parquet output is not available on this server"
+        )
+
+
+async def _queued_response(task_id: str, queue: str) -> dict:
+    UPLOADS.labels(queue).inc()
     try:
-        celery_app.control.ping(timeout=1)
-        logger.debug("Redis is running")
-        return {"status": "ok"}
+        await redis_client.redis_client.set(
+            f"{QUEUED_PREFIX}:{task_id}",
+            queue,
+            ex=int(celery_app.conf.result_expires.total_seconds()),
+        )
     except Exception as e:
-        logger.error(f"Redis is not running: {e}")
-        raise HTTPException(status_code=500, detail="Redis is not running")
+        logger.warning(f"Could not mark task {task_id} as queued: {e}")
+    # position of the job in its queue (1 = next to start), running jobs not counted
+    try:
+        queue_position = await redis_client.redis_client.llen(queue)
+    except Exception as e:
+        logger.warning(f"Could not read the length of queue {queue}: {e}")
+        queue_position = None
+    return {"task_id": task_id, "queue": queue, "queue_position": queue_position}
+
+
+async def _reused_job_response(task_id: str) -> Optional[dict]:
+    # the job of an identical upload, unless it failed or its output has expired
+    (state, info) = await read_task_meta(task_id)
+    if state == TaskStatus.SUCCESS:
+        download_path = (info or {}).get("download_path")
+        if not download_path or not os.path.exists(download_path):
+            return None
+        response = {"task_id": task_id, "status": state, "download_url": download_url(task_id)}
+    elif state in (TaskStatus.FAILURE, TaskStatus.REVOKED):
+        return None
+    else:
+        # PENDING while queued, then STARTED, PROCESSING or RETRY
+        response = {"task_id": task_id, "status": state}
+    REUSED_UPLOADS.labels(state).inc()
+    logger.info(f"Upload identical to the one of task {task_id} ({state}), not queued again")
+    return {**response, "reused": True}
 
 
 @router.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
+async def upload_file(
+    file: UploadFile = File(...),
+    output_format: OutputFormat = OutputFormat.XLSX,
+    annotate: bool = False,
+    priority: JobPriority = JobPriority.AUTO,
+    tenant_id: Optional[str] = None,
+    force: bool = False,
+):
+    # annotate: write the answers as new columns of a copy of the uploaded workbook
+    # force: queue a new job even if the same workbook was uploaded recently
+    _check_output_format(output_format, annotate)
     filename = file.filename
     logger.info(f"For RagFlow AI, input file.filename: {filename}")
-    contents = await file.read()
-    task = process_excel.delay(filename, contents)  # Pass the file contents to the task
-    return {"task_id": task.id}
+    # Stream the file to the shared spool directory, only its path goes through the broker
+    digest = hashlib.sha256()
+    upload_path = await spool_upload(file, digest=digest)
+    task_id = str(uuid.uuid4())
+    key = None
+    if settings.UPLOAD_DEDUP_ENABLED:
+        # an identical upload with the same options reuses the running or finished job
+        key = upload_key(
+            digest.hexdigest(),
+            output_format=output_format.value,
+            annotate=annotate,
+            tenant_id=tenant_id,
+        )
+        holder = await claim_upload(key, task_id, force)
+        if holder is not None:
+            response = await _reused_job_response(holder)
+            if response is not None:
+                remove_spooled_upload(upload_path)
+                return response
+            await claim_upload(key, task_id, force=True)
+    # small jobs take the fast lane so they are not stuck behind large ones
+    queue = choose_queue(await run_in_threadpool(estimate_rows, upload_path), priority)
+    try:
+        task = celery_app.send_task(
+            PROCESS_EXCEL_TASK,
+            args=(filename,),
+            kwargs={
+                "upload_path": upload_path,
+                "output_format": output_format.value,
+                "annotate": annotate,
+                "tenant_id": tenant_id,
+            },
+            task_id=task_id,
+            queue=queue,
+        )
+    except Exception:
+        # a job that was never queued must not be returned to identical uploads
+        if key is not None:
+            await release_upload(key, task_id)
+        remove_spooled_upload(upload_path)
+        raise
+    return await _queued_response(task.id, queue)
+
+
+# upload several Excel files and/or zip archives of Excel files, answered as one job
+@router.post("/upload/batch")
+async def upload_batch(
+    files: list[UploadFile] = File(...),
+    output_format: OutputFormat = OutputFormat.XLSX,
+    annotate: bool = False,
+    priority: JobPriority = JobPriority.AUTO,
+    tenant_id: Optional[str] = None,
+):
+    _check_output_format(output_format, annotate)
+    if len(files) > settings.BATCH_MAX_FILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.BATCH_MAX_FILES} files can be uploaded at once",
+        )
+    filenames = [file.filename for file in files]
+    logger.info(f"For RagFlow AI, batch input filenames: {filenames}")
+    upload_paths = [await spool_upload(file) for file in files]
+    # the size of a batch is only known once its archives are unpacked
+    queue = choose_queue(None, priority)
+    try:
+        task = celery_app.send_task(
+            PROCESS_BATCH_TASK,
+            args=(filenames, upload_paths, output_format.value),
+            kwargs={"annotate": annotate, "tenant_id": tenant_id},
+            queue=queue,
+        )
+    except Exception:
+        # no job will ever read the spooled uploads of a batch that was not queued
+        for upload_path in upload_paths:
+            remove_spooled_upload(upload_path)
+        raise
+    return await _queued_response(task.id, queue)
 
 
 @router.get("/status/{task_id}", response_model=TaskResult)
@@ -47,12 +247,12 @@ async def get_status(task_id: str):
         logger.error(err_msg)
         raise HTTPException(status_code=403, detail=err_msg)
 
-    # Use AsyncResult with the Celery app instance
+    # Read the task meta from the result backend
     try:
-        task_result = AsyncResult(task_id, app=celery_app)
-        logger.info(f"Task task_result.state: {task_result.state}")
-        logger.info(f"Task task_result.info: {task_result.info}")
-        if task_result.state == TaskStatus.PENDING:
+        (state, info) = await read_task_meta(task_id)
+        logger.debug(f"Task state: {state}")
+        logger.debug(f"Task info: {info}")
+        if state == TaskStatus.PENDING:
             err_msg = f"Task ID: {task_id} not found in Redis or has expired"
             logger.error(err_msg)
             raise HTTPException(status_code=404, detail=err_msg)
@@ -60,8 +260,10 @@ async def get_status(task_id: str):
         err_msg = f"Task ID: {task_id} query failed with error: {e}"
         logger.error(err_msg)
         raise HTTPException(status_code=404, detail=err_msg)
+    # the info of a RETRY state may be the Retry exception rather than a TaskResult
+    info = info if isinstance(info, dict) else {}
     # if the task state is FAILURE, return TaskResult with FAILURE status and make progress 0
-    if task_result.state == TaskStatus.FAILURE:
+    if state == TaskStatus.FAILURE:
         return TaskResult(
             task_id=task_id,
             status=TaskStatus.FAILURE,
@@ -71,43 +273,118 @@ async def get_status(task_id: str):
     else:
         return TaskResult(
             task_id=task_id,
-            status=task_result.state if task_result.state else "UNKNOWN",
-            progress=task_result.info.get("progress", 0) if task_result.info else 0,
-            filename=task_result.info.get("filename", None),
-            processed_at=task_result.info.get("processed_at", None),
+            status=state if state else "UNKNOWN",
+            progress=info.get("progress", 0),
+            filename=info.get("filename", None),
+            processed_at=info.get("processed_at", None),
+            cached_rows=info.get("cached_rows", []),
+            semantic_rows=info.get("semantic_rows", []),
+            over_budget_rows=info.get("over_budget_rows", []),
+            deduplicated_calls=info.get("deduplicated_calls", 0),
+            resumed_calls=info.get("resumed_calls", 0),
+            outputs=info.get("outputs", []),
+            skipped_files=info.get("skipped_files", []),
+            output_format=info.get("output_format", OutputFormat.XLSX.value),
+            annotate=info.get("annotate", False),
         )
 
 
-# add get endpoint to download the processed file
-@router.get("/download/{task_id}", response_class=FileResponse)
-async def download_file(task_id: str):
-    # Use AsyncResult with the Celery app instance
-    task_result = AsyncResult(task_id, app=celery_app)
+async def _task_events(request: Request, task_id: str) -> AsyncIterator[str]:
+    pubsub = redis_client.redis_client.pubsub()
+    try:
+        # subscribe before reading the current state so no event is missed in between
+        await pubsub.subscribe(events_channel(task_id))
+        (state, info) = await read_task_meta(task_id)
+        info = info if isinstance(info, dict) else {}
+        if state == TaskStatus.SUCCESS:
+            yield _sse("done", {**info, "download_url": download_url(task_id)})
+            return
+        if state == TaskStatus.FAILURE:
+            yield _sse("error", {"task_id": task_id, "status": state})
+            return
+        yield _sse("progress", {**info, "task_id": task_id, "status": state})
 
-    if not task_result:
-        raise HTTPException(status_code=404, detail="Task not found")
+        while not await request.is_disconnected():
+            message = await pubsub.get_message(
+                ignore_subscribe_messages=True, timeout=SSE_KEEPALIVE_SECONDS
+            )
+            if message is None:
+                # comment line keeps proxies from closing an idle stream
+                yield ": keepalive\n\n"
+                continue
+            event = json.loads(message["data"])
+            yield _sse(event["event"], event["data"])
+            if event["event"] in ("done", "error"):
+                return
+    finally:
+        await pubsub.aclose()
 
-    # Check if the task is completed and has a result
-    if task_result.state != "SUCCESS":
-        raise HTTPException(status_code=400, detail="Task is not completed or failed")
 
-    # Get the info mata from the task
-    result = task_result.info
-    logger.info(f"For download API, Task task_result.info: {task_result.info}")
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
 
-    # Check if the result contains a download path
-    if not result or "download_path" not in result:
-        raise HTTPException(status_code=400, detail="No file available for download")
 
-    file_path = result["download_path"]
-    logger.info(f"For download API, file_path: {file_path}")
+async def _task_exists(task_id: str) -> bool:
+    # a task is known once it has a state, or while it waits in its queue
+    (state, _) = await read_task_meta(task_id)
+    if state != TaskStatus.PENDING:
+        return True
+    return bool(await redis_client.redis_client.exists(f"{QUEUED_PREFIX}:{task_id}"))
+
 
+# Server-Sent Events stream of progress, per-question answers and the final download link
+@router.get("/events/{task_id}")
+async def stream_events(request: Request, task_id: str):
+    try:
+        exists = await _task_exists(task_id)
+    except Exception as e:
+        err_msg = f"Task ID: {task_id} query failed with error: {e}"
+        logger.error(err_msg)
+        raise HTTPException(status_code=404, detail=err_msg)
+    if not exists:
+        err_msg = f"Task ID: {task_id} not found in Redis or has expired"
+        logger.error(err_msg)
+        raise HTTPException(status_code=404, detail=err_msg)
+    return StreamingResponse(
+        _task_events(request, task_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in (tag.removeprefix("W/") for tag in tags)
+
+
+def _output_file_response(file_path: str, request: Request = None) -> Response:
+    # the content type follows the output format, batch jobs are a zip bundle
+    extension = os.path.splitext(file_path)[1]
     headers = {
-        "Content-Disposition": "attachment; filename=SeismaResponse.xlsx",
-        "Content-Type": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        "Content-Disposition": f"attachment; filename=SeismaResponse{extension}",
+        "Content-Type": MEDIA_TYPES.get(extension, "application/octet-stream"),
         "Access-Control-Allow-Origin": "*",
     }
+    etag = output_store.etag(file_path)
+    if etag:
+        # stored outputs never change, clients revalidate them with If-None-Match
+        headers.update({"ETag": etag, "Cache-Control": "private, no-cache"})
+        if request is not None and _etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(
+                status_code=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"}
+            )
+    relative_path = os.path.relpath(file_path, get_processed_file_root())
+    if settings.DOWNLOAD_ACCEL_REDIRECT_PREFIX and not relative_path.startswith(".."):
+        # the reverse proxy sends the file itself, with sendfile and range support
+        headers["X-Accel-Redirect"] = (
+            f"{settings.DOWNLOAD_ACCEL_REDIRECT_PREFIX.rstrip('/')}/"
+            f"{relative_path.replace(os.sep, '/')}"
+        )
+        return Response(headers=headers, media_type=headers["Content-Type"])
     try:
+        # Range and If-Range requests are answered with 206 partial content
         return FileResponse(
             path=file_path,
             headers=headers,
@@ -116,3 +393,61 @@ async def download_file(task_id: str):
     except Exception as e:
         logger.error(f"Error downloading file: {e}")
         raise HTTPException(status_code=500, detail="Error downloading file")
+
+
+def _write_partial_file(task_id: str, result: dict) -> str:
+    # answers are only added to the checkpoint of a running job: their count
+    # versions the partial file, written once per version and reused by later polls
+    key = result.get("checkpoint_key")
+    version = TaskCheckpoint(key).count() if key else 0
+    if not version:
+        raise HTTPException(status_code=400, detail="No answers available yet")
+    output_dir = get_processed_file_directory(settings.PROCESSED_FILE_DIR)
+    output_format = result.get("output_format", OutputFormat.XLSX.value)
+    stem = os.path.splitext(os.path.basename(result.get("filename") or "upload.xlsx"))[0]
+    output_path = os.path.join(
+        output_dir, f"partial_{stem}_{task_id}_v{version}.{output_format}"
+    )
+    if os.path.exists(output_path):
+        return output_path
+    # written aside and renamed, so a concurrent poll never reads a partial write
+    temporary_path = os.path.join(output_dir, f".partial_{uuid.uuid4().hex}.{output_format}")
+    write_output(load_checkpoint_rows(key), temporary_path, output_format)
+    os.replace(temporary_path, output_path)
+    for previous in glob.glob(os.path.join(output_dir, f"partial_*_{task_id}_v*")):
+        if previous != output_path:
+            with contextlib.suppress(OSError):
+                os.remove(previous)
+    return output_path
+
+
+# add get endpoint to download the processed file
+@router.get("/download/{task_id}", response_class=FileResponse)
+async def download_file(request: Request, task_id: str, partial: bool = False):
+    # Read the task meta from the result backend
+    (state, result) = await read_task_meta(task_id)
+
+    if state == TaskStatus.PENDING:
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    # While the task is running, optionally return the answers checkpointed so far
+    if partial and state in (TaskStatus.STARTED, TaskStatus.PROCESSING):
+        file_path = await run_in_threadpool(_write_partial_file, task_id, result or {})
+        logger.info(f"For download API, partial file_path: {file_path}")
+        return _output_file_response(file_path)
+
+    # Check if the task is completed and has a result
+    if state != "SUCCESS":
+        raise HTTPException(status_code=400, detail="Task is not completed or failed")
+
+    logger.debug(f"For download API, Task info: {result}")
+
+    # Check if the result contains a download path
+    if not result or "download_path" not in result:
+        raise HTTPException(status_code=400, detail="No file available for download")
+
+    file_path = result["download_path"]
+    logger.info(f"For download API, file_path: {file_path}")
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=410, detail="The processed file has expired")
+    return _output_file_response(file_path, request)
@@ -1,27 +1,186 @@
+import json
 import logging
-from google import genai
-from typing import Union
+import threading
+from typing import Optional, Union
 from app.config.setting import settings
+from app.utils.rate_limiter import (
+    CircuitBreaker,
+    RedisTokenBucket,
+    RetryableBackendError,
+    call_with_resilience,
+    retry_after_seconds,
+)
 
 logger = logging.getLogger("celery")
 
+# shared by all workers through Redis / per worker process
+gemini_limiter = RedisTokenBucket(
+    "gemini", settings.PUBLIC_LLM_RATE_LIMIT, settings.PUBLIC_LLM_RATE_BURST
+)
+gemini_breaker = CircuitBreaker(
+    "Google Gemini",
+    settings.CIRCUIT_BREAKER_THRESHOLD,
+    settings.CIRCUIT_BREAKER_RESET_SECONDS,
+)
+
+# one client per API key, shared by every task running in this worker process
+_clients: dict = {}
+_clients_lock = threading.Lock()
+
+
+def get_gemini_client(api_key: str = settings.GEMINI_API_KEY):
+    """
+    Return the worker-level google.genai Client for the API key, creating it once.
+    The SDK is imported on first use, so workers not using Gemini never load it.
+    """
+    from google import genai
+
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            client = genai.Client(api_key=api_key)
+            _clients[api_key] = client
+        return client
+
+
+def generate_content(client, **kwargs):
+    """
+    Call client.models.generate_content through the Gemini rate limiter, retrying
+    throttling (429) and server (5xx) errors with backoff behind the circuit breaker.
+    """
+    from google.genai import errors as genai_errors
+
+    def generate():
+        try:
+            return client.models.generate_content(**kwargs)
+        except genai_errors.APIError as e:
+            if e.code == 429:
+                headers = getattr(getattr(e, "response", None), "headers", None)
+                raise RetryableBackendError(
+                    str(e), throttled=True, retry_after=retry_after_seconds(headers)
+                ) from e
+            if e.code and e.code >= 500:
+                raise RetryableBackendError(str(e)) from e
+            raise
+
+    return call_with_resilience(generate, gemini_limiter, gemini_breaker)
+
+
+def request_config(timeout: Optional[float] = None, **config) -> Optional[dict]:
+    """The generate_content config, with the request timeout given in seconds."""
+    if timeout:
+        config["http_options"] = {"timeout": int(timeout * 1000)}  # milliseconds
+    return config or None
+
 
 def query_google_gemini(
     query: str,
     model: str = settings.PUBLIC_LLM_MODEL,
     api_key: str = settings.GEMINI_API_KEY,
+    timeout: Optional[float] = None,
+    system_instruction: str = "",
 ) -> Union[str, None]:
     """
-    Query Google Gemini API with the provided query string.
+    Query Google Gemini API with the provided query string, and the shared
+    instructions of every query as system_instruction.
     Returns the response text or None if an error occurs.
     """
-    client = genai.Client(api_key=api_key)
+    config = {"system_instruction": system_instruction} if system_instruction else {}
     try:
-        response = client.models.generate_content(
+        response = generate_content(
+            get_gemini_client(api_key),
             model=model,
             contents=query,
+            config=request_config(timeout, **config),
         )
         return response.text
     except Exception as e:
         logger.error(f"Error querying Google Gemini: {e}")
         return None
+
+
+def pack_batches(queries: list[str], max_chars: int, max_items: int) -> list[list[int]]:
+    """
+    Greedily pack queries, in order, into batches that stay within a character
+    budget and a maximum number of items. A query longer than the budget is
+    placed in a batch of its own.
+
+    Returns:
+        list[list[int]]: The indexes of the queries in each batch.
+    """
+    batches = []
+    current = []
+    current_chars = 0
+    for i, query in enumerate(queries):
+        if current and (
+            current_chars + len(query) > max_chars or len(current) >= max_items
+        ):
+            batches.append(current)
+            current = []
+            current_chars = 0
+        current.append(i)
+        current_chars += len(query)
+    if current:
+        batches.append(current)
+    return batches
+
+
+def build_batch_prompt(queries: list[str], header: str = "") -> str:
+    return (
+        f"{header}"
+        f"Answer each of the following {len(queries)} requirements independently.\n"
+        f"Return only a JSON array of exactly {len(queries)} strings, where element i "
+        "is the complete answer to requirement i.\n"
+        f"Requirements (JSON array):\n{json.dumps(queries, ensure_ascii=False)}"
+    )
+
+
+def parse_batch_answers(text: Optional[str], expected: int) -> list[Optional[str]]:
+    """
+    Parse the JSON array returned for a batch prompt.
+
+    Returns:
+        list[Optional[str]]: One answer per query, None where the answer is missing or invalid.
+    """
+    try:
+        answers = json.loads(text)
+    except (TypeError, ValueError) as e:
+        logger.error(f"Invalid JSON returned for Google Gemini batch: {e}")
+        return [None] * expected
+    if not isinstance(answers, list) or len(answers) != expected:
+        logger.error(
+            f"Google Gemini batch returned {type(answers).__name__} "
+            f"instead of {expected} answers"
+        )
+        return [None] * expected
+    return [
+        answer.strip() if isinstance(answer, str) and answer.strip() else None
+        for answer in answers
+    ]
+
+
+def query_google_gemini_batch(
+    queries: list[str],
+    header: str = "",
+    model: str = settings.PUBLIC_LLM_MODEL,
+    api_key: str = settings.GEMINI_API_KEY,
+    timeout: Optional[float] = None,
+) -> list[Optional[str]]:
+    """
+    Answer many queries with a single Google Gemini call.
+
+    The header is sent once for the whole batch and the model is asked for a JSON
+    array with one answer per query. Returns one answer per query, with None for
+    queries that could not be answered so the caller can retry them on their own.
+    """
+    try:
+        response = generate_content(
+            get_gemini_client(api_key),
+            model=model,
+            contents=build_batch_prompt(queries, header),
+            config=request_config(timeout, response_mime_type="application/json"),
+        )
+    except Exception as e:
+        logger.error(f"Error querying Google Gemini batch of {len(queries)}: {e}")
+        return [None] * len(queries)
+    return parse_batch_answers(response.text, len(queries))
@@ -0,0 +1,320 @@
+# app/services/llm.py
+import importlib
+import logging
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Optional
+from app.config.setting import settings
+from app.services.gemini import (
+    build_batch_prompt,
+    generate_content,
+    get_gemini_client,
+    parse_batch_answers,
+    query_google_gemini,
+    query_google_gemini_batch,
+    request_config,
+)
+from app.utils.metrics import HEDGED_REQUESTS, PROMPT_TOKENS
+from app.utils.prompts import count_tokens
+from app.utils.rate_limiter import (
+    CircuitBreaker,
+    RedisTokenBucket,
+    RetryableBackendError,
+    call_with_resilience,
+    retry_after_seconds,
+)
+
+logger = logging.getLogger("celery")
+
+
+class LLMProvider(ABC):
+    """
+    A public LLM answering the requirements RAGFlow cannot answer. Subclasses
+    implement complete(), and may override answer() and answer_batch(). Failed
+    calls are logged and answered with None, like query_google_gemini.
+    """
+
+    name = "llm"
+    sdk: Optional[str] = None  # module of the client library, imported on first use
+
+    def __init__(self, model: str, timeout: float):
+        self.model = model
+        self.timeout = timeout
+
+    def preload(self):
+        """Import the client library now rather than on the first call."""
+        if self.sdk:
+            importlib.import_module(self.sdk)
+
+    @abstractmethod
+    def complete(
+        self, prompt: str, json_output: bool = False, system: str = ""
+    ) -> Optional[str]:
+        """
+        The raw text answer to a prompt, with the shared instructions of every
+        prompt as the system prompt. Errors are raised.
+        """
+
+    def answer(self, query: str, system: str = "") -> Optional[str]:
+        try:
+            return self.complete(query, system=system)
+        except Exception as e:
+            logger.error(f"Error querying {self.name} model {self.model}: {e}")
+            return None
+
+    def answer_batch(self, queries: list[str], header: str = "") -> list[Optional[str]]:
+        """One answer per query from a single call, None where it is missing."""
+        try:
+            text = self.complete(build_batch_prompt(queries, header), json_output=True)
+        except Exception as e:
+            logger.error(f"Error querying {self.name} batch of {len(queries)}: {e}")
+            return [None] * len(queries)
+        return parse_batch_answers(text, len(queries))
+
+
+class GeminiProvider(LLMProvider):
+    """Google Gemini, through the worker-level clients of app.services.gemini."""
+
+    name = "gemini"
+    sdk = "google.genai"
+
+    def __init__(self, model: str, timeout: float = settings.GEMINI_TIMEOUT):
+        super().__init__(model, timeout)
+
+    def complete(
+        self, prompt: str, json_output: bool = False, system: str = ""
+    ) -> Optional[str]:
+        config = {"response_mime_type": "application/json"} if json_output else {}
+        if system:
+            config["system_instruction"] = system
+        response = generate_content(
+            get_gemini_client(settings.GEMINI_API_KEY),
+            model=self.model,
+            contents=prompt,
+            config=request_config(self.timeout, **config),
+        )
+        return response.text
+
+    def answer(self, query: str, system: str = "") -> Optional[str]:
+        return query_google_gemini(
+            query,
+            model=self.model,
+            api_key=settings.GEMINI_API_KEY,
+            timeout=self.timeout,
+            system_instruction=system,
+        )
+
+    def answer_batch(self, queries: list[str], header: str = "") -> list[Optional[str]]:
+        return query_google_gemini_batch(
+            queries,
+            header=header,
+            model=self.model,
+            api_key=settings.GEMINI_API_KEY,
+            timeout=self.timeout,
+        )
+
+
+class OpenAICompatibleProvider(LLMProvider):
+    """
+    Any server speaking the OpenAI chat completions API: OpenAI itself or a
+    local model server (vLLM, llama.cpp, Ollama...) set as OPENAI_BASE_URL.
+    """
+
+    name = "openai"
+    sdk = "openai"
+
+    def __init__(
+        self,
+        model: str,
+        timeout: float = settings.OPENAI_TIMEOUT,
+        base_url: str = settings.OPENAI_BASE_URL,
+        api_key: str = settings.OPENAI_API_KEY,
+    ):
+        super().__init__(model, timeout)
+        self.base_url = base_url or None
+        # local servers ignore the key, the client still requires one
+        self.api_key = api_key or "unused"
+        self.limiter = RedisTokenBucket(
+            "openai", settings.PUBLIC_LLM_RATE_LIMIT, settings.PUBLIC_LLM_RATE_BURST
+        )
+        self.breaker = CircuitBreaker(
+            "OpenAI-compatible LLM",
+            settings.CIRCUIT_BREAKER_THRESHOLD,
+            settings.CIRCUIT_BREAKER_RESET_SECONDS,
+        )
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                # only imported by the workers configured to use this provider
+                import openai
+
+                # retries go through call_with_resilience, like the other backends
+                self._client = openai.OpenAI(
+                    api_key=self.api_key,
+                    base_url=self.base_url,
+                    timeout=self.timeout,
+                    max_retries=0,
+                )
+            return self._client
+
+    def complete(
+        self, prompt: str, json_output: bool = False, system: str = ""
+    ) -> Optional[str]:
+        import openai
+
+        messages = [{"role": "user", "content": prompt}]
+        if system:
+            messages.insert(0, {"role": "system", "content": system})
+
+        def create():
+            try:
+                return self.client.chat.completions.create(
+                    model=self.model, messages=messages
+                )
+            except openai.RateLimitError as e:
+                raise RetryableBackendError(
+                    str(e), throttled=True, retry_after=retry_after_seconds(e.response.headers)
+                ) from e
+            except openai.InternalServerError as e:
+                raise RetryableBackendError(str(e)) from e
+
+        response = call_with_resilience(create, self.limiter, self.breaker)
+        text = response.choices[0].message.content
+        if json_output and text:
+            # chat models tend to wrap JSON in a markdown code block
+            text = text.strip().removeprefix("```json").strip("`").strip()
+        return text
+
+
+class StubProvider(LLMProvider):
+    """Offline stand-in answering every requirement with STUB_LLM_ANSWER."""
+
+    name = "stub"
+
+    def __init__(self, model: str, timeout: float = 0):
+        super().__init__("stub", timeout)
+
+    def complete(
+        self, prompt: str, json_output: bool = False, system: str = ""
+    ) -> Optional[str]:
+        return settings.STUB_LLM_ANSWER
+
+    def answer_batch(self, queries: list[str], header: str = "") -> list[Optional[str]]:
+        return [settings.STUB_LLM_ANSWER] * len(queries)
+
+
+PROVIDERS = {
+    GeminiProvider.name: GeminiProvider,
+    OpenAICompatibleProvider.name: OpenAICompatibleProvider,
+    StubProvider.name: StubProvider,
+}
+
+# one provider per (name, model), shared by every task running in this worker process
+_providers: dict[tuple[str, str], LLMProvider] = {}
+_providers_lock = threading.Lock()
+_hedge_executor = None
+
+
+def get_provider(name: str, model: str) -> LLMProvider:
+    """Return the worker-level provider of the model, creating it once."""
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown public LLM provider {name!r}, expected one of {list(PROVIDERS)}")
+    with _providers_lock:
+        provider = _providers.get((name, model))
+        if provider is None:
+            provider = PROVIDERS[name](model)
+            _providers[(name, model)] = provider
+        return provider
+
+
+def public_llm() -> LLMProvider:
+    return get_provider(settings.PUBLIC_LLM_PROVIDER, settings.PUBLIC_LLM_MODEL)
+
+
+def hedge_llm() -> Optional[LLMProvider]:
+    """The provider asked as well when the public LLM is slow, None if not set."""
+    if not settings.PUBLIC_LLM_HEDGE_PROVIDER:
+        return None
+    return get_provider(
+        settings.PUBLIC_LLM_HEDGE_PROVIDER,
+        settings.PUBLIC_LLM_HEDGE_MODEL or settings.PUBLIC_LLM_MODEL,
+    )
+
+
+def preload_public_llm():
+    """Import the client libraries of the configured providers."""
+    for provider in (public_llm(), hedge_llm()):
+        if provider is not None:
+            provider.preload()
+
+
+def get_hedge_executor() -> ThreadPoolExecutor:
+    global _hedge_executor
+    with _providers_lock:
+        if _hedge_executor is None:
+            # both providers of every concurrent question, and the slow calls left behind
+            _hedge_executor = ThreadPoolExecutor(
+                max_workers=4 * max(1, settings.PUBLIC_LLM_MAX_CONCURRENCY),
+                thread_name_prefix="llm-hedge",
+            )
+        return _hedge_executor
+
+
+def query_public_llm(query: str, system: str = "") -> tuple[Optional[str], str]:
+    """
+    Answer a query with the public LLM, system being the shared instructions of
+    every query (counted here, the query is counted by build_prompt). With a
+    hedge provider set, the query is sent to it as well once the public LLM has
+    not answered within PUBLIC_LLM_HEDGE_DELAY seconds, or has failed, and the
+    first answer wins. The slower call is left to finish within its provider's
+    timeout.
+
+    Returns:
+        tuple[Optional[str], str]: The answer or None, and the model that gave it.
+    """
+    primary = public_llm()
+    hedge = hedge_llm()
+    PROMPT_TOKENS.labels("public_llm").inc(count_tokens(system))
+    if hedge is None:
+        return (primary.answer(query, system), primary.model)
+    executor = get_hedge_executor()
+    first = executor.submit(primary.answer, query, system)
+    futures = {first: primary}
+    (done, _) = wait([first], timeout=settings.PUBLIC_LLM_HEDGE_DELAY)
+    if done and first.result():
+        return (first.result(), primary.model)
+    logger.info(f"Public LLM {'failed' if done else 'slow'}, asking {hedge.name} {hedge.model}")
+    futures[executor.submit(hedge.answer, query, system)] = hedge
+    PROMPT_TOKENS.labels("public_llm").inc(count_tokens(system) + count_tokens(query))
+    pending = set(futures) - done
+    while pending:
+        (done, pending) = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.result():
+                provider = futures[future]
+                HEDGED_REQUESTS.labels("hedge" if provider is hedge else "primary").inc()
+                return (future.result(), provider.model)
+    HEDGED_REQUESTS.labels("none").inc()
+    return (None, primary.model)
+
+
+def query_public_llm_batch(
+    queries: list[str], header: str = ""
+) -> tuple[list[Optional[str]], str]:
+    """
+    Answer many queries with a single public LLM call. Batches are not hedged,
+    the queries they miss are retried one by one with query_public_llm.
+
+    Returns:
+        tuple[list[Optional[str]], str]: One answer or None per query, and the model.
+    """
+    primary = public_llm()
+    PROMPT_TOKENS.labels("public_llm").inc(
+        count_tokens(header) + sum(count_tokens(query) for query in queries)
+    )
+    return (primary.answer_batch(queries, header), primary.model)
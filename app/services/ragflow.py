@@ -1,11 +1,28 @@
+import json
 import logging
+import queue
 import re
-import pandas as pd
+import threading
+import time
+import requests
+from contextlib import contextmanager
 from io import BytesIO
-from typing import List
+from requests.adapters import HTTPAdapter
+from typing import Iterable, Iterator, List, Optional, Union
+from openpyxl import load_workbook
 from ragflow_sdk.modules.session import Message
 from ragflow_sdk import RAGFlow, Session, Chat
 from app.config.setting import settings
+from app.utils.metrics import SESSION_SETUP_SECONDS
+from app.utils.prompts import build_prompt
+from app.utils.rate_limiter import (
+    BackendRejectedError,
+    CircuitBreaker,
+    RedisTokenBucket,
+    RetryableBackendError,
+    call_with_resilience,
+    retry_after_seconds,
+)
 
 logger = logging.getLogger("celery")
 
@@ -13,22 +30,80 @@ RAGFLOW_API_KEY = settings.RAGFLOW_API_KEY
 RAGFLOW_BASE_URL = settings.RAGFLOW_BASE_URL
 TENDER_KNOWLEDGE_BASE = settings.TENDER_KNOWLEDGE_BASE
 TENDER_QUESTION_HEADER = settings.TENDER_QUESTION_HEADER
+SESSION_NAME = "SeismaTenderSession"
+# citation markers such as ##3$$ that RAGFlow inserts into its answers
+CITATION_PATTERN = re.compile(r"##\d+\$\$")
+# ids of the chat assistants whose system prompt already holds TENDER_QUESTION_HEADER
+prompt_header_chats: set[str] = set()
 
+# shared by all workers through Redis / per worker process
+ragflow_limiter = RedisTokenBucket(
+    "ragflow", settings.RAGFLOW_RATE_LIMIT, settings.RAGFLOW_RATE_BURST
+)
+ragflow_breaker = CircuitBreaker(
+    "RAGFlow", settings.CIRCUIT_BREAKER_THRESHOLD, settings.CIRCUIT_BREAKER_RESET_SECONDS
+)
 
-# parse input file bytes using Pandas DataFrame for column "Requirement" and output list of srings
-def parse_input_file(input_file: bytes) -> tuple[list[str], pd.DataFrame]:
-    # Read the Excel file into a DataFrame
-    df = pd.read_excel(BytesIO(input_file))
+
+# read the non-empty "Requirement" cells of a worksheet with the sheet row number of each of them,
+# or None if the sheet has no "Requirement" column
+def _read_requirement_column(worksheet) -> Optional[tuple[list[str], list[int]]]:
+    header = next(worksheet.iter_rows(max_row=1, values_only=True), ())
+    if "Requirement" not in header:
+        return None
+    column = header.index("Requirement") + 1
+
+    requirements = []
+    row_numbers = []
+    for row_number, (value,) in enumerate(
+        worksheet.iter_rows(min_row=2, min_col=column, max_col=column, values_only=True),
+        start=2,
+    ):
+        if value is not None:
+            requirements.append(str(value))
+            row_numbers.append(row_number)
+    return (requirements, row_numbers)
+
+
+# parse the "Requirement" column of the first sheet of an Excel file, given as bytes or a path,
+# and output the list of strings together with the sheet row number of each of them
+def parse_input_file(input_file: Union[bytes, str]) -> tuple[list[str], list[int]]:
+    # Open the workbook in read-only mode so rows are streamed instead of loaded at once
+    source = BytesIO(input_file) if isinstance(input_file, bytes) else input_file
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        column = _read_requirement_column(workbook.worksheets[0])
+    finally:
+        workbook.close()
 
     # Check if the "Requirement" column exists
-    if "Requirement" not in df.columns:
+    if column is None:
         raise ValueError("The input file must contain a 'Requirement' column.")
-
-    # Extract the "Requirement" column and convert it to a list of strings
-    requirements = df["Requirement"].dropna().astype(str).tolist()
-    if not requirements:
+    if not column[0]:
         raise ValueError("The 'Requirement' column is empty or contains no valid data.")
-    return (requirements, df)
+    return column
+
+
+# parse the "Requirement" column of every sheet of an Excel file that has one, given as bytes or
+# a path, and output (sheet position, sheet name, requirements, row numbers) for each sheet
+# with requirements
+def parse_input_sheets(
+    input_file: Union[bytes, str],
+) -> list[tuple[int, str, list[str], list[int]]]:
+    source = BytesIO(input_file) if isinstance(input_file, bytes) else input_file
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    sheets = []
+    try:
+        for index, worksheet in enumerate(workbook.worksheets):
+            column = _read_requirement_column(worksheet)
+            if column and column[0]:
+                sheets.append((index, worksheet.title, *column))
+    finally:
+        workbook.close()
+
+    if not sheets:
+        raise ValueError("No sheet of the input file has a non-empty 'Requirement' column.")
+    return sheets
 
 
 # obtain the chat assistant object
@@ -51,7 +126,7 @@ def get_chat_assistant_session(
     api_key=RAGFLOW_API_KEY,
     base_url=RAGFLOW_BASE_URL,
     assistant_name=TENDER_KNOWLEDGE_BASE,
-    session_name="SeismaTenderSession",
+    session_name=SESSION_NAME,
 ) -> Session:
     assistant = get_chat_assistant(api_key, base_url, assistant_name)
     logger.info(f"assistant fetched with name = {assistant.name}")
@@ -66,6 +141,259 @@ def get_chat_assistant_session(
     return new_session
 
 
+class PooledRAGFlow(RAGFlow):
+    """
+    RAGFlow client that sends every API call through one keep-alive
+    requests.Session instead of opening a new connection per call.
+    """
+
+    def __init__(self, api_key, base_url, version="v1", pool_size: int = 10):
+        super().__init__(api_key=api_key, base_url=base_url, version=version)
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.http.mount("http://", adapter)
+        self.http.mount("https://", adapter)
+        self.http.headers.update(self.authorization_header)
+
+    def post(self, path, json=None, stream=False, files=None):
+        return self.http.post(
+            url=self.api_url + path, json=json, stream=stream, files=files
+        )
+
+    def get(self, path, params=None, json=None):
+        return self.http.get(url=self.api_url + path, params=params, json=json)
+
+    def delete(self, path, json):
+        return self.http.delete(url=self.api_url + path, json=json)
+
+    def put(self, path, json):
+        return self.http.put(url=self.api_url + path, json=json)
+
+    def close(self):
+        self.http.close()
+
+
+class JobSessions:
+    """
+    The chat sessions of one job. Each session is lent to one thread at a time,
+    so concurrent questions never share a conversation; a thread that finds no
+    idle session opens a new one while the pool has a free slot, or waits for
+    one of the job's sessions otherwise.
+    """
+
+    def __init__(self, pool: "RAGFlowSessionPool", assistant: Chat):
+        self._pool = pool
+        self.assistant = assistant
+        self.opened: list[Session] = []
+        self._idle: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+
+    def open(self) -> Session:
+        # the caller holds a pool slot for the new session
+        session = self.assistant.create_session(name=self._pool.session_name)
+        with self._lock:
+            self.opened.append(session)
+        logger.info(f"Created new session.id: {session.id}")
+        return session
+
+    @contextmanager
+    def lend(self) -> Iterator[Session]:
+        """Lend a session of the job to the calling thread."""
+        try:
+            session = self._idle.get_nowait()
+        except queue.Empty:
+            if self._pool._slots.acquire(blocking=False):
+                try:
+                    with SESSION_SETUP_SECONDS.time():
+                        session = self.open()
+                except Exception:
+                    self._pool._slots.release()
+                    raise
+            else:
+                session = self._idle.get()
+        try:
+            yield session
+        finally:
+            self._idle.put(session)
+
+
+class RAGFlowSessionPool:
+    """
+    Per-worker-process cache of the RAGFlow client and the resolved chat
+    assistant, and a bound on the chat sessions open at once.
+
+    The client and assistant are resolved lazily and refreshed once ttl seconds
+    have passed. Chat sessions keep the conversation history, so every job gets
+    sessions of its own which are deleted on the server when the job ends. Any
+    exception raised while a job holds its sessions invalidates the cache so the
+    next job starts from a fresh client and assistant.
+    """
+
+    def __init__(
+        self,
+        api_key: str = RAGFLOW_API_KEY,
+        base_url: str = RAGFLOW_BASE_URL,
+        assistant_name: str = TENDER_KNOWLEDGE_BASE,
+        session_name: str = SESSION_NAME,
+        max_sessions: int = settings.RAGFLOW_SESSION_POOL_SIZE,
+        ttl: float = settings.RAGFLOW_CLIENT_TTL,
+        http_pool_size: int = settings.RAGFLOW_HTTP_POOL_SIZE,
+    ):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.assistant_name = assistant_name
+        self.session_name = session_name
+        self.ttl = ttl
+        self.http_pool_size = max(http_pool_size, settings.RAGFLOW_MAX_CONCURRENCY)
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max(1, max_sessions))
+        self._client = None
+        self._assistant = None
+        self._expires_at = 0.0
+
+    def get_assistant(self) -> Chat:
+        with self._lock:
+            if self._assistant is None or time.monotonic() >= self._expires_at:
+                self._refresh()
+            return self._assistant
+
+    def _refresh(self):
+        # caller holds self._lock
+        self._reset()
+        self._client = PooledRAGFlow(
+            api_key=self.api_key,
+            base_url=self.base_url,
+            pool_size=self.http_pool_size,
+        )
+        logger.info("RAGFlow pooled client created")
+        assistant_list = self._client.list_chats(name=self.assistant_name)
+        if not assistant_list:
+            raise ValueError("Assistant not found")
+        self._assistant = assistant_list[0]
+        self._expires_at = time.monotonic() + self.ttl
+        logger.info(f"assistant cached with name = {self._assistant.name}")
+        # the header is sent once through the system prompt, not with every question
+        system_prompt = getattr(getattr(self._assistant, "prompt", None), "prompt", None)
+        header = TENDER_QUESTION_HEADER.strip()
+        if header and header in (system_prompt or ""):
+            prompt_header_chats.add(self._assistant.id)
+            logger.info("Question header found in the assistant system prompt")
+        else:
+            prompt_header_chats.discard(self._assistant.id)
+
+    def _reset(self):
+        # caller holds self._lock. Jobs still holding sessions of the old
+        # assistant delete them through it when they end.
+        if self._client is not None:
+            self._client.close()
+        self._client = None
+        self._assistant = None
+
+    def invalidate(self):
+        """Drop the cached client and assistant."""
+        with self._lock:
+            self._reset()
+        logger.info("RAGFlow client and assistant invalidated")
+
+    @staticmethod
+    def _retire(sessions: JobSessions):
+        # delete the sessions on the server so their history is never reused
+        ids = [session.id for session in sessions.opened]
+        if not ids:
+            return
+        try:
+            sessions.assistant.delete_sessions(ids=ids)
+            logger.info(f"Deleted sessions {ids}")
+        except Exception as e:
+            logger.warning(f"Failed to delete sessions {ids}: {e}")
+
+    @contextmanager
+    def job_sessions(self, timeout: float = None) -> Iterator[JobSessions]:
+        """
+        Open the chat sessions of a job: one right away, more while the job's
+        threads need them and the pool has free slots. They are deleted on the
+        server when the job ends.
+
+        Args:
+            timeout (float, optional): Seconds to wait for a free slot. Waits forever if None.
+
+        Raises:
+            TimeoutError: If no session slot is freed within the timeout.
+        """
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError("Timed out waiting for a RAGFlow session")
+        sessions = None
+        try:
+            # the wait for a free slot is not part of the session setup time
+            with SESSION_SETUP_SECONDS.time():
+                sessions = JobSessions(self, self.get_assistant())
+                sessions._idle.put(sessions.open())
+            yield sessions
+        except Exception:
+            self.invalidate()
+            raise
+        finally:
+            if sessions is not None:
+                self._retire(sessions)
+            # one slot per opened session, at least the one taken above
+            for _ in range(max(1, len(sessions.opened) if sessions else 0)):
+                self._slots.release()
+
+    @contextmanager
+    def session(self, timeout: float = None) -> Iterator[Session]:
+        """Borrow a single chat session, deleted on the server when it is returned."""
+        with self.job_sessions(timeout) as sessions, sessions.lend() as borrowed:
+            yield borrowed
+
+
+# worker-level pool shared by all tasks running in this process
+session_pool = RAGFlowSessionPool()
+
+
+def read_streamed_answer(
+    lines: Iterable[Union[bytes, str]],
+    null_answer: str = settings.NULL_RAGFLOW_ANSWER,
+) -> dict:
+    """
+    Assemble a streamed (SSE) RAGFlow completion incrementally.
+
+    Args:
+        lines (Iterable[Union[bytes, str]]): The lines of the streamed response.
+        null_answer (str, optional): Stop reading as soon as the answer contains this
+            text, so the fallback can start without waiting for the full answer.
+
+    Returns:
+        dict: The final answer and reference, in the same shape as a non-streamed response.
+
+    Raises:
+        ValueError: If RAGFlow returns an error instead of the stream.
+    """
+    answer = ""
+    reference = {}
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        if line.startswith("{"):
+            raise ValueError(json.loads(line).get("message", "RAG Flow stream error"))
+        if not line.startswith("data:"):
+            continue
+        data = json.loads(line[5:]).get("data")
+        if not isinstance(data, dict):
+            # "data: true" marks the end of the stream
+            break
+        if data.get("running_status"):
+            continue
+        chunk = data.get("answer") or ""
+        # each event normally carries the whole answer so far, otherwise a delta
+        answer = chunk if chunk.startswith(answer) else answer + chunk
+        if data.get("reference"):
+            reference = data["reference"]
+        if null_answer and null_answer in answer.lower():
+            logger.info("Stream cut off early, RAGFlow has no answer")
+            break
+    return {"code": 0, "data": {"answer": answer, "reference": reference}}
+
+
 # ask a question to the chat assistant session
 def ask_question_to_chat_assistant(
     session: Session, question: str, stream: bool = False
@@ -92,23 +420,60 @@ def ask_question_to_chat_assistant(
     Returns:
         dict: The response from the chat assistant in JSON format.
 
+    With stream=True the server-sent events are parsed as they arrive and reading
+    stops early once the answer matches NULL_RAGFLOW_ANSWER.
+
+    Throttling (429), server errors (5xx) and connection failures are retried
+    with backoff through the RAGFlow rate limiter and circuit breaker.
+
     Raises:
-        ValueError: If the response status is not 200 or if the API call fails.
+        BackendRejectedError: If the response status is another non-200 status.
+        BackendUnavailableError: If RAGFlow keeps failing or its circuit is open.
     """
-    logger.info(f"Asked raw question: {question}")
-    if TENDER_QUESTION_HEADER not in question:
-        question = TENDER_QUESTION_HEADER + question
-        logger.info(f"Amended question: {question}")
+    logger.debug(f"Asked raw question: {question}")
+    # the header is left out when the assistant's system prompt holds it
+    header = "" if session.chat_id in prompt_header_chats else TENDER_QUESTION_HEADER
+    question = build_prompt(question, header, backend="ragflow")
+    logger.debug(f"Amended question: {question}")
     # message = session.ask(question=question, stream=stream)
     json_data = {"question": question, "stream": stream, "session_id": session.id}
-    res = session.post(
-        f"/chats/{session.chat_id}/completions", json_data, stream=stream
+
+    def post_question() -> dict:
+        res = session.post(
+            f"/chats/{session.chat_id}/completions", json_data, stream=stream
+        )
+        logger.debug(f"Response status: {res.status_code}")
+        if res.status_code == 200 and stream:
+            try:
+                return read_streamed_answer(res.iter_lines())
+            finally:
+                # stops the server generating the rest of a cut-off answer
+                res.close()
+        if res.status_code == 200:
+            return res.json()
+        if res.status_code == 429:
+            raise RetryableBackendError(
+                "RAG Flow API returned 429",
+                throttled=True,
+                retry_after=retry_after_seconds(res.headers),
+            )
+        if res.status_code >= 500:
+            raise RetryableBackendError(f"RAG Flow API returned {res.status_code}")
+        raise BackendRejectedError(
+            f"Failed to get response from RAG Flow API: status {res.status_code}"
+        )
+
+    return call_with_resilience(
+        post_question,
+        ragflow_limiter,
+        ragflow_breaker,
+        retry_on=(
+            RetryableBackendError,
+            requests.ConnectionError,
+            requests.Timeout,
+            requests.exceptions.ChunkedEncodingError,
+        ),
     )
-    logger.info(f"Response status: {res.status_code}")
-    if res.status_code == 200:
-        return res.json()
-    else:
-        raise ValueError("Failed to get response from RAG Flow API")
 
 
 def ask_questions_to_chat_assistant(
@@ -126,6 +491,21 @@ def ask_questions_to_chat_assistant(
     return output
 
 
+def strip_citations(text: Optional[str]) -> Optional[str]:
+    """Remove the ##d$$ citation markers, where d is a digit or digits."""
+    # most answers have none, skip the regex for them
+    if not text or "##" not in text:
+        return text
+    return CITATION_PATTERN.sub("", text)
+
+
+def join_references(doc_aggs: Optional[list[dict]]) -> str:
+    """The names of the referenced documents, one per line."""
+    if not doc_aggs:
+        return ""
+    return "\n".join([doc["doc_name"] for doc in doc_aggs])
+
+
 def parse_single_answer(response: List) -> dict:
     """
     Parse a single response from the chat assistant response.
@@ -136,17 +516,12 @@ def parse_single_answer(response: List) -> dict:
     Returns:
         dict: Parsed answer containing answer text, and reference.
     """
-    logger.info(f"RAG query response: {response}")
+    # the full response is large, only format it when debugging
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"RAG query response: {response}")
     try:
-        response_text = response["data"]["answer"]
-        # remove substring such as ##d$$ from the response, where d is a digit or digits
-        if response_text:
-            response_text = re.sub(r"##\d+\$\$", "", response_text)
-        reference = response["data"].get("reference", {}).get("doc_aggs", "")
-        if reference:
-            ref_list = [ref["doc_name"] for ref in reference]
-            # concate strings in ref_list with '\n'
-            reference = "\n".join(ref_list)
+        response_text = strip_citations(response["data"]["answer"])
+        reference = join_references(response["data"].get("reference", {}).get("doc_aggs"))
     except (IndexError, KeyError, TypeError) as e:
         logger.error(f"Error parsing single answer: {response} due to: {e}")
         response_text = ""
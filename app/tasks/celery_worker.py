@@ -2,9 +2,17 @@
 import os
 import logging
 from celery import Celery
-from celery.signals import after_setup_logger, after_setup_task_logger
+from celery.signals import (
+    after_setup_logger,
+    after_setup_task_logger,
+    celeryd_init,
+    worker_init,
+    worker_process_shutdown,
+)
+from kombu import Queue
 from app.config.setting import settings
 from app.config.logging_config import load_logging_config
+from app.utils.metrics import mark_process_dead, start_metrics_server
 
 
 # Load logging configuration from a YAML file
@@ -29,11 +37,93 @@ celery_app = Celery(
     "worker",
     broker=settings.REDIS_URL,
     backend=settings.REDIS_URL,
-    include=["app.tasks.process_task"],  # Include your task module
+    include=["app.tasks.process_task", "app.tasks.maintenance"],  # Include your task modules
 )
 
 # Optional: Configure task settings
-celery_app.conf.update(task_track_started=True, result_extended=True)
+celery_app.conf.update(
+    task_track_started=True,
+    result_extended=True,
+    # small jobs go to the fast lane, large jobs and anything unrouted to the bulk queue
+    task_queues=(Queue(settings.FAST_QUEUE), Queue(settings.BULK_QUEUE)),
+    task_default_queue=settings.BULK_QUEUE,
+    # maintenance tasks are short and expire: they must not wait behind bulk jobs
+    task_routes={
+        "app.tasks.maintenance.sweep_processed_files": {"queue": settings.FAST_QUEUE},
+        "app.tasks.maintenance.wake_parked_jobs": {"queue": settings.FAST_QUEUE},
+    },
+    # reserve one job at a time so queued jobs stay available to idle workers
+    worker_prefetch_multiplier=1,
+    # jobs are acknowledged when they end (acks_late): the broker must not
+    # redeliver a job that is still running on its worker
+    broker_transport_options={"visibility_timeout": settings.BROKER_VISIBILITY_TIMEOUT},
+    # periodic tasks, sent by the celery beat service
+    beat_schedule={
+        "sweep-processed-files": {
+            "task": "app.tasks.maintenance.sweep_processed_files",
+            "schedule": settings.OUTPUT_SWEEP_INTERVAL,
+            # a sweep still queued when the next one is due is dropped
+            "options": {"expires": settings.OUTPUT_SWEEP_INTERVAL},
+        },
+        "wake-parked-jobs": {
+            "task": "app.tasks.maintenance.wake_parked_jobs",
+            "schedule": settings.TENANT_RETRY_SECONDS,
+            "options": {"expires": settings.TENANT_RETRY_SECONDS},
+        },
+    },
+)
+
+# worker pool size for each queue, a worker consuming several queues gets the sum
+QUEUE_CONCURRENCY = {
+    settings.FAST_QUEUE: settings.FAST_QUEUE_CONCURRENCY,
+    settings.BULK_QUEUE: settings.BULK_QUEUE_CONCURRENCY,
+}
+
+
+@celeryd_init.connect
+def set_queue_concurrency(sender=None, conf=None, options=None, **kwargs):
+    # an explicit --concurrency wins over the per-queue limits
+    if options.get("concurrency"):
+        return
+    queues = options.get("queues") or list(QUEUE_CONCURRENCY)
+    if isinstance(queues, str):
+        queues = queues.split(",")
+    conf.worker_concurrency = sum(QUEUE_CONCURRENCY.get(queue, 1) for queue in queues)
+    celery_worker_logger.info(
+        f"Worker {sender} consumes {queues} with concurrency {conf.worker_concurrency}"
+    )
+
+
+@worker_init.connect
+def preload_llm_clients(sender=None, **kwargs):
+    # the LLM client libraries are imported on demand: load the configured ones in
+    # the main worker process, so the forked pool processes share them
+    from app.services.llm import preload_public_llm
+
+    preload_public_llm()
+
+
+@worker_init.connect
+def serve_worker_metrics(sender=None, **kwargs):
+    # started in the main worker process, before the pool processes are forked
+    if not settings.WORKER_METRICS_PORT:
+        return
+    try:
+        start_metrics_server(settings.WORKER_METRICS_PORT)
+    except OSError as e:
+        celery_worker_logger.warning(
+            f"Worker metrics not served on port {settings.WORKER_METRICS_PORT}: {e}"
+        )
+        return
+    celery_worker_logger.info(
+        f"Worker metrics served on port {settings.WORKER_METRICS_PORT}"
+    )
+
+
+@worker_process_shutdown.connect
+def release_process_metrics(pid=None, **kwargs):
+    mark_process_dead(pid or os.getpid())
+
 
 celery_worker_logger = logging.getLogger("celery")
 celery_worker_logger.info(
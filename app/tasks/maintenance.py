@@ -0,0 +1,29 @@
+# app/tasks/maintenance.py
+from celery.utils.log import get_task_logger
+from app.tasks.celery_worker import celery_app
+from app.utils.output_store import output_store
+from app.utils.scheduling import requeue_parked_jobs, tenant_slots
+
+logger = get_task_logger(__name__)
+
+
+# scheduled by celery beat every OUTPUT_SWEEP_INTERVAL seconds
+@celery_app.task(ignore_result=True)
+def sweep_processed_files() -> dict:
+    """Remove the processed files past their retention or beyond the size budget."""
+    return output_store.sweep()
+
+
+# scheduled by celery beat every TENANT_RETRY_SECONDS seconds
+@celery_app.task(ignore_result=True)
+def wake_parked_jobs() -> int:
+    """
+    Requeue the parked jobs of tenants with free slots, such as the slots of lost
+    jobs freed after TENANT_SLOT_TTL, which no ending job hands over.
+    """
+    woken = 0
+    for tenant_id in tenant_slots.waiting_tenants():
+        messages = tenant_slots.wake(tenant_id)
+        requeue_parked_jobs(messages)
+        woken += len(messages)
+    return woken
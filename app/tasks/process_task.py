@@ -1,29 +1,658 @@
 import os
-import pandas as pd
+import threading
+import zipfile
+import redis
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Iterator, Optional
 from datetime import datetime
 from app.tasks.celery_worker import celery_app  # Import the Celery app
+from celery import chord
+from celery.exceptions import Ignore
 from celery.utils.log import get_task_logger
 from app.config.setting import settings
-from app.models.task_schemas import TaskStatus, TaskResult
-from app.utils.file_client import get_processed_file_directory
+from app.models.task_schemas import OutputFormat, TaskStatus, TaskResult
+from app.utils.file_client import (
+    EXCEL_EXTENSIONS,
+    get_processed_file_directory,
+    extract_zip_upload,
+    make_output_filename,
+    remove_spooled_upload,
+    write_output,
+    write_annotated_workbook,
+    write_output_sheets,
+    write_zip_bundle,
+)
+from app.utils.checkpoint import TaskCheckpoint
+from app.utils.output_store import output_store
+from app.utils.metrics import (
+    ANSWERS,
+    JOB_ROWS_PER_SECOND,
+    JOBS,
+    PARSE_SECONDS,
+    WRITE_SECONDS,
+)
+from app.utils.progress import ProgressReporter
+from app.utils.rate_limiter import BackendRejectedError, BackendUnavailableError
+from app.utils.answer_cache import answer_cache
+from app.utils.semantic_index import semantic_index
+from app.utils.scheduling import requeue_parked_jobs, tenant_slots
+from app.utils.normalize import deduplicate_requirements
+from app.utils.prompts import budget_chars, build_prompt, within_budget
 from app.services.ragflow import (
+    JobSessions,
     parse_input_file,
-    get_chat_assistant_session,
+    parse_input_sheets,
+    session_pool,
     ask_question_to_chat_assistant,
     parse_single_answer,
 )
-from app.services.gemini import query_google_gemini
+from app.services.gemini import build_batch_prompt, pack_batches
+from app.services.llm import query_public_llm, query_public_llm_batch
+from ragflow_sdk import Session
 
 
 logger = get_task_logger(__name__)
 # Temporary storage (replace with Redis/DB in production)
 tasks = {}
 stream = settings.RAGFLOW_STREAM.lower() == "true"  # Convert to boolean
+ERROR_REFERENCE = "Error"
 
 
-@celery_app.task(bind=True)
-def process_excel(self, filename: str, contents: bytes):
+def _row(question_raw: str, answer: str, reference: str) -> dict:
+    return {
+        "Requirement": question_raw,
+        "Supplier explanation / comments": answer,
+        "Reference": reference,
+    }
+
+
+def _map_bounded(
+    func: Callable, items: list, max_workers: int
+) -> Iterator[tuple[int, object]]:
+    """
+    Yield (index, func(item)) for every item, running at most max_workers calls
+    at once. Results are yielded in completion order and exceptions are re-raised
+    to the consumer, after which the calls not yet started are dropped.
+    """
+    if max_workers <= 1:
+        for i, item in enumerate(items):
+            yield (i, func(item))
+        return
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ragai")
+    try:
+        futures = {executor.submit(func, item): i for i, item in enumerate(items)}
+        for future in as_completed(futures):
+            yield (futures[future], future.result())
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def answer_from_public_llm(
+    question_raw: str, llm_semaphore: threading.BoundedSemaphore
+) -> dict:
+    """
+    Answer a single requirement from the public LLM (PUBLIC_LLM_PROVIDER).
+
+    Returns:
+        dict: The output row, with an error placeholder if no answer was returned.
+    """
+    # the header goes to the system prompt, shared by every question
+    question = build_prompt(question_raw, backend="public_llm")
+    try:
+        # Query the public LLM, hedged with a second provider if configured
+        with llm_semaphore:
+            (single_answer, model) = query_public_llm(
+                question, system=settings.VENDOR_QUESTION_HEADER
+            )
+        if not single_answer:
+            raise ValueError("No answer returned from public LLM.")
+        ANSWERS.labels("public_llm").inc()
+        return _row(question_raw, single_answer, model)
+    except Exception as e:
+        logger.error(
+            (
+                f"Error querying public LLM {settings.PUBLIC_LLM_MODEL} "
+                f"for question {question_raw}: {str(e)}"
+            )
+        )
+        return _public_llm_error_row(question_raw)
+
+
+def _public_llm_error_row(question_raw: str) -> dict:
+    ANSWERS.labels("error").inc()
+    return _row(
+        question_raw,
+        "Error: Unable to get answer from RAG and public LLM.",
+        ERROR_REFERENCE,
+    )
+
+
+def answer_batch_from_public_llm(
+    questions_raw: list[str], llm_semaphore: threading.BoundedSemaphore
+) -> list[dict]:
+    """
+    Answer a batch of requirements with one public LLM call, retrying every
+    requirement the batch did not answer on its own.
+    """
+    logger.info(f"Querying public LLM with a batch of {len(questions_raw)} questions")
+    try:
+        with llm_semaphore:
+            (batch_answers, model) = query_public_llm_batch(
+                questions_raw, header=settings.VENDOR_QUESTION_HEADER
+            )
+    except Exception as e:
+        # the provider cannot be used at all: every row gets the error answer
+        # of the single requirement path instead of failing the job
+        logger.error(
+            f"Error querying public LLM {settings.PUBLIC_LLM_MODEL} "
+            f"for a batch of {len(questions_raw)} questions: {str(e)}"
+        )
+        return [_public_llm_error_row(question_raw) for question_raw in questions_raw]
+    rows = []
+    for question_raw, single_answer in zip(questions_raw, batch_answers):
+        if single_answer:
+            ANSWERS.labels("public_llm").inc()
+            rows.append(_row(question_raw, single_answer, model))
+        else:
+            logger.info(f"Retrying question missed by the batch: {question_raw}")
+            rows.append(answer_from_public_llm(question_raw, llm_semaphore))
+    return rows
+
+
+def answer_requirement(
+    session: Session,
+    question_raw: str,
+    llm_semaphore: threading.BoundedSemaphore,
+    use_public_llm: bool = True,
+) -> Optional[dict]:
+    """
+    Answer a single requirement from RAGFlow, falling back to the public LLM.
+
+    Args:
+        session (Session): The RAGFlow chat assistant session.
+        question_raw (str): The requirement as read from the input file.
+        llm_semaphore (threading.BoundedSemaphore): Bounds in-flight public LLM calls.
+        use_public_llm (bool, optional): Query the public LLM when RAGFlow has no
+            answer. When False, None is returned instead. Defaults to True.
+
+    Returns:
+        Optional[dict]: The output row with requirement, answer and reference.
+
+    Raises:
+        ValueError: If the RAGFlow response is invalid. A rejected request
+            status gives an error row instead.
+    """
+    logger.info(f"Processing question: {question_raw}")
+    try:
+        single_answer = ask_question_to_chat_assistant(
+            session=session, question=question_raw, stream=stream
+        )
+    except BackendUnavailableError as e:
+        # RAGFlow is down or throttling us, go straight to the fallback
+        logger.warning(f"RAGFlow unavailable for question {question_raw}: {e}")
+        single_answer = None
+    except BackendRejectedError as e:
+        # the request of this requirement was refused, the others may still pass
+        logger.error(f"RAGFlow rejected question {question_raw}: {e}")
+        ANSWERS.labels("error").inc()
+        return _row(question_raw, f"Error: {e}", ERROR_REFERENCE)
+    if single_answer:
+        # Step 4a: Extract the answers and references from the responses from RAGFlow
+        parsed_single_answer = parse_single_answer(single_answer)
+        ragflow_anwer = parsed_single_answer["Supplier explanation / comments"]
+        if (
+            ragflow_anwer
+            and settings.NULL_RAGFLOW_ANSWER not in ragflow_anwer.strip().lower()
+        ):
+            # Found in RAGFlow, no need to query public LLM
+            ANSWERS.labels("ragflow").inc()
+            return _row(question_raw, ragflow_anwer, parsed_single_answer["Reference"])
+
+    if not use_public_llm:
+        return None
+    # Step 4b: If no answer found in RAGFlow, query public LLM (PUBLIC_LLM_PROVIDER)
+    return answer_from_public_llm(question_raw, llm_semaphore)
+
+
+def answer_requirements(
+    sessions: JobSessions,
+    requirements: list[str],
+    on_progress: Callable[[int, int], None],
+    on_answer: Callable[[int, dict], None] = None,
+) -> list[dict]:
+    """
+    Answer all requirements, optionally fanning out to bounded thread pools.
+
+    Concurrency is controlled by RAGFLOW_MAX_CONCURRENCY and
+    PUBLIC_LLM_MAX_CONCURRENCY. With PUBLIC_LLM_BATCH_MODE, requirements that
+    RAGFlow cannot answer are collected and sent to the public LLM in batches
+    packed up to PUBLIC_LLM_BATCH_MAX_CHARS / PUBLIC_LLM_BATCH_MAX_ITEMS.
+    The returned rows keep the input order. on_progress(done, total) and
+    on_answer(index, row), called as soon as each row is final, always run in
+    the calling thread. Every RAGFlow call borrows a session of the job that no
+    other thread uses meanwhile.
+    """
+    total_questions = len(requirements)
+    answers = [None] * total_questions
+    llm_semaphore = threading.BoundedSemaphore(
+        max(1, settings.PUBLIC_LLM_MAX_CONCURRENCY)
+    )
+    batch_mode = settings.PUBLIC_LLM_BATCH_MODE
+    done = 0
+
+    def ask(question_raw: str) -> Optional[dict]:
+        with sessions.lend() as session:
+            return answer_requirement(
+                session, question_raw, llm_semaphore, use_public_llm=not batch_mode
+            )
+
+    logger.info(
+        f"Processing {total_questions} questions with "
+        f"{settings.RAGFLOW_MAX_CONCURRENCY} RAGFlow workers"
+    )
+    for i, answer in _map_bounded(ask, requirements, settings.RAGFLOW_MAX_CONCURRENCY):
+        answers[i] = answer
+        if answer is not None:
+            if on_answer:
+                on_answer(i, answer)
+            done += 1
+            on_progress(done, total_questions)
+
+    missing = [i for i, answer in enumerate(answers) if answer is None]
+    if not missing:
+        return answers
+
+    # the header, the instructions and the JSON quoting of up to max items are
+    # sent with every batch, the questions share the rest of the budget
+    max_chars = settings.PUBLIC_LLM_BATCH_MAX_CHARS
+    overhead = build_batch_prompt(
+        [""] * settings.PUBLIC_LLM_BATCH_MAX_ITEMS, settings.VENDOR_QUESTION_HEADER
+    )
+    if budget_chars(overhead):
+        max_chars = min(max_chars, budget_chars(overhead))
+    batches = pack_batches(
+        [requirements[i] for i in missing],
+        max_chars=max_chars,
+        max_items=settings.PUBLIC_LLM_BATCH_MAX_ITEMS,
+    )
+    logger.info(
+        f"Sending {len(missing)} unanswered questions to the public LLM "
+        f"in {len(batches)} batches"
+    )
+
+    def ask_batch(batch: list[int]) -> list[dict]:
+        return answer_batch_from_public_llm(
+            [requirements[missing[j]] for j in batch], llm_semaphore
+        )
+
+    for b, rows in _map_bounded(
+        ask_batch, batches, settings.PUBLIC_LLM_MAX_CONCURRENCY
+    ):
+        for j, row in zip(batches[b], rows):
+            answers[missing[j]] = row
+            if on_answer:
+                on_answer(missing[j], row)
+        done += len(rows)
+        on_progress(done, total_questions)
+    return answers
+
+
+def _cache_new_answers(new_answers: list[dict]):
+    # Cache the new answers, never the error placeholders
+    items = [
+        (answer["Requirement"], answer)
+        for answer in new_answers
+        if answer["Reference"] != ERROR_REFERENCE
+    ]
+    answer_cache.set_many(items)
+    semantic_index.add_many(items)
+
+
+def _reused_answer(matched_question: str, answer: dict, similarity: float) -> dict:
+    # mark the reused answer in the output, next to its reference
+    reference = answer.get("Reference") or ""
+    return {
+        **answer,
+        "Reference": (
+            f"{reference} (reused from a {similarity:.0%} similar requirement: "
+            f"{matched_question})"
+        ).strip(),
+    }
+
+
+def _write_outputs(
+    task_result: TaskResult, answers: list[dict], layout: list, bundle: bool
+) -> str:
+    """
+    Write the output file of every input file of a job, bundled in a zip for a
+    batch, move them to the output store and return the path to download.
+    """
+    output_dir = get_processed_file_directory(settings.PROCESSED_FILE_DIR)
+    # annotated outputs are always workbooks
+    extension = ".xlsx" if task_result.annotate else f".{task_result.output_format}"
+    outputs = []
+    for i, (filename, source_path, sheets) in enumerate(layout):
+        file_path = os.path.join(
+            output_dir,
+            make_output_filename(
+                f"{i + 1}_{os.path.basename(filename)}" if bundle else filename,
+                task_result.task_id,
+                extension=extension,
+            ),
+        )
+        if task_result.annotate:
+            # the answers go next to the requirements, at their original sheet rows
+            write_annotated_workbook(
+                source_path,
+                {
+                    index: (row_numbers, answers[begin:end])
+                    for index, _, begin, end, row_numbers in sheets
+                },
+                file_path,
+            )
+        elif bundle:
+            write_output_sheets(
+                [(name, answers[begin:end]) for _, name, begin, end, _ in sheets],
+                file_path,
+                task_result.output_format,
+            )
+        else:
+            write_output(answers, file_path, task_result.output_format)
+        outputs.append(file_path)
+    if not bundle:
+        return output_store.put(outputs[0])
+    # one output per input file with one sheet per input sheet, bundled in a zip
+    # names without task id nor time, so identical bundles are stored once
+    names = [
+        f"processed_{i + 1}_{os.path.splitext(os.path.basename(filename))[0]}{extension}"
+        for i, (filename, _, _) in enumerate(layout)
+    ]
+    bundle_path = write_zip_bundle(
+        outputs,
+        os.path.join(
+            output_dir,
+            make_output_filename(
+                task_result.filename, task_result.task_id, extension=".zip"
+            ),
+        ),
+        names,
+    )
+    task_result.outputs = [output_store.put(path) for path in outputs]
+    return output_store.put(bundle_path)
+
+
+def _finish_job(
+    reporter: ProgressReporter,
+    task_result: TaskResult,
+    checkpoint: TaskCheckpoint,
+    requirements: list[str],
+    row_groups: list[list[int]],
+    unique_answers: list[dict],
+    layout: list,
+    bundle: bool = False,
+) -> dict:
+    """
+    Write the output workbook of a job, or the bundle of per-file workbooks of a
+    batch, and mark its TaskResult as successful.
+    """
+    # Copy every unique answer back to all the rows it stands for
+    answers = [None] * len(requirements)
+    for k, rows in enumerate(row_groups):
+        for row in rows:
+            answers[row] = {**unique_answers[k], "Requirement": requirements[row]}
+
+    # Step 5: Save the answers to an Excel file, or the requested output format
+    with WRITE_SECONDS.labels(
+        "annotated" if task_result.annotate else task_result.output_format
+    ).time():
+        output_path = _write_outputs(task_result, answers, layout, bundle)
+
+    # Update final result
+    task_result.status = TaskStatus.SUCCESS
+    task_result.progress = 100.0
+    task_result.download_path = output_path
+    task_result.processed_at = datetime.now()
+    JOBS.labels(TaskStatus.SUCCESS.value).inc()
+    if task_result.started_at:
+        elapsed = (task_result.processed_at - task_result.started_at).total_seconds()
+        JOB_ROWS_PER_SECOND.observe(len(requirements) / max(elapsed, 1e-3))
+    # Update Celery task state to SUCCESS and publish the download link
+    reporter.finish(task_result)
+
+    # Store in temporary storage
+    tasks[task_result.task_id] = task_result
+    # The job is complete, its checkpoint is no longer needed
+    checkpoint.clear()
+
+    return task_result.model_dump()
+
+
+def _fail_job(reporter: ProgressReporter, task_result: TaskResult, e: Exception):
+    # using existing task_result to update the task status
+    logger.error(
+        f"An error occurred during task: {task_result.task_id} processing: {str(e)}"
+    )
+    task_result.status = TaskStatus.FAILURE
+    task_result.progress = 0.0  # Set progress to 0 on failure
+    task_result.error = str(e)
+    task_result.processed_at = datetime.now()
+    JOBS.labels(TaskStatus.FAILURE.value).inc()
+    tasks[task_result.task_id] = task_result
+    reporter.fail(task_result)
+
+
+def _run_job(
+    task,
+    reporter: ProgressReporter,
+    task_result: TaskResult,
+    requirements: list[str],
+    layout: list,
+    bundle: bool = False,
+) -> dict:
+    """
+    Answer the requirements of a job through one deduplicated work queue and
+    write its outputs (Steps 2 to 5 of process_excel and process_batch).
+
+    Args:
+        task: The bound Celery task running the job.
+        reporter (ProgressReporter): Reports the progress of the job.
+        task_result (TaskResult): The TaskResult of the job.
+        requirements (list[str]): All the requirements of the job, in output order.
+        layout (list): The (filename, source path, [(sheet position, sheet name,
+            start, end, sheet row numbers), ...]) of every input file, locating
+            its requirements in requirements and in the source workbook.
+        bundle (bool, optional): Write one output per input file and bundle them
+            in a zip, instead of a single output. Defaults to False.
+
+    Returns:
+        dict: The final TaskResult.
+    """
+    # Step 2: Collapse duplicate requirements so each one is asked only once
+    (questions, row_groups) = deduplicate_requirements(requirements)
+    task_result.deduplicated_calls = len(requirements) - len(questions)
+    logger.info(
+        f"{len(questions)} unique of {len(requirements)} requirements, "
+        f"{task_result.deduplicated_calls} calls saved by deduplication"
+    )
+
+    # Step 3: Resume from the checkpoint of an earlier run of the same job,
+    # then look up the other requirements in the answer cache and the semantic index
+    total_questions = len(questions)
+    checkpoint = TaskCheckpoint.for_questions(task_result.task_id, questions)
+    task_result.checkpoint_key = checkpoint.key
+    resumed = checkpoint.load()
+    task_result.resumed_calls = len(resumed)
+    if resumed:
+        logger.info(f"Resuming {len(resumed)} answered questions from checkpoint")
+    unique_answers = [resumed.get(k) for k in range(total_questions)]
+    lookup = [k for k, a in enumerate(unique_answers) if a is None]
+    for k, cached in zip(lookup, answer_cache.get_many([questions[k] for k in lookup])):
+        unique_answers[k] = cached
+    cached_keys = [k for k in lookup if unique_answers[k] is not None]
+    task_result.cached_rows = sorted(row for k in cached_keys for row in row_groups[k])
+    lookup = [k for k in lookup if unique_answers[k] is None]
+    similar_keys = []
+    for k, match in zip(lookup, semantic_index.search_many([questions[k] for k in lookup])):
+        if match:
+            unique_answers[k] = _reused_answer(*match)
+            similar_keys.append(k)
+    task_result.semantic_rows = sorted(
+        row for k in similar_keys for row in row_groups[k]
+    )
+    # requirements too long for the prompt budget are not sent to any backend
+    over_budget_keys = [
+        k
+        for k in lookup
+        if unique_answers[k] is None
+        and not within_budget(
+            questions[k],
+            (settings.TENDER_QUESTION_HEADER, settings.VENDOR_QUESTION_HEADER),
+            max_tokens=settings.PROMPT_MAX_TOKENS,
+        )
+    ]
+    for k in over_budget_keys:
+        unique_answers[k] = _row(
+            questions[k],
+            f"Error: The requirement exceeds the prompt budget of "
+            f"{settings.PROMPT_MAX_TOKENS} tokens.",
+            ERROR_REFERENCE,
+        )
+    task_result.over_budget_rows = sorted(
+        row for k in over_budget_keys for row in row_groups[k]
+    )
+    if over_budget_keys:
+        logger.warning(
+            f"{len(task_result.over_budget_rows)} requirements exceed the prompt "
+            f"budget of {settings.PROMPT_MAX_TOKENS} tokens and are not asked"
+        )
+    checkpoint.save_many(
+        {k: unique_answers[k] for k in cached_keys + similar_keys + over_budget_keys}
+    )
+    cached_count = sum(1 for a in unique_answers if a is not None)
+    pending = [k for k, a in enumerate(unique_answers) if a is None]
+
+    def report_progress(done: int, total: int):
+        # Update progress, counting the questions resumed or served from the cache
+        task_result.progress = round((cached_count + done) / total_questions * 100, 1)
+        # Update Celery task state
+        reporter.update(task_result)
+
+    def report_answer(j: int, answer: dict):
+        # checkpoint and cache every answer as soon as it is available, so a
+        # re-submitted job (a new task id) skips it even if this one fails
+        checkpoint.save(pending[j], answer)
+        _cache_new_answers([answer])
+        reporter.row(pending[j], row_groups[pending[j]], answer)
+
+    if settings.CHUNK_SIZE and len(pending) > settings.CHUNK_SIZE:
+        # Step 4 (chunked): spread the pending questions over chunk tasks on any
+        # worker, then merge them. The merge task inherits this task id. The
+        # tasks read the job state from the checkpoint, not from their arguments.
+        reporter.update(task_result)
+        chunks = [
+            pending[i:i + settings.CHUNK_SIZE]
+            for i in range(0, len(pending), settings.CHUNK_SIZE)
+        ]
+        logger.info(f"Splitting {len(pending)} questions into {len(chunks)} chunks")
+        checkpoint.save_job(
+            {
+                "task_meta": task_result.model_dump(mode="json"),
+                "requirements": requirements,
+                "row_groups": row_groups,
+                "layout": layout,
+                "bundle": bundle,
+            }
+        )
+        # the chunks stay in the queue the job was routed to
+        queue = (task.request.delivery_info or {}).get("routing_key") or (
+            settings.BULK_QUEUE
+        )
+        workflow = chord(
+            (
+                process_chunk.s(task_result.task_id, checkpoint.key, chunk).set(queue=queue)
+                for chunk in chunks
+            ),
+            # called when a chunk or the merge fails
+            merge_chunks.s(checkpoint.key)
+            .set(queue=queue)
+            .on_error(fail_chunked_job.s(checkpoint.key)),
+        )
+        return task.replace(workflow)
+
+    if pending:
+        # Step 4: Open the chat sessions of the job from the worker-level pool
+        with session_pool.job_sessions() as sessions:
+            # Update progress to indicate that the task has started.
+            task_result.progress = max(
+                1.0, round(cached_count / total_questions * 100, 1)
+            )
+            reporter.update(task_result)
+            logger.debug(f"After set chat session, Task result: {task_result}")
+
+            # Ask the remaining questions to the chat assistant
+            pending_answers = answer_requirements(
+                sessions,
+                [questions[k] for k in pending],
+                report_progress,
+                on_answer=report_answer,
+            )
+        for k, answer in zip(pending, pending_answers):
+            unique_answers[k] = answer
+
+    return _finish_job(
+        reporter,
+        task_result,
+        checkpoint,
+        requirements,
+        row_groups,
+        unique_answers,
+        layout,
+        bundle,
+    )
+
+
+def _take_tenant_slot(task, tenant_id: Optional[str]):
+    # a job over the limit of its tenant is not retried through the broker, where
+    # a worker would hold the delayed message: it is parked and sent again to the
+    # tail of its queue once a job of the tenant frees a slot
+    request = task.request
+    message = {
+        "task": task.name,
+        "args": list(request.args or ()),
+        "kwargs": dict(request.kwargs or {}),
+        "task_id": request.id,
+        "queue": (request.delivery_info or {}).get("routing_key") or settings.BULK_QUEUE,
+    }
+    if not tenant_slots.acquire(tenant_id, request.id, park=message):
+        logger.info(f"Tenant {tenant_id} has no free job slot, parking {request.id}")
+        task.update_state(
+            state=TaskStatus.RETRY,
+            meta=TaskResult(
+                task_id=request.id, status=TaskStatus.RETRY, tenant_id=tenant_id
+            ).model_dump(),
+        )
+        raise Ignore()
+
+
+def _release_tenant_slot(tenant_id: Optional[str], task_id: str):
+    # the freed slot goes to the next parked job of the tenant, if any
+    requeue_parked_jobs(tenant_slots.release(tenant_id, task_id))
+
+
+# acks_late + reject_on_worker_lost: a job whose worker dies is redelivered and
+# resumes from its checkpoint instead of being lost
+@celery_app.task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def process_excel(
+    self,
+    filename: str,
+    contents: bytes = None,
+    upload_path: str = None,
+    output_format: str = OutputFormat.XLSX.value,
+    annotate: bool = False,
+    tenant_id: str = None,
+):
     task_id = self.request.id
+    _take_tenant_slot(self, tenant_id)
     logger.info(
         f"For RagFlow AI, Celery worker: {task_id} statrt processing file: {filename}"
     )
@@ -37,163 +666,281 @@ def process_excel(self, filename: str, contents: bytes):
         processed_at=None,
         download_path=None,
         error=None,
+        started_at=datetime.now(),
+        output_format=output_format,
+        annotate=annotate,
+        tenant_id=tenant_id,
     )
+    reporter = ProgressReporter(self, task_id)
+    replaced = False
     try:
-        # obtain the current directory of the project
-        output_dir = get_processed_file_directory(settings.PROCESSED_FILE_DIR)
         # update celery task state
-        self.update_state(state=TaskStatus.STARTED, meta=task_result.model_dump())
-        logger.info(f"Before processing excel file, Task result: {task_result}")
-
-        # Step 1: extract requirements from the input file
-        (requirements, _) = parse_input_file(contents)
-
-        # Step 2: Create a new session with the chat assistant
-        session = get_chat_assistant_session()
-
-        # Update progress to 1% to indicate that the task has started.
-        task_result.progress = 1.0
-        task_result.status = TaskStatus.PROCESSING
-        self.update_state(state=TaskStatus.PROCESSING, meta=task_result.model_dump())
-        logger.info(f"After set chat session, Task result: {task_result}")
-
-        # Step 3: Ask the question to the chat assistant
-        parsed_responses = {
-            "Requirement": [],
-            "Supplier explanation / comments": [],
-            "Reference": [],
-        }
-        total_questions = len(requirements)
-        for i in range(total_questions):
-            question_raw = requirements[i]
-            logger.info(
-                f"Processing question {i + 1}/{total_questions}: {question_raw}"
-            )
+        reporter.update(task_result, TaskStatus.STARTED)
+        logger.debug(f"Before processing excel file, Task result: {task_result}")
+
+        if annotate and upload_path is None:
+            raise ValueError("Annotating the input file requires a spooled upload.")
 
-            single_answer = ask_question_to_chat_assistant(
-                session=session, question=question_raw, stream=stream
+        # Step 1: extract requirements from the spooled upload (or the raw bytes),
+        # with their sheet row numbers to annotate the input file
+        with PARSE_SECONDS.time():
+            (requirements, row_numbers) = parse_input_file(
+                upload_path if upload_path is not None else contents
             )
-            need_public_llm = True
-            if single_answer:
-                # Step 4a: Extract the answers and references from the responses from RAGFlow
-                parsed_single_answer = parse_single_answer(single_answer)
-                ragflow_anwer = parsed_single_answer["Supplier explanation / comments"]
-                if (
-                    ragflow_anwer
-                    and settings.NULL_RAGFLOW_ANSWER
-                    not in ragflow_anwer.strip().lower()
-                ):
-                    # Append the parsed answers to the parsed_responses dictionaryragflow_anwer
-                    parsed_responses["Requirement"].append(question_raw)
-                    parsed_responses["Supplier explanation / comments"].append(
-                        parsed_single_answer["Supplier explanation / comments"]
-                    )
-                    parsed_responses["Reference"].append(
-                        parsed_single_answer["Reference"]
-                    )
-                    # Found in RAGFlow, no need to query public LLM
-                    need_public_llm = False
-            if need_public_llm:
-                # Step 4b: If no answer found in RAGFlow, query public LLM (default Google Gemini)
-                question = question_raw
-                if settings.VENDOR_QUESTION_HEADER not in question:
-                    question = settings.VENDOR_QUESTION_HEADER + question
-                    logger.info(f"Amended question for public LLM: {question}")
-                try:
-                    # Query public LLM (Google Gemini)
-                    single_answer = query_google_gemini(
-                        query=question, model=settings.PUBLIC_LLM_MODEL
-                    )
-                    if single_answer:
-                        # Append the public LLM answer to the parsed_responses dictionary
-                        parsed_responses["Requirement"].append(question_raw)
-                        parsed_responses["Supplier explanation / comments"].append(
-                            single_answer
-                        )
-                        parsed_responses["Reference"].append(settings.PUBLIC_LLM_MODEL)
-                    else:
-                        raise ValueError("No answer returned from public LLM.")
-                except Exception as e:
-                    logger.error(
-                        (
-                            f"Error querying public LLM {settings.PUBLIC_LLM_MODEL} "
-                            f"for question {question_raw}: {str(e)}"
-                        )
-                    )
-                    parsed_responses["Requirement"].append(question_raw)
-                    parsed_responses["Supplier explanation / comments"].append(
-                        "Error: Unable to get answer from RAG and public LLM."
-                    )
-                    parsed_responses["Reference"].append("Error")
+        layout = [
+            (
+                filename,
+                upload_path,
+                [(0, "SeismaTender", 0, len(requirements), row_numbers)],
+            )
+        ]
+
+        # Steps 2 to 5: answer the requirements and write the output
+        return _run_job(self, reporter, task_result, requirements, layout)
+
+    except Ignore:
+        # raised by self.replace() once the chunked workflow has been scheduled,
+        # the merge task (or fail_chunked_job) releases the tenant slot and the
+        # upload it annotates
+        replaced = True
+        raise
+    except Exception as e:
+        _fail_job(reporter, task_result, e)
+        # no need to update FAILURE state as celery will do it automatically. just raise
+        raise
+    finally:
+        if not replaced:
+            _release_tenant_slot(tenant_id, task_id)
+        if upload_path is not None and not (replaced and annotate):
+            remove_spooled_upload(upload_path)
+
 
-            # Update progress
-            task_result.progress = round((i + 1) / total_questions * 100, 1)
-            task_result.status = TaskStatus.PROCESSING
+@celery_app.task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def process_batch(
+    self,
+    filenames: list[str],
+    upload_paths: list[str],
+    output_format: str = OutputFormat.XLSX.value,
+    annotate: bool = False,
+    tenant_id: str = None,
+):
+    """
+    Answer the requirements of every sheet with a 'Requirement' column of several
+    workbooks, uploaded as files or zip archives, as one job. Requirements shared
+    by several files or sheets are asked only once. The output is a zip bundle
+    of one workbook per input file.
+    """
+    task_id = self.request.id
+    _take_tenant_slot(self, tenant_id)
+    logger.info(
+        f"For RagFlow AI, Celery worker: {task_id} start processing batch: {filenames}"
+    )
 
-            # Update Celery task state
-            self.update_state(
-                state=TaskStatus.PROCESSING, meta=task_result.model_dump()
+    # Initialize TaskResult
+    task_result = TaskResult(
+        task_id=task_id,
+        status=TaskStatus.STARTED,
+        filename=filenames[0] if len(filenames) == 1 else "batch",
+        started_at=datetime.now(),
+        output_format=output_format,
+        annotate=annotate,
+        tenant_id=tenant_id,
+    )
+    reporter = ProgressReporter(self, task_id)
+    extracted_paths = []
+    layout = []
+    replaced = False
+    try:
+        reporter.update(task_result, TaskStatus.STARTED)
+
+        # Step 1: unpack the zip archives and extract the requirements of every sheet
+        workbooks = []
+        for filename, upload_path in zip(filenames, upload_paths):
+            if zipfile.is_zipfile(upload_path) and not filename.lower().endswith(
+                EXCEL_EXTENSIONS
+            ):
+                members = extract_zip_upload(upload_path)
+                extracted_paths.extend(path for _, path in members)
+                workbooks.extend(members)
+            else:
+                workbooks.append((filename, upload_path))
+        if len(workbooks) > settings.BATCH_MAX_FILES:
+            raise ValueError(
+                f"The batch holds more than {settings.BATCH_MAX_FILES} workbooks."
             )
 
-        # Step 5: Add the extracted information to the dataframe
-        # initialize a new empty dataframe without using the original one
-        df = pd.DataFrame()
-        df["Requirement"] = parsed_responses["Requirement"]
-        df["Supplier explanation / comments"] = parsed_responses[
-            "Supplier explanation / comments"
-        ]
-        df["Reference"] = parsed_responses["Reference"]
-        # logger.info(f"Final response>:\n {df}")
-
-        # Step 6: Save the dataframe to an Excel file
-        # convert current time to string in format of HHMMSS
-        current_time = datetime.now().strftime("%H%M%S")
-        # get file name without extension
-        filename_without_extension = os.path.splitext(filename)[0]
-        output_filename = (
-            f"processed_{filename_without_extension}_{task_id}_{current_time}.xlsx"
+        requirements = []
+        for filename, path in workbooks:
+            try:
+                with PARSE_SECONDS.time():
+                    sheets = parse_input_sheets(path)
+            except Exception as e:
+                logger.warning(f"Skipping batch file {filename}: {str(e)}")
+                task_result.skipped_files.append(filename)
+                continue
+            slices = []
+            for index, sheet_name, sheet_requirements, row_numbers in sheets:
+                slices.append(
+                    (
+                        index,
+                        sheet_name,
+                        len(requirements),
+                        len(requirements) + len(sheet_requirements),
+                        row_numbers,
+                    )
+                )
+                requirements.extend(sheet_requirements)
+            layout.append((filename, path, slices))
+        if not requirements:
+            raise ValueError("No file of the batch has a non-empty 'Requirement' column.")
+        logger.info(
+            f"Batch {task_id}: {len(requirements)} requirements "
+            f"from {len(layout)} files, {len(task_result.skipped_files)} skipped"
         )
-        output_path = os.path.join(output_dir, output_filename)
-        # Save the dataframe to an Excel file
-        with pd.ExcelWriter(output_path, engine="xlsxwriter") as writer:
-            df.to_excel(writer, index=False, sheet_name="SeismaTender")
-            workbook = writer.book
-            worksheet = writer.sheets["SeismaTender"]
-            # Define format for wrapped text
-            wrap_format = workbook.add_format({"text_wrap": True, "valign": "top"})
-
-            # Set column widths and apply text wrap
-            worksheet.set_column(
-                "A:A", settings.Q_COLUMN_WIDTH, wrap_format
-            )  # Column 'Requirement'
-            worksheet.set_column(
-                "B:B", settings.A_COLUMN_WIDTH, wrap_format
-            )  # Column 'Answer'
-            worksheet.set_column(
-                "C:C", settings.REF_COLUMN_WIDTH, wrap_format
-            )  # Column 'Reference'
-
-        # Update final result
-        task_result.status = TaskStatus.SUCCESS
-        task_result.progress = 100.0
-        task_result.download_path = output_path
-        task_result.processed_at = datetime.now()
-        # Update Celery task state to SUCCESS
-        self.update_state(state=TaskStatus.SUCCESS, meta=task_result.model_dump())
-
-        # Store in temporary storage
-        tasks[task_id] = task_result
-
-        return task_result.model_dump()
 
+        # Steps 2 to 5: answer all files through one queue and write one output per file
+        return _run_job(
+            self, reporter, task_result, requirements, layout, bundle=True
+        )
+
+    except Ignore:
+        # raised by self.replace() once the chunked workflow has been scheduled,
+        # the merge task (or fail_chunked_job) releases the tenant slot and the
+        # workbooks it annotates
+        replaced = True
+        raise
     except Exception as e:
-        # using existing task_result to update the task status
-
-        logger.error(f"An error occurred during task: {task_id} processing: {str(e)}")
-        task_result.status = TaskStatus.FAILURE
-        task_result.progress = 0.0  # Set progress to 0 on failure
-        task_result.error = str(e)
-        task_result.processed_at = datetime.now()
-        tasks[task_id] = task_result
-        # no need to update FAILURE state as celery will do it automatically. just raise
+        _fail_job(reporter, task_result, e)
         raise
+    finally:
+        if not replaced:
+            _release_tenant_slot(tenant_id, task_id)
+        kept = {path for _, path, _ in layout} if replaced and annotate else set()
+        for path in [*upload_paths, *extracted_paths]:
+            if path not in kept:
+                remove_spooled_upload(path)
+
+
+@celery_app.task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def process_chunk(
+    self,
+    parent_id: str,
+    checkpoint_key: str,
+    indexes: list[int],
+) -> int:
+    """
+    Answer one chunk of the unique questions of a chunked job.
+
+    Args:
+        parent_id (str): The id of the job, whose state receives the aggregated progress.
+        checkpoint_key (str): The checkpoint holding the job state and its answers.
+        indexes (list[int]): The indexes of the unique questions of this chunk.
+
+    Returns:
+        int: The number of questions of this chunk answered by this run.
+    """
+    checkpoint = TaskCheckpoint(checkpoint_key)
+    job = checkpoint.load_job()
+    if job is None:
+        logger.warning(f"Chunk of job {parent_id} skipped, the job is no longer running")
+        return 0
+    task_result = TaskResult(**job["task_meta"])
+    (requirements, row_groups) = (job["requirements"], job["row_groups"])
+    total_questions = len(row_groups)
+    reporter = ProgressReporter(self, parent_id)
+    # a redelivered chunk skips the questions it already answered
+    resumed = checkpoint.load()
+    todo = [k for k in indexes if k not in resumed]
+    logger.info(
+        f"Chunk of job {parent_id}: {len(todo)} questions to ask, "
+        f"{len(indexes) - len(todo)} resumed from checkpoint"
+    )
+    if not todo:
+        return 0
+
+    def report_progress(done: int, total: int):
+        # a failed job keeps its FAILURE state, the checkpoint holds the answers
+        # of every chunk of a running job
+        if not checkpoint.has_job():
+            return
+        task_result.progress = round(checkpoint.count() / total_questions * 100, 1)
+        reporter.update(task_result)
+
+    def report_answer(j: int, answer: dict):
+        checkpoint.save(todo[j], answer)
+        _cache_new_answers([answer])
+        reporter.row(todo[j], row_groups[todo[j]], answer)
+
+    with session_pool.job_sessions() as sessions:
+        chunk_answers = answer_requirements(
+            sessions,
+            [requirements[row_groups[k][0]] for k in todo],
+            report_progress,
+            on_answer=report_answer,
+        )
+    return len(chunk_answers)
+
+
+def _release_job(task_result: TaskResult, layout: list):
+    # free what the job held while its chunks ran
+    _release_tenant_slot(task_result.tenant_id, task_result.task_id)
+    # the uploads of an annotated job are kept until its outputs are written
+    if task_result.annotate:
+        for _, source_path, _ in layout:
+            remove_spooled_upload(source_path)
+
+
+@celery_app.task(bind=True)
+def merge_chunks(self, chunk_counts: list[int], checkpoint_key: str) -> dict:
+    """
+    Assemble the checkpointed answers of all chunks of a job, in input order,
+    into its outputs. A failure is reported by fail_chunked_job.
+    """
+    checkpoint = TaskCheckpoint(checkpoint_key)
+    job = checkpoint.load_job()
+    if job is None:
+        raise RuntimeError(f"The state of the chunked job {self.request.id} has expired")
+    task_result = TaskResult(**job["task_meta"])
+    (requirements, row_groups) = (job["requirements"], job["row_groups"])
+    logger.info(f"Merging {sum(chunk_counts)} answers of job {task_result.task_id}")
+    answers = checkpoint.load()
+    missing = [k for k in range(len(row_groups)) if k not in answers]
+    if missing:
+        raise RuntimeError(f"{len(missing)} answers of the job are missing")
+    result = _finish_job(
+        ProgressReporter(self, task_result.task_id),
+        task_result,
+        checkpoint,
+        requirements,
+        row_groups,
+        [answers[k] for k in range(len(row_groups))],
+        job["layout"],
+        job["bundle"],
+    )
+    # a failed merge is released by fail_chunked_job
+    _release_job(task_result, job["layout"])
+    return result
+
+
+@celery_app.task
+def fail_chunked_job(request, exc, traceback, checkpoint_key: str):
+    """
+    Error callback of a chunked job, run when one of its chunks or its merge
+    fails: mark the job as failed and release what merge_chunks would have.
+    """
+    checkpoint = TaskCheckpoint(checkpoint_key)
+    try:
+        job = checkpoint.load_job()
+    except redis.RedisError as e:
+        logger.error(f"Failed chunked job {request.id} could not be cleaned up: {e}")
+        return
+    if job is None:
+        logger.warning(f"Failed chunked job {request.id} has no state left to clean up")
+        return
+    task_result = TaskResult(**job["task_meta"])
+    try:
+        _fail_job(ProgressReporter(merge_chunks, task_result.task_id), task_result, exc)
+    finally:
+        _release_job(task_result, job["layout"])
+        # the chunks still running stop reporting progress once the state is gone
+        checkpoint.clear()
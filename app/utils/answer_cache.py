@@ -0,0 +1,129 @@
+# app/utils/answer_cache.py
+import hashlib
+import json
+import logging
+import time
+from typing import Optional
+import redis
+from app.config.setting import settings
+from app.utils.metrics import CACHE_LOOKUPS
+from app.utils.normalize import normalize_question
+
+logger = logging.getLogger("celery")
+
+CACHE_PREFIX = "ragai:answer"
+CACHE_INDEX_KEY = f"{CACHE_PREFIX}:index"  # sorted set of entry keys by insert time
+CACHE_STATS_KEY = f"{CACHE_PREFIX}:stats"  # hash of hit/miss counters
+
+
+def answer_settings() -> list[str]:
+    """
+    The settings that shape an answer: assistant, public LLM provider and model,
+    and question headers.
+    """
+    return [
+        settings.TENDER_KNOWLEDGE_BASE,
+        settings.PUBLIC_LLM_PROVIDER,
+        settings.PUBLIC_LLM_MODEL,
+        settings.TENDER_QUESTION_HEADER,
+        settings.VENDOR_QUESTION_HEADER,
+    ]
+
+
+class AnswerCache:
+    """
+    Redis-backed cache of final requirement answers.
+
+    Entries are keyed by the normalized question text together with the settings
+    that shape the answer (assistant name, public LLM provider and model, and
+    question headers), expire after ttl seconds and are evicted oldest-first once
+    the cache holds more than max_entries answers. Redis errors never fail a job:
+    they are logged and treated as cache misses.
+    """
+
+    def __init__(
+        self,
+        redis_url: str = settings.REDIS_URL,
+        ttl: int = settings.ANSWER_CACHE_TTL,
+        max_entries: int = settings.ANSWER_CACHE_MAX_ENTRIES,
+        enabled: bool = settings.ANSWER_CACHE_ENABLED,
+    ):
+        self.redis_url = redis_url
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._redis = None
+
+    @property
+    def redis(self) -> redis.Redis:
+        if self._redis is None:
+            self._redis = redis.Redis.from_url(self.redis_url)
+        return self._redis
+
+    def make_key(self, question: str) -> str:
+        fingerprint = json.dumps([normalize_question(question), *answer_settings()])
+        digest = hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()
+        return f"{CACHE_PREFIX}:{digest}"
+
+    def get_many(self, questions: list[str]) -> list[Optional[dict]]:
+        """
+        Look up cached answers for the questions, in order.
+
+        Returns:
+            list[Optional[dict]]: The cached answer or None for each question.
+        """
+        if not self.enabled or not questions:
+            return [None] * len(questions)
+        try:
+            values = self.redis.mget([self.make_key(q) for q in questions])
+            answers = [json.loads(v) if v else None for v in values]
+            hits = sum(1 for a in answers if a is not None)
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.hincrby(CACHE_STATS_KEY, "hits", hits)
+            pipe.hincrby(CACHE_STATS_KEY, "misses", len(questions) - hits)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Answer cache lookup failed, treating as miss: {e}")
+            return [None] * len(questions)
+        CACHE_LOOKUPS.labels("answer", "hit").inc(hits)
+        CACHE_LOOKUPS.labels("answer", "miss").inc(len(questions) - hits)
+        logger.info(f"Answer cache: {hits} hits, {len(questions) - hits} misses")
+        return answers
+
+    def set_many(self, items: list[tuple[str, dict]]):
+        """
+        Store (question, answer) pairs and evict the oldest entries beyond max_entries.
+        """
+        if not self.enabled or not items:
+            return
+        now = time.time()
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for question, answer in items:
+                key = self.make_key(question)
+                pipe.set(key, json.dumps(answer), ex=self.ttl)
+                pipe.zadd(CACHE_INDEX_KEY, {key: now})
+            # forget index entries whose answers have already expired
+            pipe.zremrangebyscore(CACHE_INDEX_KEY, "-inf", now - self.ttl)
+            pipe.zcard(CACHE_INDEX_KEY)
+            size = pipe.execute()[-1]
+            if size > self.max_entries:
+                evicted = self.redis.zpopmin(CACHE_INDEX_KEY, size - self.max_entries)
+                if evicted:
+                    self.redis.delete(*[key for key, _ in evicted])
+                    logger.info(f"Answer cache evicted {len(evicted)} entries")
+        except redis.RedisError as e:
+            logger.warning(f"Answer cache store failed: {e}")
+
+    def stats(self) -> dict:
+        """Return the cache hit/miss counters and the current number of entries."""
+        counters = self.redis.hgetall(CACHE_STATS_KEY)
+        return {
+            "hits": int(counters.get(b"hits", 0)),
+            "misses": int(counters.get(b"misses", 0)),
+            "entries": self.redis.zcard(CACHE_INDEX_KEY),
+        }
+
+
+# worker-level answer cache instance
+answer_cache = AnswerCache()
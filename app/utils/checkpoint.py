@@ -0,0 +1,128 @@
+# app/utils/checkpoint.py
+import hashlib
+import json
+import logging
+from typing import Optional
+import redis
+from app.config.setting import settings
+from app.utils.answer_cache import answer_settings
+
+logger = logging.getLogger("celery")
+
+CHECKPOINT_PREFIX = "ragai:checkpoint"
+
+
+def make_checkpoint_key(task_id: str, questions: list[str]) -> str:
+    """
+    Derive the checkpoint key from the task id and the job content, so a retried
+    or redelivered job resumes from its own checkpoint and two concurrent jobs
+    of the same requirements never write to the same one.
+    """
+    fingerprint = json.dumps([task_id, questions, *answer_settings()])
+    digest = hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()
+    return f"{CHECKPOINT_PREFIX}:{digest}"
+
+
+class TaskCheckpoint:
+    """
+    Per-question answers of a running job, stored in a Redis hash as they complete.
+
+    Fields are the indexes of the unique questions of the job and values are the
+    JSON encoded output rows. The hash expires ttl seconds after its last write.
+    Write failures are logged and never fail the job.
+
+    A chunked job also stores its state (requirements, layout, TaskResult...)
+    under job_key, read by its chunk and merge tasks instead of passing it
+    through the broker. It expires with the answers.
+    """
+
+    def __init__(
+        self,
+        key: str,
+        redis_url: str = settings.REDIS_URL,
+        ttl: int = settings.CHECKPOINT_TTL,
+    ):
+        self.key = key
+        self.job_key = f"{key}:job"
+        self.redis_url = redis_url
+        self.ttl = ttl
+        self._redis = None
+
+    @classmethod
+    def for_questions(
+        cls, task_id: str, questions: list[str], **kwargs
+    ) -> "TaskCheckpoint":
+        return cls(make_checkpoint_key(task_id, questions), **kwargs)
+
+    @property
+    def redis(self) -> redis.Redis:
+        if self._redis is None:
+            self._redis = redis.Redis.from_url(self.redis_url)
+        return self._redis
+
+    def load(self) -> dict[int, dict]:
+        """Return the checkpointed answers by question index."""
+        try:
+            values = self.redis.hgetall(self.key)
+        except redis.RedisError as e:
+            logger.warning(f"Checkpoint {self.key} could not be loaded: {e}")
+            return {}
+        return {int(index): json.loads(value) for index, value in values.items()}
+
+    def save_many(self, answers: dict[int, dict]):
+        if not answers:
+            return
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.hset(
+                self.key,
+                mapping={
+                    index: json.dumps(answer) for index, answer in answers.items()
+                },
+            )
+            pipe.expire(self.key, self.ttl)
+            pipe.expire(self.job_key, self.ttl)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Checkpoint {self.key} could not be saved: {e}")
+
+    def save(self, index: int, answer: dict):
+        self.save_many({index: answer})
+
+    def count(self) -> int:
+        """Return the number of checkpointed answers."""
+        try:
+            return self.redis.hlen(self.key)
+        except redis.RedisError as e:
+            logger.warning(f"Checkpoint {self.key} could not be counted: {e}")
+            return 0
+
+    def save_job(self, job: dict):
+        """Store the state of a chunked job. Raises redis.RedisError on failure."""
+        self.redis.set(self.job_key, json.dumps(job), ex=self.ttl)
+
+    def load_job(self) -> Optional[dict]:
+        """Return the state of a chunked job, None once it ended or expired."""
+        value = self.redis.get(self.job_key)
+        return json.loads(value) if value is not None else None
+
+    def has_job(self) -> bool:
+        try:
+            return bool(self.redis.exists(self.job_key))
+        except redis.RedisError as e:
+            logger.warning(f"Checkpoint {self.job_key} could not be read: {e}")
+            return True
+
+    def clear(self):
+        try:
+            self.redis.delete(self.key, self.job_key)
+        except redis.RedisError as e:
+            logger.warning(f"Checkpoint {self.key} could not be cleared: {e}")
+
+
+def load_checkpoint_rows(key: Optional[str]) -> list[dict]:
+    """Return the checkpointed output rows of a job in input order."""
+    if not key:
+        return []
+    answers = TaskCheckpoint(key).load()
+    return [answers[index] for index in sorted(answers)]
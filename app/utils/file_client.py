@@ -1,16 +1,45 @@
 import os
+import csv
+import json
+import uuid
+import shutil
+import zipfile
 import logging
-from datetime import datetime
+from datetime import date, datetime, time, timedelta
+from itertools import islice
+from typing import Iterable, Iterator, Optional
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import UploadFile
 from app.config.setting import settings
 
 logger = logging.getLogger(__name__)
 
+EXCEL_EXTENSIONS = (".xlsx", ".xlsm")
+ANSWER_COLUMNS = ["Requirement", "Supplier explanation / comments", "Reference"]
+PARQUET_ROW_GROUP_SIZE = 10000
+# content type of each output file extension, batch outputs are bundled in a zip
+MEDIA_TYPES = {
+    ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ".csv": "text/csv; charset=utf-8",
+    ".jsonl": "application/x-ndjson",
+    ".parquet": "application/vnd.apache.parquet",
+    ".zip": "application/zip",
+}
+# fixed creation date and zip entry timestamps make outputs byte-identical for
+# identical answers, so the output store keeps them once
+OUTPUT_TIMESTAMP = datetime(1980, 1, 1)
 
-# obtain the processed file directory if it does not exist
-def get_processed_file_directory(dir_name: str = settings.PROCESSED_FILE_DIR) -> str:
+
+# obtain the root of the processed files, relative paths are relative to the project directory
+def get_processed_file_root(dir_name: str = settings.PROCESSED_FILE_DIR) -> str:
     current_dir = os.path.dirname(os.path.abspath(__file__))
     app_dir = os.path.abspath(os.path.join(current_dir, "../.."))
-    processed_file_dir = os.path.join(app_dir, dir_name)
+    return os.path.join(app_dir, dir_name)
+
+
+# obtain the processed file directory if it does not exist
+def get_processed_file_directory(dir_name: str = settings.PROCESSED_FILE_DIR) -> str:
+    processed_file_dir = get_processed_file_root(dir_name)
     # Create a directory for the current date if it doesn't exist
     current_date = datetime.now().strftime("%Y%m%d")
     output_dir = os.path.join(processed_file_dir, current_date)
@@ -20,3 +49,336 @@ def get_processed_file_directory(dir_name: str = settings.PROCESSED_FILE_DIR) ->
         logger.error(f"Failed to create directory {output_dir}: {e}")
         raise OSError(f"Failed to create directory: {e}")
     return output_dir
+
+
+# obtain the shared spool directory for uploaded files, creating it if it does not exist
+def get_upload_spool_directory(dir_name: str = settings.UPLOAD_SPOOL_DIR) -> str:
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    app_dir = os.path.abspath(os.path.join(current_dir, "../.."))
+    spool_dir = os.path.join(app_dir, dir_name)
+    try:
+        os.makedirs(spool_dir, exist_ok=True)
+    except OSError as e:
+        logger.error(f"Failed to create directory {spool_dir}: {e}")
+        raise OSError(f"Failed to create directory: {e}")
+    return spool_dir
+
+
+async def spool_upload(
+    file: UploadFile, chunk_size: int = settings.UPLOAD_CHUNK_SIZE, digest=None
+) -> str:
+    """
+    Stream an uploaded file to the shared spool directory in chunks, so that only
+    its path has to travel through the Celery broker. The chunks are also fed to
+    the optional hashlib digest.
+
+    Returns:
+        str: The path of the spooled file.
+    """
+    extension = os.path.splitext(file.filename or "")[1]
+    spool_path = os.path.join(
+        get_upload_spool_directory(), f"{uuid.uuid4().hex}{extension}"
+    )
+    with open(spool_path, "wb") as out:
+        while chunk := await file.read(chunk_size):
+            await run_in_threadpool(out.write, chunk)
+            if digest is not None:
+                digest.update(chunk)
+    logger.info(f"Spooled upload {file.filename} to {spool_path}")
+    return spool_path
+
+
+def remove_spooled_upload(spool_path: str):
+    try:
+        os.remove(spool_path)
+    except OSError as e:
+        logger.warning(f"Failed to remove spooled upload {spool_path}: {e}")
+
+
+def extract_zip_upload(
+    zip_path: str,
+    max_files: int = settings.BATCH_MAX_FILES,
+    max_bytes: int = settings.BATCH_MAX_UNCOMPRESSED_BYTES,
+) -> list[tuple[str, str]]:
+    """
+    Extract the Excel workbooks of an uploaded zip archive to the spool directory.
+    Member paths are never used on disk, the workbooks get fresh spool names.
+
+    Returns:
+        list[tuple[str, str]]: The (member name, spooled path) of every workbook.
+
+    Raises:
+        ValueError: If the archive holds more than max_files workbooks, or its
+            members more than max_bytes once uncompressed (0 = no limit).
+    """
+    spool_dir = get_upload_spool_directory()
+    extracted = []
+    with zipfile.ZipFile(zip_path) as archive:
+        # checked before anything is extracted, reads stop at the declared sizes
+        total_size = sum(member.file_size for member in archive.infolist())
+        if max_bytes and total_size > max_bytes:
+            raise ValueError(
+                f"The archive holds {total_size} bytes uncompressed, "
+                f"more than the limit of {max_bytes} bytes."
+            )
+        members = [
+            member
+            for member in archive.infolist()
+            if not member.is_dir()
+            and os.path.splitext(member.filename)[1].lower() in EXCEL_EXTENSIONS
+            and not os.path.basename(member.filename).startswith((".", "~$"))
+            and not member.filename.startswith("__MACOSX/")
+        ]
+        if len(members) > max_files:
+            raise ValueError(f"The archive holds more than {max_files} workbooks.")
+        for member in members:
+            extension = os.path.splitext(member.filename)[1]
+            spool_path = os.path.join(spool_dir, f"{uuid.uuid4().hex}{extension}")
+            with archive.open(member) as source, open(spool_path, "wb") as out:
+                shutil.copyfileobj(source, out, settings.UPLOAD_CHUNK_SIZE)
+            extracted.append((member.filename, spool_path))
+    logger.info(f"Extracted {len(extracted)} workbooks from {zip_path}")
+    return extracted
+
+
+# estimate the number of rows of the first sheet of an Excel file from its recorded
+# dimensions, without reading the rows. None if the file does not record them
+def estimate_rows(path: str) -> Optional[int]:
+    # openpyxl and xlsxwriter are imported on first use, they slow down the API startup
+    from openpyxl import load_workbook
+
+    try:
+        workbook = load_workbook(path, read_only=True)
+        try:
+            return workbook.worksheets[0].max_row
+        finally:
+            workbook.close()
+    except Exception as e:
+        logger.warning(f"Could not estimate the rows of {path}: {e}")
+        return None
+
+
+# build the name of the processed output file for an uploaded file
+def make_output_filename(
+    filename: str, task_id: str, prefix: str = "processed", extension: str = ".xlsx"
+) -> str:
+    # convert current time to string in format of HHMMSS
+    current_time = datetime.now().strftime("%H%M%S")
+    # get file name without directories and extension
+    filename_without_extension = os.path.splitext(os.path.basename(filename))[0]
+    return f"{prefix}_{filename_without_extension}_{task_id}_{current_time}{extension}"
+
+
+def _answer_rows(
+    sheets: list[tuple[str, list[dict]]], with_sheet: bool
+) -> Iterator[list]:
+    for sheet_name, answers in sheets:
+        for answer in answers:
+            values = [answer.get(column) for column in ANSWER_COLUMNS]
+            yield [sheet_name, *values] if with_sheet else values
+
+
+def _new_workbook(output_path: str):
+    import xlsxwriter
+
+    # constant_memory flushes each row to disk once the next one is started,
+    # so memory stays flat whatever the number of rows
+    workbook = xlsxwriter.Workbook(output_path, {"constant_memory": True})
+    workbook.set_properties({"created": OUTPUT_TIMESTAMP})
+    return workbook
+
+
+# save the answer rows (Requirement, answer and Reference) of each sheet to an Excel file
+def write_excel_sheets(sheets: list[tuple[str, list[dict]]], output_path: str) -> str:
+    with _new_workbook(output_path) as workbook:
+        header_format = workbook.add_format(
+            {"bold": True, "border": 1, "align": "center", "valign": "top"}
+        )
+        # Define format for wrapped text
+        wrap_format = workbook.add_format({"text_wrap": True, "valign": "top"})
+        for sheet_name, answers in sheets:
+            worksheet = workbook.add_worksheet(sheet_name)
+
+            # Set column widths and apply text wrap
+            worksheet.set_column(
+                "A:A", settings.Q_COLUMN_WIDTH, wrap_format
+            )  # Column 'Requirement'
+            worksheet.set_column(
+                "B:B", settings.A_COLUMN_WIDTH, wrap_format
+            )  # Column 'Answer'
+            worksheet.set_column(
+                "C:C", settings.REF_COLUMN_WIDTH, wrap_format
+            )  # Column 'Reference'
+
+            worksheet.write_row(0, 0, ANSWER_COLUMNS, header_format)
+            for row, values in enumerate(_answer_rows([(sheet_name, answers)], False), 1):
+                for col, value in enumerate(values):
+                    # write_string keeps answers starting with "=" from becoming formulas
+                    if isinstance(value, str):
+                        worksheet.write_string(row, col, value, wrap_format)
+                    elif value is not None:
+                        worksheet.write(row, col, value, wrap_format)
+    return output_path
+
+
+# save the answer rows (Requirement, answer and Reference) to an Excel file
+def write_excel_output(answers: list[dict], output_path: str) -> str:
+    return write_excel_sheets([("SeismaTender", answers)], output_path)
+
+
+def _write_source_cell(worksheet, row: int, col: int, value, date_format):
+    if isinstance(value, str):
+        # formulas are read as "=..." strings since the source is not read data_only
+        if value.startswith("="):
+            worksheet.write_formula(row, col, value)
+        else:
+            worksheet.write_string(row, col, value)
+    elif isinstance(value, (date, time, timedelta)):
+        worksheet.write_datetime(row, col, value, date_format)
+    else:
+        worksheet.write(row, col, value)
+
+
+def write_annotated_workbook(
+    source_path: str,
+    annotations: dict[int, tuple[list[int], list[dict]]],
+    output_path: str,
+) -> str:
+    """
+    Copy every sheet of the source workbook in one streaming pass, adding the answer
+    and reference columns to the annotated sheets, right after their last column.
+    Cell values and formulas are kept, cell styles are not.
+
+    Args:
+        source_path (str): The uploaded workbook.
+        annotations (dict[int, tuple[list[int], list[dict]]]): The sheet row numbers
+            and answer rows of each annotated sheet, by sheet position.
+        output_path (str): The annotated workbook to write.
+
+    Returns:
+        str: The output path.
+    """
+    from openpyxl import load_workbook
+
+    source = load_workbook(source_path, read_only=True)
+    try:
+        with _new_workbook(output_path) as workbook:
+            header_format = workbook.add_format(
+                {"bold": True, "border": 1, "align": "center", "valign": "top"}
+            )
+            wrap_format = workbook.add_format({"text_wrap": True, "valign": "top"})
+            date_format = workbook.add_format({"num_format": "yyyy-mm-dd hh:mm:ss"})
+            for index, source_sheet in enumerate(source.worksheets):
+                worksheet = workbook.add_worksheet(source_sheet.title)
+                (row_numbers, answers) = annotations.get(index, ([], []))
+                answers_by_row = dict(zip(row_numbers, answers))
+                first_column = None
+                for row_number, values in enumerate(
+                    source_sheet.iter_rows(values_only=True), start=1
+                ):
+                    if first_column is None:
+                        first_column = max(len(values), source_sheet.max_column or 0)
+                        if answers_by_row:
+                            worksheet.set_column(
+                                first_column, first_column, settings.A_COLUMN_WIDTH
+                            )
+                            worksheet.set_column(
+                                first_column + 1,
+                                first_column + 1,
+                                settings.REF_COLUMN_WIDTH,
+                            )
+                    for col, value in enumerate(values):
+                        if value is not None:
+                            _write_source_cell(worksheet, row_number - 1, col, value, date_format)
+                    if row_number == 1 and answers_by_row:
+                        worksheet.write_row(0, first_column, ANSWER_COLUMNS[1:], header_format)
+                    elif row_number in answers_by_row:
+                        answer = answers_by_row[row_number]
+                        for col, column in enumerate(ANSWER_COLUMNS[1:], first_column):
+                            if answer.get(column) is not None:
+                                worksheet.write_string(
+                                    row_number - 1, col, str(answer[column]), wrap_format
+                                )
+    finally:
+        source.close()
+    return output_path
+
+
+def _write_csv(columns: list[str], rows: Iterable[list], output_path: str):
+    with open(output_path, "w", newline="", encoding="utf-8") as out:
+        writer = csv.writer(out)
+        writer.writerow(columns)
+        writer.writerows(rows)
+
+
+def _write_jsonl(columns: list[str], rows: Iterable[list], output_path: str):
+    with open(output_path, "w", encoding="utf-8") as out:
+        for values in rows:
+            out.write(json.dumps(dict(zip(columns, values)), ensure_ascii=False) + "\n")
+
+
+def _write_parquet(columns: list[str], rows: Iterable[list], output_path: str):
+    # pyarrow is imported on first use, only this output format needs it
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("Parquet output requires the pyarrow package.") from e
+    schema = pa.schema([(column, pa.string()) for column in columns])
+    rows = iter(rows)
+    with pq.ParquetWriter(output_path, schema) as writer:
+        # write row groups of bounded size instead of building one table
+        while batch := list(islice(rows, PARQUET_ROW_GROUP_SIZE)):
+            writer.write_table(
+                pa.table(
+                    {
+                        column: [values[i] for values in batch]
+                        for i, column in enumerate(columns)
+                    },
+                    schema=schema,
+                )
+            )
+
+
+TABLE_WRITERS = {"csv": _write_csv, "jsonl": _write_jsonl, "parquet": _write_parquet}
+
+
+# save the answer rows of each sheet in the given format. The formats without sheets
+# get the sheet name in an extra first "Sheet" column
+def write_output_sheets(
+    sheets: list[tuple[str, list[dict]]], output_path: str, output_format: str = "xlsx"
+) -> str:
+    if output_format == "xlsx":
+        return write_excel_sheets(sheets, output_path)
+    if output_format not in TABLE_WRITERS:
+        raise ValueError(f"Unsupported output format: {output_format}")
+    TABLE_WRITERS[output_format](
+        ["Sheet", *ANSWER_COLUMNS], _answer_rows(sheets, True), output_path
+    )
+    return output_path
+
+
+# save the answer rows (Requirement, answer and Reference) in the given format
+def write_output(answers: list[dict], output_path: str, output_format: str = "xlsx") -> str:
+    if output_format == "xlsx":
+        return write_excel_output(answers, output_path)
+    if output_format not in TABLE_WRITERS:
+        raise ValueError(f"Unsupported output format: {output_format}")
+    TABLE_WRITERS[output_format](
+        ANSWER_COLUMNS, _answer_rows([("SeismaTender", answers)], False), output_path
+    )
+    return output_path
+
+
+# bundle output files into one zip archive, stored under the given names or their base names
+def write_zip_bundle(
+    paths: list[str], output_path: str, names: Optional[list[str]] = None
+) -> str:
+    names = names or [os.path.basename(path) for path in paths]
+    with zipfile.ZipFile(output_path, "w", zipfile.ZIP_DEFLATED) as bundle:
+        for path, name in zip(paths, names):
+            entry = zipfile.ZipInfo(name, OUTPUT_TIMESTAMP.timetuple()[:6])
+            entry.compress_type = zipfile.ZIP_DEFLATED
+            with open(path, "rb") as source, bundle.open(entry, "w") as target:
+                shutil.copyfileobj(source, target, settings.UPLOAD_CHUNK_SIZE)
+    return output_path
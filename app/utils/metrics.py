@@ -0,0 +1,122 @@
+# app/utils/metrics.py
+import glob
+import os
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+
+# Prefork Celery workers answer in child processes: with PROMETHEUS_MULTIPROC_DIR
+# set (before the process starts) every process writes its samples to that
+# directory and the exposed registry aggregates them.
+MULTIPROC_DIR_ENV = "PROMETHEUS_MULTIPROC_DIR"
+if os.environ.get(MULTIPROC_DIR_ENV):
+    # the samples of the metrics below are written there as soon as they are defined
+    os.makedirs(os.environ[MULTIPROC_DIR_ENV], exist_ok=True)
+
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+RATE_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 50, 100, 500)
+
+PARSE_SECONDS = Histogram(
+    "ragai_parse_seconds",
+    "Time to read the requirements of an uploaded workbook",
+    buckets=STAGE_BUCKETS,
+)
+SESSION_SETUP_SECONDS = Histogram(
+    "ragai_session_setup_seconds",
+    "Time to get a pooled RAGFlow chat session, creating the client or session if needed",
+    buckets=LATENCY_BUCKETS,
+)
+BACKEND_REQUEST_SECONDS = Histogram(
+    "ragai_backend_request_seconds",
+    "Latency of every call attempt to a backend (ragflow, gemini)",
+    ["backend"],
+    buckets=LATENCY_BUCKETS,
+)
+BACKEND_ERRORS = Counter(
+    "ragai_backend_errors",
+    "Failed backend calls: retryable attempts, rejected calls and calls given up",
+    ["backend", "kind"],
+)
+WRITE_SECONDS = Histogram(
+    "ragai_write_seconds",
+    "Time to write the outputs of a job",
+    ["format"],
+    buckets=STAGE_BUCKETS,
+)
+JOB_ROWS_PER_SECOND = Histogram(
+    "ragai_job_rows_per_second",
+    "Requirements processed per second by a finished job, start to output",
+    buckets=RATE_BUCKETS,
+)
+# fallback rate: rate(ragai_answers_total{source="public_llm"}) / rate(ragai_answers_total)
+ANSWERS = Counter(
+    "ragai_answers",
+    "Requirements answered by the backends, by source (ragflow, public_llm, error)",
+    ["source"],
+)
+PROMPT_TOKENS = Counter(
+    "ragai_prompt_tokens",
+    "Estimated tokens of the prompts sent to the backends (ragflow, public_llm)",
+    ["backend"],
+)
+CACHE_LOOKUPS = Counter(
+    "ragai_cache_lookups",
+    "Requirements looked up in the answer cache and the semantic index",
+    ["cache", "result"],
+)
+HEDGED_REQUESTS = Counter(
+    "ragai_hedged_requests",
+    "Public LLM questions also sent to the hedge provider, by the one answering first",
+    ["winner"],
+)
+JOBS = Counter("ragai_jobs", "Finished jobs by final status", ["status"])
+UPLOADS = Counter("ragai_uploads", "Jobs queued by the API", ["queue"])
+REUSED_UPLOADS = Counter(
+    "ragai_reused_uploads",
+    "Uploads answered with the job of an identical upload, by its state",
+    ["status"],
+)
+
+
+def multiprocess_mode() -> bool:
+    return bool(os.environ.get(MULTIPROC_DIR_ENV))
+
+
+def metrics_registry() -> CollectorRegistry:
+    """The registry to expose: all processes in multiprocess mode, else this process."""
+    if not multiprocess_mode():
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """Render the metrics in the Prometheus text format, with its content type."""
+    return (generate_latest(metrics_registry()), CONTENT_TYPE_LATEST)
+
+
+def start_metrics_server(port: int):
+    """
+    Serve the metrics over HTTP from a background thread of this process. In
+    multiprocess mode the samples left by the processes of an earlier run are
+    removed first.
+    """
+    if multiprocess_mode():
+        for path in glob.glob(os.path.join(os.environ[MULTIPROC_DIR_ENV], "*.db")):
+            os.remove(path)
+    start_http_server(port, registry=metrics_registry())
+
+
+def mark_process_dead(pid: int):
+    # drop the live gauges of an exited pool process, its counters are kept
+    if multiprocess_mode():
+        multiprocess.mark_process_dead(pid)
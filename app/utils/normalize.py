@@ -0,0 +1,58 @@
+import re
+from app.config.setting import settings
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def _collapse(text: str) -> str:
+    return WHITESPACE_PATTERN.sub(" ", str(text)).strip().lower()
+
+
+# question headers that may already be present in the uploaded requirement text
+QUESTION_HEADERS = tuple(
+    header
+    for header in (
+        _collapse(settings.TENDER_QUESTION_HEADER),
+        _collapse(settings.VENDOR_QUESTION_HEADER),
+    )
+    if header
+)
+
+
+def normalize_question(question: str) -> str:
+    """
+    Normalize requirement text so that trivially different copies of the same
+    requirement compare equal: surrounding/repeated whitespace, case and a
+    leading TENDER_QUESTION_HEADER/VENDOR_QUESTION_HEADER are ignored.
+    """
+    text = _collapse(question)
+    for header in QUESTION_HEADERS:
+        if text.startswith(header):
+            text = text[len(header):].strip()
+    return text
+
+
+def deduplicate_requirements(
+    requirements: list[str],
+) -> tuple[list[str], list[list[int]]]:
+    """
+    Collapse requirements that are equal after normalization.
+
+    Args:
+        requirements (list[str]): The requirements in input order.
+
+    Returns:
+        tuple[list[str], list[list[int]]]: The first occurrence of every unique
+        requirement, and for each of them the indexes of all rows it stands for.
+    """
+    positions = {}
+    unique_questions = []
+    row_groups = []
+    for i, question in enumerate(requirements):
+        key = normalize_question(question)
+        if key not in positions:
+            positions[key] = len(unique_questions)
+            unique_questions.append(question)
+            row_groups.append([])
+        row_groups[positions[key]].append(i)
+    return (unique_questions, row_groups)
@@ -0,0 +1,141 @@
+# app/utils/output_store.py
+import hashlib
+import logging
+import os
+import time
+from typing import Optional
+from app.config.setting import settings
+from app.utils.file_client import get_processed_file_root
+
+logger = logging.getLogger("celery")
+
+OBJECTS_DIR = "objects"
+HASH_CHUNK_SIZE = 1048576  # bytes
+# files and directories touched more recently are never swept, they may be in use
+SWEEP_GRACE_SECONDS = 300
+
+
+def file_digest(path: str) -> str:
+    """SHA-256 of the file content, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class OutputStore:
+    """
+    Content-addressed store of the processed outputs, shared by the workers and
+    the API through the processed files volume.
+
+    An output is named after the SHA-256 of its bytes, under objects/<2 hex>/,
+    so identical results are stored once and the name doubles as a strong ETag.
+    Storing a result that already exists refreshes its modification time, which
+    the sweeper uses to expire outputs after retention seconds and, beyond the
+    max_bytes budget, to remove the least recently produced ones first. The
+    dated directories holding partial downloads and outputs being written are
+    swept by age as well.
+    """
+
+    def __init__(
+        self,
+        root: str = settings.PROCESSED_FILE_DIR,
+        retention: int = settings.OUTPUT_RETENTION_SECONDS,
+        max_bytes: int = settings.OUTPUT_STORE_MAX_BYTES,
+    ):
+        self.root = get_processed_file_root(root)
+        self.retention = retention
+        self.max_bytes = max_bytes
+
+    @property
+    def objects_dir(self) -> str:
+        return os.path.join(self.root, OBJECTS_DIR)
+
+    def put(self, path: str) -> str:
+        """
+        Move a finished output file into the store.
+
+        Returns:
+            str: The path of the stored output, shared with identical outputs.
+        """
+        digest = file_digest(path)
+        extension = os.path.splitext(path)[1].lower()
+        stored_path = os.path.join(self.objects_dir, digest[:2], f"{digest}{extension}")
+        os.makedirs(os.path.dirname(stored_path), exist_ok=True)
+        try:
+            # an identical output counts as a new one for the retention
+            os.utime(stored_path)
+        except FileNotFoundError:
+            os.replace(path, stored_path)
+        else:
+            os.remove(path)
+            logger.info(f"Output {os.path.basename(path)} already stored as {digest}")
+        return stored_path
+
+    def etag(self, path: str) -> Optional[str]:
+        """The strong ETag of a stored output, None for files outside the store."""
+        if os.path.dirname(os.path.dirname(os.path.abspath(path))) != self.objects_dir:
+            return None
+        return f'"{os.path.splitext(os.path.basename(path))[0]}"'
+
+    def _files(self) -> list[tuple[float, int, str]]:
+        files = []
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.startswith("."):
+                    continue  # .gitkeep and the like
+                path = os.path.join(directory, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def sweep(self, now: float = None) -> dict:
+        """
+        Remove the files older than the retention, then the oldest files until
+        the store fits in max_bytes, and the directories left empty.
+
+        Returns:
+            dict: The number and bytes of the removed and the kept files.
+        """
+        now = time.time() if now is None else now
+        files = sorted(self._files())
+        total = sum(size for _, size, _ in files)
+        (removed, freed) = (0, 0)
+        for mtime, size, path in files:
+            expired = self.retention and now - mtime > self.retention
+            over_budget = self.max_bytes and total > self.max_bytes
+            if now - mtime < SWEEP_GRACE_SECONDS or not (expired or over_budget):
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+            freed += size
+        for directory, _, _ in sorted(os.walk(self.root), reverse=True):
+            if directory in (self.root, self.objects_dir):
+                continue
+            try:
+                if now - os.stat(directory).st_mtime >= SWEEP_GRACE_SECONDS:
+                    os.rmdir(directory)
+            except OSError:
+                pass  # not empty
+        logger.info(
+            f"Processed files swept: {removed} files ({freed} bytes) removed, "
+            f"{len(files) - removed} files ({total} bytes) kept"
+        )
+        return {
+            "removed_files": removed,
+            "removed_bytes": freed,
+            "kept_files": len(files) - removed,
+            "kept_bytes": total,
+        }
+
+
+# store of the processed outputs, shared by the workers and the API
+output_store = OutputStore()
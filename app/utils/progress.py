@@ -0,0 +1,124 @@
+# app/utils/progress.py
+import json
+import logging
+import time
+import redis
+from app.config.setting import settings
+from app.models.task_schemas import TaskResult, TaskStatus
+from app.utils.scheduling import tenant_slots
+
+logger = logging.getLogger("celery")
+
+EVENTS_PREFIX = "ragai:events"
+
+
+def events_channel(task_id: str) -> str:
+    """Redis pub/sub channel that carries the progress events of a task."""
+    return f"{EVENTS_PREFIX}:{task_id}"
+
+
+def download_url(task_id: str) -> str:
+    return f"/api/ragflowai/download/{task_id}"
+
+
+class ProgressReporter:
+    """
+    Report the progress of a job: the Celery task state read by /status, and
+    events published on the job's Redis channel for the /events stream.
+
+    Events are JSON objects {"event": ..., "data": ...} where event is one of
+    "progress" (the TaskResult), "row" (an answered question), "done" (the final
+    TaskResult and its download link) or "error". Publishing failures are
+    logged and never fail the job.
+
+    Progress writes are coalesced: an update with an unchanged state is only
+    stored once interval seconds have passed or progress moved by step percent
+    since the last write. Skipped writes are counted in skipped_writes. The
+    final state is always written.
+    """
+
+    def __init__(
+        self,
+        task,
+        task_id: str,
+        redis_url: str = settings.REDIS_URL,
+        interval: float = settings.PROGRESS_UPDATE_INTERVAL,
+        step: float = settings.PROGRESS_UPDATE_STEP,
+    ):
+        self.task = task
+        self.task_id = task_id
+        self.redis_url = redis_url
+        self.interval = interval
+        self.step = step
+        self.skipped_writes = 0
+        self._redis = None
+        self._last_state = None
+        self._last_progress = 0.0
+        self._last_write = 0.0
+
+    @property
+    def redis(self) -> redis.Redis:
+        if self._redis is None:
+            self._redis = redis.Redis.from_url(self.redis_url)
+        return self._redis
+
+    def publish(self, event: str, data: dict):
+        try:
+            self.redis.publish(
+                events_channel(self.task_id),
+                json.dumps({"event": event, "data": data}),
+            )
+        except redis.RedisError as e:
+            logger.warning(f"Failed to publish {event} event of {self.task_id}: {e}")
+
+    def update(
+        self,
+        task_result: TaskResult,
+        state: TaskStatus = TaskStatus.PROCESSING,
+        force: bool = False,
+    ):
+        """Store the task state and publish it as a progress event, unless throttled."""
+        task_result.status = state
+        now = time.monotonic()
+        if (
+            not force
+            and state == self._last_state
+            and now - self._last_write < self.interval
+            and task_result.progress - self._last_progress < self.step
+        ):
+            self.skipped_writes += 1
+            return
+        self._last_state = state
+        self._last_progress = task_result.progress
+        self._last_write = now
+        task_result.skipped_state_writes = self.skipped_writes
+        self.task.update_state(
+            task_id=self.task_id, state=state, meta=task_result.model_dump()
+        )
+        # a job that progresses keeps its tenant slot past TENANT_SLOT_TTL
+        tenant_slots.refresh(task_result.tenant_id, self.task_id)
+        self.publish("progress", task_result.model_dump(mode="json"))
+
+    def row(self, index: int, rows: list[int], answer: dict):
+        """Publish the answer of the unique question index, standing for input rows."""
+        self.publish("row", {"index": index, "rows": rows, "answer": answer})
+
+    def finish(self, task_result: TaskResult):
+        task_result.skipped_state_writes = self.skipped_writes
+        logger.info(
+            f"Task {self.task_id} finished, {self.skipped_writes} state writes skipped"
+        )
+        self.task.update_state(
+            task_id=self.task_id, state=TaskStatus.SUCCESS, meta=task_result.model_dump()
+        )
+        self.publish(
+            "done",
+            {
+                **task_result.model_dump(mode="json"),
+                "download_url": download_url(self.task_id),
+            },
+        )
+
+    def fail(self, task_result: TaskResult):
+        # the FAILURE state itself is stored by celery when the task raises
+        self.publish("error", task_result.model_dump(mode="json"))
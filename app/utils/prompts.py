@@ -0,0 +1,67 @@
+# app/utils/prompts.py
+from typing import Iterable
+from app.config.setting import settings
+from app.utils.metrics import PROMPT_TOKENS
+
+# no tokenizer of the backend models is available offline: a token is counted
+# as 4 characters, the usual average for English text
+CHARS_PER_TOKEN = 4
+
+
+class PromptTooLongError(ValueError):
+    """Raised when a prompt exceeds its token budget."""
+
+
+def count_tokens(text: str) -> int:
+    """Estimated number of tokens of a text."""
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def _join(question: str, header: str) -> str:
+    # the header is left out if empty or already in the question
+    return question if not header or header in question else header + question
+
+
+def build_prompt(
+    question: str,
+    header: str = "",
+    backend: str = "ragflow",
+    max_tokens: int = settings.PROMPT_MAX_TOKENS,
+) -> str:
+    """
+    Build the prompt of a question: the header (left out if empty or already in
+    the question) followed by the question. The tokens of the prompt are counted
+    in the metrics of the backend.
+
+    Raises:
+        PromptTooLongError: If the prompt exceeds max_tokens (0 = no budget).
+    """
+    prompt = _join(question, header)
+    tokens = count_tokens(prompt)
+    if max_tokens and tokens > max_tokens:
+        raise PromptTooLongError(
+            f"Prompt of {tokens} tokens for {backend} exceeds its budget of {max_tokens}"
+        )
+    PROMPT_TOKENS.labels(backend).inc(tokens)
+    return prompt
+
+
+def within_budget(
+    question: str,
+    headers: Iterable[str] = ("",),
+    max_tokens: int = settings.PROMPT_MAX_TOKENS,
+) -> bool:
+    """Whether the prompt of the question fits max_tokens with each of the headers."""
+    if not max_tokens:
+        return True
+    return all(count_tokens(_join(question, header)) <= max_tokens for header in headers)
+
+
+def budget_chars(overhead: str = "", max_tokens: int = settings.PROMPT_MAX_TOKENS) -> int:
+    """
+    Characters left for the questions of a prompt within the budget, once the
+    rest of the prompt (overhead) is counted, 0 if unlimited.
+    """
+    if not max_tokens:
+        return 0
+    return max(1, (max_tokens - count_tokens(overhead)) * CHARS_PER_TOKEN)
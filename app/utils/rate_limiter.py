@@ -0,0 +1,306 @@
+# app/utils/rate_limiter.py
+import logging
+import random
+import threading
+import time
+from typing import Callable, Optional, TypeVar
+import redis
+from app.config.setting import settings
+from app.utils.metrics import BACKEND_ERRORS, BACKEND_REQUEST_SECONDS
+
+logger = logging.getLogger("celery")
+
+T = TypeVar("T")
+
+RATE_LIMIT_PREFIX = "ragai:ratelimit"
+
+# Refill the bucket from the Redis clock and take one token. Returns 0 when a
+# token was taken, otherwise the milliseconds to wait for the next token. The
+# rate lowered by throttling recovers linearly to the configured rate, and no
+# token is given before the end of a Retry-After pause.
+TOKEN_BUCKET_SCRIPT = """
+local max_rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local recovery = tonumber(ARGV[3])
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) * 1000 + math.floor(tonumber(now_parts[2]) / 1000)
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts', 'rate', 'until')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+local rate = math.min(max_rate, (tonumber(bucket[3]) or max_rate) + (now - ts) * recovery / 1000)
+local paused_until = tonumber(bucket[4]) or 0
+tokens = math.min(capacity, tokens + (now - ts) * rate / 1000)
+local wait = 0
+if now < paused_until then
+    wait = paused_until - now
+elseif tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = math.ceil((1 - tokens) * 1000 / rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now, 'rate', rate)
+local ttl = math.ceil(capacity * 1000 / rate)
+if recovery > 0 then
+    ttl = math.max(ttl, math.ceil((max_rate - rate) * 1000 / recovery))
+end
+redis.call('PEXPIRE', KEYS[1], math.max(ttl, paused_until - now) + 1000)
+return wait
+"""
+
+# Lower the rate of the bucket after a throttling response, down to min_rate,
+# drain it and pause it for retry_after milliseconds. Returns the new rate.
+THROTTLE_SCRIPT = """
+local max_rate = tonumber(ARGV[1])
+local factor = tonumber(ARGV[2])
+local min_rate = tonumber(ARGV[3])
+local retry_after = tonumber(ARGV[4])
+local recovery = tonumber(ARGV[5])
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) * 1000 + math.floor(tonumber(now_parts[2]) / 1000)
+local bucket = redis.call('HMGET', KEYS[1], 'rate', 'until')
+local rate = math.max(min_rate, (tonumber(bucket[1]) or max_rate) * factor)
+local paused_until = math.max(tonumber(bucket[2]) or 0, now + retry_after)
+redis.call('HSET', KEYS[1], 'tokens', 0, 'ts', now, 'rate', rate, 'until', paused_until)
+local ttl = paused_until - now
+if recovery > 0 then
+    ttl = math.max(ttl, math.ceil((max_rate - rate) * 1000 / recovery))
+end
+redis.call('PEXPIRE', KEYS[1], ttl + 1000)
+return tostring(rate)
+"""
+
+# the throttled rate never drops below this fraction of the configured rate
+MIN_RATE_FRACTION = 0.05
+
+
+class BackendUnavailableError(Exception):
+    """Raised when a backend keeps failing or its circuit breaker is open."""
+
+
+class RetryableBackendError(Exception):
+    """
+    A transient backend failure (throttling or server error) worth retrying.
+    A throttling response (429) sets throttled, and retry_after to the seconds
+    of its Retry-After header if any.
+    """
+
+    def __init__(
+        self, message: str, throttled: bool = False, retry_after: Optional[float] = None
+    ):
+        super().__init__(message)
+        self.throttled = throttled
+        self.retry_after = retry_after
+
+
+class BackendRejectedError(ValueError):
+    """The backend rejected a request (a 4xx status other than 429): a retry fails too."""
+
+
+def retry_after_seconds(headers) -> Optional[float]:
+    """The delay in seconds of the Retry-After header, None if absent or a date."""
+    value = (headers or {}).get("Retry-After")
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class RedisTokenBucket:
+    """
+    Token bucket shared by every worker through Redis: rate tokens per second,
+    with bursts of up to capacity requests. A rate of 0 disables the limiter.
+    If Redis is unreachable the limiter lets calls through.
+
+    The bucket adapts to the backend: a throttling response multiplies its rate
+    by backoff_factor (down to MIN_RATE_FRACTION of rate) and pauses it for the
+    Retry-After delay. The rate then recovers linearly, by rate every
+    recovery_seconds.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        capacity: int,
+        redis_url: str = settings.REDIS_URL,
+        backoff_factor: float = settings.RATE_LIMIT_BACKOFF_FACTOR,
+        recovery_seconds: float = settings.RATE_LIMIT_RECOVERY_SECONDS,
+    ):
+        self.name = name
+        self.key = f"{RATE_LIMIT_PREFIX}:{name}"
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self.redis_url = redis_url
+        self.backoff_factor = backoff_factor
+        self.recovery = rate / recovery_seconds if recovery_seconds > 0 else rate
+        self._script = None
+        self._throttle_script = None
+
+    def acquire(self, timeout: float = 60.0) -> bool:
+        """
+        Wait for a token. Returns False if none was available within timeout.
+        """
+        if self.rate <= 0:
+            return True
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                if self._script is None:
+                    self._script = redis.Redis.from_url(self.redis_url).register_script(
+                        TOKEN_BUCKET_SCRIPT
+                    )
+                wait_ms = self._script(
+                    keys=[self.key], args=[self.rate, self.capacity, self.recovery]
+                )
+            except redis.RedisError as e:
+                logger.warning(f"Rate limiter {self.key} unavailable, not limiting: {e}")
+                return True
+            if not wait_ms:
+                return True
+            wait = wait_ms / 1000
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def throttle(self, retry_after: Optional[float] = None):
+        """Slow the bucket down after a throttling response of the backend."""
+        if self.rate <= 0:
+            return
+        try:
+            if self._throttle_script is None:
+                self._throttle_script = redis.Redis.from_url(
+                    self.redis_url
+                ).register_script(THROTTLE_SCRIPT)
+            rate = self._throttle_script(
+                keys=[self.key],
+                args=[
+                    self.rate,
+                    self.backoff_factor,
+                    self.rate * MIN_RATE_FRACTION,
+                    int((retry_after or 0) * 1000),
+                    self.recovery,
+                ],
+            )
+        except redis.RedisError as e:
+            logger.warning(f"Rate limiter {self.key} could not be throttled: {e}")
+            return
+        logger.warning(
+            f"{self.name} throttled, rate lowered to {float(rate):.2f}/s"
+            + (f", paused {retry_after:g}s" if retry_after else "")
+        )
+
+
+class CircuitBreaker:
+    """
+    Per-worker-process circuit breaker. After failure_threshold consecutive
+    failures the circuit opens for reset_timeout seconds, during which callers
+    go straight to their fallback. Then it turns half-open: a single probe call
+    is let through while the other callers still see it open, until the probe
+    closes the circuit on success or opens it again on failure. A probe with no
+    outcome within reset_timeout is replaced by the next caller. A threshold of
+    0 disables it.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self.half_open = False
+
+    def is_open(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                # open, or half-open with a probe in flight
+                return True
+            # half-open: let this call probe the backend. The timer restarts so
+            # the others wait for its outcome, or replace it once reset_timeout
+            # has passed again.
+            self.half_open = True
+            self._opened_at = time.monotonic()
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self.half_open = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.half_open or (
+                self.failure_threshold and self._failures >= self.failure_threshold
+            ):
+                if self._opened_at is None:
+                    logger.error(
+                        f"Circuit {self.name} opened after {self._failures} failures"
+                    )
+                elif self.half_open:
+                    logger.error(f"Circuit {self.name} probe failed, opened again")
+                self._opened_at = time.monotonic()
+                self.half_open = False
+
+
+def backoff_delay(attempt: int, base_delay: float, max_delay: float) -> float:
+    """Full-jitter exponential backoff delay for the given retry attempt (0-based)."""
+    return random.uniform(0, min(max_delay, base_delay * (2**attempt)))
+
+
+def call_with_resilience(
+    func: Callable[[], T],
+    limiter: RedisTokenBucket,
+    breaker: CircuitBreaker,
+    retry_on: tuple = (RetryableBackendError,),
+    max_retries: int = settings.BACKEND_MAX_RETRIES,
+    base_delay: float = settings.BACKEND_RETRY_BASE_DELAY,
+    max_delay: float = settings.BACKEND_RETRY_MAX_DELAY,
+) -> T:
+    """
+    Call func through the rate limiter, retrying the retry_on exceptions with
+    jittered exponential backoff and recording the outcome in the breaker.
+
+    Raises:
+        BackendUnavailableError: If the circuit is open, no token could be
+            obtained or every attempt failed with a retryable error.
+    """
+    # latency and errors are recorded per backend, named after its rate limiter
+    backend = limiter.name
+    if breaker.is_open():
+        BACKEND_ERRORS.labels(backend, "unavailable").inc()
+        raise BackendUnavailableError(f"{breaker.name} circuit is open")
+    for attempt in range(max_retries + 1):
+        if not limiter.acquire():
+            BACKEND_ERRORS.labels(backend, "unavailable").inc()
+            raise BackendUnavailableError(f"{breaker.name} rate limit wait timed out")
+        try:
+            with BACKEND_REQUEST_SECONDS.labels(backend).time():
+                result = func()
+        except retry_on as e:
+            breaker.record_failure()
+            BACKEND_ERRORS.labels(backend, "retryable").inc()
+            if getattr(e, "throttled", False):
+                limiter.throttle(e.retry_after)
+            if attempt == max_retries or breaker.is_open():
+                BACKEND_ERRORS.labels(backend, "unavailable").inc()
+                raise BackendUnavailableError(
+                    f"{breaker.name} failed after {attempt + 1} attempts: {e}"
+                ) from e
+            delay = max(
+                backoff_delay(attempt, base_delay, max_delay),
+                getattr(e, "retry_after", None) or 0,
+            )
+            logger.warning(
+                f"{breaker.name} call failed ({e}), retrying in {delay:.2f}s"
+            )
+            time.sleep(delay)
+        except Exception:
+            BACKEND_ERRORS.labels(backend, "rejected").inc()
+            raise
+        else:
+            breaker.record_success()
+            return result
@@ -1,20 +1,26 @@
 # app/utils/redis_client.py
-import redis
+from redis import asyncio as aioredis
 from app.config.setting import settings
 
 
 class RedisClient:
     def __init__(self):
+        self.pool = None
         self.redis_client = None
 
     async def connect(self):
-        # Connect to Redis using the URL from settings
-        self.redis_client = redis.Redis.from_url(settings.REDIS_URL)
+        # Connect to Redis using the URL from settings, through a shared connection pool
+        self.pool = aioredis.ConnectionPool.from_url(
+            settings.REDIS_URL, max_connections=settings.REDIS_MAX_CONNECTIONS
+        )
+        self.redis_client = aioredis.Redis(connection_pool=self.pool)
         return self.redis_client
 
     async def disconnect(self):
         if self.redis_client:
-            await self.redis_client.close()
+            await self.redis_client.aclose()
+        if self.pool:
+            await self.pool.disconnect()
 
 
 # Initialize a global Redis client instance
@@ -0,0 +1,210 @@
+# app/utils/scheduling.py
+import json
+import logging
+from typing import Optional
+import redis
+from app.config.setting import settings
+from app.models.task_schemas import JobPriority
+from app.tasks.celery_worker import celery_app
+
+logger = logging.getLogger("celery")
+
+TENANT_PREFIX = "ragai:tenant"
+
+# Take a running-job slot of a tenant: forget slots older than the ttl, then add
+# the job unless the tenant already runs limit jobs or has parked jobs waiting
+# before it. A job already holding a slot (a redelivered or woken job) keeps
+# it. Otherwise the job message ARGV[4], if any, is parked at the tail of the
+# tenant's waiting list. Returns 1 when the slot was taken.
+TENANT_SLOT_SCRIPT = """
+local limit = tonumber(ARGV[2])
+local ttl = tonumber(ARGV[3])
+local now = tonumber(redis.call('TIME')[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - ttl)
+if redis.call('ZSCORE', KEYS[1], ARGV[1]) or (
+    redis.call('ZCARD', KEYS[1]) < limit and redis.call('LLEN', KEYS[2]) == 0
+) then
+    redis.call('ZADD', KEYS[1], now, ARGV[1])
+    redis.call('EXPIRE', KEYS[1], ttl)
+    return 1
+end
+if ARGV[4] ~= '' and redis.call('HSETNX', KEYS[3], ARGV[1], ARGV[4]) == 1 then
+    redis.call('RPUSH', KEYS[2], ARGV[1])
+end
+return 0
+"""
+
+# Free the slot of job ARGV[1] (if any) and of the jobs older than the ttl, then
+# hand the free slots to the parked jobs of the tenant in order. Returns their
+# messages, their slots are taken for them.
+TENANT_WAKE_SCRIPT = """
+local limit = tonumber(ARGV[2])
+local ttl = tonumber(ARGV[3])
+local now = tonumber(redis.call('TIME')[1])
+if ARGV[1] ~= '' then
+    redis.call('ZREM', KEYS[1], ARGV[1])
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - ttl)
+local woken = {}
+while redis.call('ZCARD', KEYS[1]) < limit do
+    local task_id = redis.call('LPOP', KEYS[2])
+    if not task_id then
+        break
+    end
+    local message = redis.call('HGET', KEYS[3], task_id)
+    redis.call('HDEL', KEYS[3], task_id)
+    if message then
+        redis.call('ZADD', KEYS[1], now, task_id)
+        redis.call('EXPIRE', KEYS[1], ttl)
+        table.insert(woken, message)
+    end
+end
+return woken
+"""
+
+# Renew the slot of a running job, so it is not freed while the job progresses
+TENANT_REFRESH_SCRIPT = """
+local now = tonumber(redis.call('TIME')[1])
+if redis.call('ZADD', KEYS[1], 'XX', 'CH', now, ARGV[1]) == 1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 1
+"""
+
+
+def choose_queue(
+    estimated_rows: Optional[int], priority: JobPriority = JobPriority.AUTO
+) -> str:
+    """
+    Pick the Celery queue of a job: the fast lane for small jobs, the bulk queue
+    for large jobs and jobs of unknown size, unless the priority forces a lane.
+    """
+    if priority == JobPriority.INTERACTIVE:
+        return settings.FAST_QUEUE
+    if priority == JobPriority.BULK or estimated_rows is None:
+        return settings.BULK_QUEUE
+    if estimated_rows <= settings.FAST_LANE_MAX_ROWS:
+        return settings.FAST_QUEUE
+    return settings.BULK_QUEUE
+
+
+class TenantSlots:
+    """
+    Cap the number of jobs a tenant runs at once, shared by all workers through
+    a Redis sorted set of job ids per tenant. A job that cannot get a slot is
+    parked in a waiting list of its tenant, outside the broker, and requeued at
+    the tail of its queue once a job of the tenant frees a slot, behind the jobs
+    of other tenants queued meanwhile. So one tenant's burst of uploads cannot
+    take every worker. Running jobs renew their slot as they progress, slots of
+    jobs lost without release are freed after ttl seconds without progress.
+    A limit of 0 disables it, and if Redis is unreachable jobs run.
+    """
+
+    def __init__(
+        self,
+        limit: int = settings.TENANT_MAX_ACTIVE_JOBS,
+        ttl: int = settings.TENANT_SLOT_TTL,
+        redis_url: str = settings.REDIS_URL,
+    ):
+        self.limit = limit
+        self.ttl = ttl
+        self.redis_url = redis_url
+        self._redis = None
+        self._scripts = {}
+
+    @property
+    def redis(self) -> redis.Redis:
+        if self._redis is None:
+            self._redis = redis.Redis.from_url(self.redis_url)
+        return self._redis
+
+    def key(self, tenant_id: str, kind: str = "active") -> str:
+        return f"{TENANT_PREFIX}:{tenant_id}:{kind}"
+
+    def _run(self, script: str, tenant_id: str, args: list):
+        if script not in self._scripts:
+            self._scripts[script] = self.redis.register_script(script)
+        return self._scripts[script](
+            keys=[self.key(tenant_id, kind) for kind in ("active", "waiting", "parked")],
+            args=args,
+        )
+
+    def acquire(
+        self, tenant_id: Optional[str], task_id: str, park: Optional[dict] = None
+    ) -> bool:
+        """
+        Take a running-job slot for the job. Returns False if the tenant has none
+        left, after parking the job message park (task, args, kwargs, task_id and
+        queue) to be requeued when a slot is freed.
+        """
+        if not tenant_id or self.limit <= 0:
+            return True
+        try:
+            taken = self._run(
+                TENANT_SLOT_SCRIPT,
+                tenant_id,
+                [task_id, self.limit, self.ttl, json.dumps(park) if park else ""],
+            )
+        except redis.RedisError as e:
+            logger.warning(f"Tenant slots of {tenant_id} unavailable, not limiting: {e}")
+            return True
+        return bool(taken)
+
+    def release(self, tenant_id: Optional[str], task_id: str) -> list[dict]:
+        """
+        Free the slot of the job and hand the free slots of the tenant to its
+        parked jobs. Returns their messages, to be sent again.
+        """
+        return self.wake(tenant_id, task_id)
+
+    def wake(self, tenant_id: Optional[str], task_id: str = "") -> list[dict]:
+        """Hand the free slots of the tenant to its parked jobs and return their messages."""
+        if not tenant_id or self.limit <= 0:
+            return []
+        try:
+            woken = self._run(TENANT_WAKE_SCRIPT, tenant_id, [task_id, self.limit, self.ttl])
+        except redis.RedisError as e:
+            logger.warning(f"Tenant slots of {tenant_id} could not be released: {e}")
+            return []
+        return [json.loads(message) for message in woken]
+
+    def refresh(self, tenant_id: Optional[str], task_id: str):
+        if not tenant_id or self.limit <= 0:
+            return
+        try:
+            self._run(TENANT_REFRESH_SCRIPT, tenant_id, [task_id, self.ttl])
+        except redis.RedisError as e:
+            logger.warning(f"Tenant slot of job {task_id} could not be renewed: {e}")
+
+    def waiting_tenants(self) -> list[str]:
+        """The tenants with parked jobs."""
+        pattern = self.key("*", "waiting")
+        try:
+            keys = list(self.redis.scan_iter(match=pattern))
+        except redis.RedisError as e:
+            logger.warning(f"Parked jobs could not be listed: {e}")
+            return []
+        prefix_length = len(TENANT_PREFIX) + 1
+        return [
+            (key.decode() if isinstance(key, bytes) else key)[prefix_length:-len(":waiting")]
+            for key in keys
+        ]
+
+
+def requeue_parked_jobs(messages: list[dict]):
+    """Send woken parked jobs again, to the tail of their queue."""
+    if not messages:
+        return
+    for message in messages:
+        logger.info(f"Requeuing parked job {message['task_id']} to {message['queue']}")
+        celery_app.send_task(
+            message["task"],
+            args=message["args"],
+            kwargs=message["kwargs"],
+            task_id=message["task_id"],
+            queue=message["queue"],
+        )
+
+
+# worker-level tenant slots instance
+tenant_slots = TenantSlots()
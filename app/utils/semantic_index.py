@@ -0,0 +1,225 @@
+# app/utils/semantic_index.py
+import hashlib
+import importlib
+import json
+import logging
+import re
+import threading
+import zlib
+from typing import Callable, Optional
+import numpy as np
+import redis
+from app.config.setting import settings
+from app.utils.answer_cache import answer_settings
+from app.utils.metrics import CACHE_LOOKUPS
+from app.utils.normalize import normalize_question
+
+logger = logging.getLogger("celery")
+
+SEMANTIC_PREFIX = "ragai:semantic"
+TOKEN_PATTERN = re.compile(r"\w+")
+# rows of questions scored against the index at once, bounds the score matrix size
+SEARCH_BLOCK_SIZE = 256
+SYNC_ATTEMPTS = 3
+
+# an embedder maps texts to a (len(texts), dim) float matrix
+Embedder = Callable[[list[str]], np.ndarray]
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Scale every row to unit length so dot products are cosine similarities."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+class HashingEmbedder:
+    """
+    Local embedder that needs no model: word unigrams, word bigrams and character
+    trigrams of the normalized text are hashed into dim signed buckets. It catches
+    reworded and reordered requirements that share most of their terms; plug in a
+    sentence embedding model through SEMANTIC_EMBEDDER to match paraphrases.
+    """
+
+    def __init__(self, dim: int = settings.SEMANTIC_EMBEDDING_DIM):
+        self.dim = dim
+
+    def features(self, text: str) -> list[tuple[str, float]]:
+        words = TOKEN_PATTERN.findall(normalize_question(text))
+        features = [(word, 1.0) for word in words]
+        features += [(f"{a} {b}", 1.0) for a, b in zip(words, words[1:])]
+        for word in words:
+            padded = f"#{word}#"
+            features += [(padded[i:i + 3], 0.5) for i in range(len(padded) - 2)]
+        return features
+
+    def __call__(self, texts: list[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, weight in self.features(text):
+                digest = zlib.crc32(feature.encode("utf-8"))
+                sign = 1.0 if digest & 0x80000000 else -1.0
+                matrix[row, digest % self.dim] += sign * weight
+        return normalize_rows(matrix)
+
+
+def load_embedder(spec: str) -> Embedder:
+    """
+    Build the embedder named by SEMANTIC_EMBEDDER: "hashing", or "module:factory"
+    where factory() returns a callable embedding a list of texts.
+    """
+    if spec == "hashing":
+        return HashingEmbedder()
+    (module_name, _, factory_name) = spec.partition(":")
+    if not factory_name:
+        raise ValueError(f"Invalid SEMANTIC_EMBEDDER {spec}, expected module:factory")
+    return getattr(importlib.import_module(module_name), factory_name)()
+
+
+class SemanticIndex:
+    """
+    Per-worker vector index of previously answered requirements, used to reuse the
+    answer of a near-duplicate requirement worded differently.
+
+    Answered requirements are shared by all workers through a Redis list, capped
+    at max_entries and expiring with the answer cache. Every worker embeds them
+    into a local NumPy matrix of unit vectors, synced incrementally through a
+    sequence counter, and searches it by brute-force cosine similarity. Like the
+    answer cache, entries are namespaced by the settings that shape an answer.
+    Redis errors never fail a job, the local index is used as it is.
+    """
+
+    def __init__(
+        self,
+        redis_url: str = settings.REDIS_URL,
+        embedder: str = settings.SEMANTIC_EMBEDDER,
+        threshold: float = settings.SEMANTIC_SIMILARITY_THRESHOLD,
+        max_entries: int = settings.SEMANTIC_INDEX_MAX_ENTRIES,
+        ttl: int = settings.ANSWER_CACHE_TTL,
+        enabled: bool = settings.SEMANTIC_INDEX_ENABLED,
+    ):
+        self.redis_url = redis_url
+        self.embedder_spec = embedder
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled = enabled
+        fingerprint = json.dumps(answer_settings())
+        digest = hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()[:16]
+        self.entries_key = f"{SEMANTIC_PREFIX}:{digest}:entries"
+        self.seq_key = f"{SEMANTIC_PREFIX}:{digest}:seq"
+        self._redis = None
+        self._embedder = None
+        self._lock = threading.Lock()
+        self._entries = []  # (question, answer) of each matrix row
+        self._matrix = None
+        self._seq = 0  # number of entries ever added that the local index has seen
+
+    @property
+    def redis(self) -> redis.Redis:
+        if self._redis is None:
+            self._redis = redis.Redis.from_url(self.redis_url)
+        return self._redis
+
+    @property
+    def embedder(self) -> Embedder:
+        if self._embedder is None:
+            self._embedder = load_embedder(self.embedder_spec)
+        return self._embedder
+
+    def _append(self, entries: list[tuple[str, dict]], reset: bool = False):
+        if not entries:
+            if reset:
+                (self._entries, self._matrix) = ([], None)
+            return
+        vectors = self.embedder([question for question, _ in entries])
+        if reset or self._matrix is None:
+            self._entries = []
+            self._matrix = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+        self._entries.extend(entries)
+        self._matrix = np.vstack([self._matrix, vectors.astype(np.float32)])
+        # the oldest entries are trimmed from the shared list, mirror it
+        if len(self._entries) > self.max_entries:
+            self._entries = self._entries[-self.max_entries:]
+            self._matrix = self._matrix[-self.max_entries:]
+
+    def _sync(self):
+        """Embed the entries added by any worker since the last sync."""
+        for _ in range(SYNC_ATTEMPTS):
+            try:
+                with self.redis.pipeline() as pipe:
+                    # retried if another worker adds entries while reading
+                    pipe.watch(self.seq_key)
+                    seq = int(pipe.get(self.seq_key) or 0)
+                    if seq == self._seq:
+                        return
+                    length = pipe.llen(self.entries_key)
+                    reset = seq < self._seq or seq - self._seq > length
+                    start = 0 if reset else length - (seq - self._seq)
+                    pipe.multi()
+                    pipe.lrange(self.entries_key, start, -1)
+                    values = pipe.execute()[0]
+            except redis.WatchError:
+                continue
+            except redis.RedisError as e:
+                logger.warning(f"Semantic index sync failed, using local index: {e}")
+                return
+            self._append([tuple(json.loads(value)) for value in values], reset=reset)
+            self._seq = seq
+            logger.info(f"Semantic index synced, {len(self._entries)} entries")
+            return
+
+    def search_many(
+        self, questions: list[str]
+    ) -> list[Optional[tuple[str, dict, float]]]:
+        """
+        Find the most similar answered requirement of each question.
+
+        Returns:
+            list[Optional[tuple[str, dict, float]]]: The matched requirement, its
+            answer and the cosine similarity, or None below the threshold.
+        """
+        if not self.enabled or not questions:
+            return [None] * len(questions)
+        with self._lock:
+            self._sync()
+            if not self._entries:
+                return [None] * len(questions)
+            queries = self.embedder(questions)
+            matches = []
+            for begin in range(0, len(questions), SEARCH_BLOCK_SIZE):
+                scores = queries[begin:begin + SEARCH_BLOCK_SIZE] @ self._matrix.T
+                best = scores.argmax(axis=1)
+                for row, column in enumerate(best):
+                    score = float(scores[row, column])
+                    if score >= self.threshold:
+                        (question, answer) = self._entries[column]
+                        matches.append((question, answer, score))
+                    else:
+                        matches.append(None)
+        hits = sum(1 for match in matches if match)
+        CACHE_LOOKUPS.labels("semantic", "hit").inc(hits)
+        CACHE_LOOKUPS.labels("semantic", "miss").inc(len(questions) - hits)
+        logger.info(f"Semantic index: {hits} of {len(questions)} questions matched")
+        return matches
+
+    def add_many(self, items: list[tuple[str, dict]]):
+        """Share (question, answer) pairs with the semantic index of every worker."""
+        if not self.enabled or not items:
+            return
+        try:
+            pipe = self.redis.pipeline(transaction=True)
+            pipe.rpush(
+                self.entries_key,
+                *[json.dumps([question, answer]) for question, answer in items],
+            )
+            pipe.incrby(self.seq_key, len(items))
+            pipe.ltrim(self.entries_key, -self.max_entries, -1)
+            pipe.expire(self.entries_key, self.ttl)
+            pipe.expire(self.seq_key, self.ttl)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Semantic index store failed: {e}")
+
+
+# worker-level semantic index instance
+semantic_index = SemanticIndex()
@@ -0,0 +1,71 @@
+# app/utils/upload_dedup.py
+import hashlib
+import json
+import logging
+from typing import Optional
+import redis
+from app.config.setting import settings
+from app.utils.answer_cache import answer_settings
+from app.utils.redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_PREFIX = "ragai:upload"
+
+
+def upload_key(content_digest: str, **options) -> str:
+    """
+    Redis key of an upload: the digest of its bytes, the job options and the
+    settings that shape the answers, so a change of any of them is a new job.
+    """
+    fingerprint = json.dumps(
+        [content_digest, *answer_settings(), sorted(options.items())], default=str
+    )
+    digest = hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()
+    return f"{UPLOAD_PREFIX}:{digest}"
+
+
+async def claim_upload(
+    key: str,
+    task_id: str,
+    force: bool = False,
+    ttl: int = settings.UPLOAD_DEDUP_TTL,
+) -> Optional[str]:
+    """
+    Record task_id as the job of the upload, unless an identical upload already
+    holds the key and force is not set.
+
+    Returns:
+        Optional[str]: The task id of the identical upload, None once task_id is recorded.
+    """
+    try:
+        client = redis_client.redis_client
+        if force:
+            await client.set(key, task_id, ex=ttl)
+            return None
+        if await client.set(key, task_id, ex=ttl, nx=True):
+            return None
+        holder = await client.get(key)
+    except redis.RedisError as e:
+        logger.warning(f"Upload deduplication failed, queueing a new job: {e}")
+        return None
+    if holder is None:
+        # expired in between, the next identical upload reuses this job
+        return await claim_upload(key, task_id, force=True, ttl=ttl)
+    return holder.decode() if isinstance(holder, bytes) else holder
+
+
+async def release_upload(key: str, task_id: str):
+    """
+    Forget task_id as the job of the upload, when it could not be queued, unless
+    another upload holds the key meanwhile.
+    """
+    try:
+        client = redis_client.redis_client
+        holder = await client.get(key)
+        if holder is not None and (
+            holder.decode() if isinstance(holder, bytes) else holder
+        ) == task_id:
+            await client.delete(key)
+    except redis.RedisError as e:
+        logger.warning(f"Upload deduplication key {key} could not be released: {e}")
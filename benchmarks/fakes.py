@@ -0,0 +1,203 @@
+# benchmarks/fakes.py
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Optional
+from google.genai import errors as genai_errors
+
+CHAT_ID = "benchmark-chat"
+# the requirements of a batch prompt, see app.services.gemini.build_batch_prompt
+BATCH_REQUIREMENTS_PATTERN = re.compile(r"Requirements \(JSON array\):\n(.*)\Z", re.S)
+
+
+@dataclass
+class BackendProfile:
+    """
+    Behaviour of a stand-in backend: every call takes latency seconds, spread
+    uniformly by +/- jitter of it, fails with probability error_rate and returns
+    no answer with probability null_ratio. Draws are reproducible from seed.
+    """
+
+    latency: float = 0.0
+    jitter: float = 0.5
+    error_rate: float = 0.0
+    null_ratio: float = 0.0
+    seed: int = 0
+
+    def __post_init__(self):
+        self._random = random.Random(self.seed)
+        self._lock = threading.Lock()
+
+    def draw(self) -> tuple[float, bool, bool]:
+        """Draw the (delay, failed, null answer) of one call."""
+        with self._lock:
+            spread = self._random.uniform(-self.jitter, self.jitter)
+            failed = self._random.random() < self.error_rate
+            null = self._random.random() < self.null_ratio
+        return (max(0.0, self.latency * (1 + spread)), failed, null)
+
+
+class FakeRAGFlowServer:
+    """
+    Local HTTP server answering the RAGFlow API calls made by the workers:
+    listing the chat assistant, creating sessions and chat completions, plain
+    or streamed. Failed calls return 503, null answers the NULL_RAGFLOW_ANSWER.
+    """
+
+    def __init__(
+        self,
+        profile: BackendProfile,
+        null_answer: str,
+        assistant_name: str,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.profile = profile
+        self.null_answer = null_answer
+        self.assistant_name = assistant_name
+        self.completions = 0
+        self.deleted_sessions = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        (host, port) = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeRAGFlowServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def answer(self, question: str) -> Optional[str]:
+        """The answer to a completion request, or None if the call fails."""
+        (delay, failed, null) = self.profile.draw()
+        time.sleep(delay)
+        with self._lock:
+            self.completions += 1
+        if failed:
+            return None
+        if null:
+            return f"Sorry! {self.null_answer} in the knowledge base!"
+        return f"Benchmark answer to: {question[-80:]}"
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # keep-alive, like the pooled client of the workers, without the
+            # Nagle delay between the headers and the body of small responses
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def send_body(self, body: bytes, status: int = 200, content_type=None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type or "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_json(self, payload: dict, status: int = 200):
+                self.send_body(json.dumps(payload).encode("utf-8"), status)
+
+            def read_json(self) -> dict:
+                length = int(self.headers.get("Content-Length") or 0)
+                return json.loads(self.rfile.read(length) or b"{}")
+
+            def do_GET(self):
+                if self.path.startswith("/api/v1/chats"):
+                    chat = {"id": CHAT_ID, "name": fake.assistant_name}
+                    return self.send_json({"code": 0, "data": [chat]})
+                self.send_json({"code": 404, "message": "Not found"}, 404)
+
+            def do_DELETE(self):
+                body = self.read_json()
+                if self.path == f"/api/v1/chats/{CHAT_ID}/sessions":
+                    with fake._lock:
+                        fake.deleted_sessions += len(body.get("ids") or [])
+                    return self.send_json({"code": 0})
+                self.send_json({"code": 404, "message": "Not found"}, 404)
+
+            def do_POST(self):
+                body = self.read_json()
+                if self.path == f"/api/v1/chats/{CHAT_ID}/sessions":
+                    session = {
+                        "id": uuid.uuid4().hex,
+                        "chat_id": CHAT_ID,
+                        "name": body.get("name"),
+                        "messages": [],
+                    }
+                    return self.send_json({"code": 0, "data": session})
+                if self.path != f"/api/v1/chats/{CHAT_ID}/completions":
+                    return self.send_json({"code": 404, "message": "Not found"}, 404)
+                answer = fake.answer(body.get("question", ""))
+                if answer is None:
+                    return self.send_json({"code": 503, "message": "Overloaded"}, 503)
+                data = {"answer": answer, "reference": {"doc_aggs": [{"doc_name": "bench.pdf"}]}}
+                if not body.get("stream"):
+                    return self.send_json({"code": 0, "data": data})
+                # two cumulative events, then the end of the stream
+                events = [
+                    {"code": 0, "data": {"answer": answer[: len(answer) // 2], "reference": {}}},
+                    {"code": 0, "data": data},
+                    {"code": 0, "data": True},
+                ]
+                lines = "".join(f"data:{json.dumps(event)}\n\n" for event in events)
+                self.send_body(lines.encode("utf-8"), content_type="text/event-stream")
+
+        return Handler
+
+
+class FakeGeminiClient:
+    """
+    Stand-in for google.genai.Client: client.models.generate_content answers
+    single prompts and JSON batch prompts after the profile's latency. Failed
+    calls raise a 503 APIError, null answers are empty (or null batch items).
+    """
+
+    def __init__(self, profile: BackendProfile):
+        self.profile = profile
+        self.models = self
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, model: str, contents: str, config: dict = None):
+        (delay, failed, null) = self.profile.draw()
+        time.sleep(delay)
+        with self._lock:
+            self.calls += 1
+        if failed:
+            raise genai_errors.APIError(
+                503, {"error": {"code": 503, "message": "Overloaded", "status": "UNAVAILABLE"}}
+            )
+        match = BATCH_REQUIREMENTS_PATTERN.search(contents)
+        if (config or {}).get("response_mime_type") == "application/json" and match:
+            queries = json.loads(match.group(1))
+            answers = [
+                None if self.profile.draw()[2] else f"Benchmark LLM answer to: {query[-80:]}"
+                for query in queries
+            ]
+            return SimpleNamespace(text=json.dumps(answers))
+        return SimpleNamespace(text=None if null else f"Benchmark LLM answer ({model})")
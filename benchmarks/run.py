@@ -0,0 +1,407 @@
+"""
+Offline throughput benchmark of the processing pipeline.
+
+The RAGFlow API is served by a local fake HTTP server and Google Gemini is
+replaced by a fake client, both with configurable latency, error rate and
+null-answer ratio, so no network access is needed. Redis is real: point
+--redis-url at a scratch database (the docker-compose Redis, or a CI service).
+
+Every case runs in a fresh process on a synthetic sheet of unique
+requirements and reports rows/s, p50/p95 per-row latency (from the RAGFlow
+call to the final answer of the row), peak RSS and the Redis commands issued.
+
+    python -m benchmarks.run --rows 10,100,1000,10000 --redis-url redis://localhost:6380/15
+    python -m benchmarks.run --mode api --ragflow-latency 0.05 --null-ratio 0.2
+    python -m benchmarks.run --output bench.json --baseline baseline.json
+
+In process mode process_excel runs in the benchmark process; in api mode the
+sheet goes through /upload, /status and /download, answered by an embedded
+Celery worker. With --baseline, the run fails if the rows/s of a case drops,
+or its Redis writes per row grow, by more than --max-regression.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from typing import Optional
+
+# Redis commands that write keys, counted from INFO commandstats. Scripts
+# (token buckets, tenant slots) count as one write each.
+REDIS_WRITE_COMMANDS = {
+    "set", "setex", "mset", "del", "unlink", "expire", "pexpire", "incr", "incrby",
+    "hset", "hmset", "hincrby", "hdel", "rpush", "lpush", "ltrim", "lrem",
+    "zadd", "zrem", "zremrangebyscore", "publish", "eval", "evalsha",
+}
+# settings without a default, for running without a .env file
+BENCHMARK_SETTINGS = {
+    "REDIS_URL": "redis://localhost:6379/15",
+    "EXPOSED_PORT": "10103",
+    "RAGFLOW_STREAM": "False",
+    "TENDER_KNOWLEDGE_BASE": "Benchmark",
+    "TENDER_QUESTION_HEADER": "Answer the following tender requirement: ",
+    "VENDOR_QUESTION_HEADER": "As a vendor, answer the following requirement: ",
+    "PUBLIC_LLM_MODEL": "gemini-benchmark",
+    "NULL_RAGFLOW_ANSWER": "the answer you are looking for is not found",
+    "Q_COLUMN_WIDTH": "50",
+    "A_COLUMN_WIDTH": "80",
+    "REF_COLUMN_WIDTH": "30",
+}
+TERMINAL_STATES = ("SUCCESS", "FAILURE")
+
+
+def percentile(values: list[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+def redis_command_calls(client) -> dict[str, int]:
+    """Calls of each command since the Redis server started, from INFO commandstats."""
+    stats = client.info("commandstats")
+    return {
+        name[len("cmdstat_"):]: values["calls"]
+        for name, values in stats.items()
+        if name.startswith("cmdstat_")
+    }
+
+
+def count_redis_commands(before: dict[str, int], after: dict[str, int]) -> tuple[int, int]:
+    """The (writes, all commands) issued between two commandstats snapshots."""
+    calls = {name: after[name] - before.get(name, 0) for name in after}
+    calls.pop("info", None)
+    writes = sum(count for name, count in calls.items() if name in REDIS_WRITE_COMMANDS)
+    return (writes, sum(calls.values()))
+
+
+def write_sheet(path: str, rows: int, run_id: str):
+    # unique requirements, so neither deduplication nor the answer cache skip calls
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(path, {"constant_memory": True})
+    worksheet = workbook.add_worksheet("Requirements")
+    worksheet.write_row(0, 0, ["ID", "Requirement"])
+    for row in range(1, rows + 1):
+        worksheet.write_row(
+            row,
+            0,
+            [row, f"Requirement {row} of benchmark {run_id}: describe how the "
+                  f"solution supports capability {row % 97} at scale."],
+        )
+    workbook.close()
+
+
+def configure_environment(case: dict, ragflow_url: str, work_dir: str):
+    # settings are read when the app modules are imported, set them first
+    from dotenv import dotenv_values
+
+    configured = dotenv_values(".env")
+    for key, value in BENCHMARK_SETTINGS.items():
+        if key not in os.environ and key not in configured:
+            os.environ[key] = value
+    os.environ.update(
+        {
+            "RAGFLOW_BASE_URL": ragflow_url,
+            "RAGFLOW_API_KEY": "benchmark",
+            "GEMINI_API_KEY": "benchmark",
+            "PROCESSED_FILE_DIR": os.path.join(work_dir, "processed"),
+            "UPLOAD_SPOOL_DIR": os.path.join(work_dir, "uploaded"),
+            # chunk tasks need a worker pool, the embedded worker runs one job at a time
+            "CHUNK_SIZE": "0",
+            "WORKER_METRICS_PORT": "0",
+            **case["settings"],
+        }
+    )
+    if case["redis_url"]:
+        os.environ["REDIS_URL"] = case["redis_url"]
+
+
+def time_rows(process_task, latencies: list[float]):
+    """Record the time each requirement takes, from its RAGFlow call to its answer."""
+    answer_requirement = process_task.answer_requirement
+    lock = threading.Lock()
+
+    def timed_answer_requirement(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return answer_requirement(*args, **kwargs)
+        finally:
+            with lock:
+                latencies.append(time.perf_counter() - started)
+
+    process_task.answer_requirement = timed_answer_requirement
+
+
+def set_log_level(level: str):
+    # the app logs every question at INFO, which would dominate the timings
+    for logger in [logging.getLogger(), *map(logging.getLogger, logging.root.manager.loggerDict)]:
+        logger.setLevel(level)
+
+
+def run_process(case: dict, sheet_path: str, work_dir: str) -> tuple[str, float]:
+    from app.models.task_schemas import TaskStatus
+    from app.tasks.process_task import process_excel
+
+    # the job removes its spooled upload once done, like a real upload
+    upload_path = os.path.join(work_dir, "uploaded", os.path.basename(sheet_path))
+    os.makedirs(os.path.dirname(upload_path), exist_ok=True)
+    shutil.copy(sheet_path, upload_path)
+    set_log_level(case["log_level"])
+    started = time.perf_counter()
+    result = process_excel.apply(
+        args=(os.path.basename(sheet_path),),
+        kwargs={"upload_path": upload_path},
+        task_id=uuid.uuid4().hex,
+    )
+    status = TaskStatus(result.get(propagate=True)["status"]).value
+    return (status, time.perf_counter() - started)
+
+
+def run_api(case: dict, sheet_path: str, work_dir: str) -> tuple[str, float]:
+    from celery.contrib.testing.worker import start_worker
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.tasks.celery_worker import celery_app
+
+    with start_worker(celery_app, pool="solo", perform_ping_check=False), TestClient(
+        app
+    ) as client:
+        # after the worker and the API have applied their logging configuration
+        set_log_level(case["log_level"])
+        # timed from the upload to the download, without the worker startup
+        started = time.perf_counter()
+        with open(sheet_path, "rb") as f:
+            response = client.post(
+                "/api/ragflowai/upload",
+                files={"file": (os.path.basename(sheet_path), f)},
+                # identical sheets of earlier runs must not be answered from their jobs
+                params={"force": True},
+            )
+        response.raise_for_status()
+        task_id = response.json()["task_id"]
+        deadline = time.monotonic() + case["timeout"]
+        status = None
+        while status not in TERMINAL_STATES:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Job {task_id} did not finish in {case['timeout']}s")
+            time.sleep(0.05)
+            response = client.get(f"/api/ragflowai/status/{task_id}")
+            # 404 until the worker picks the job up
+            if response.status_code == 200:
+                status = response.json()["status"]
+        if status == "SUCCESS":
+            client.get(f"/api/ragflowai/download/{task_id}").raise_for_status()
+        return (status, time.perf_counter() - started)
+
+
+def run_case(case: dict) -> dict:
+    """Run one benchmark case. Meant to run in a fresh process, see main()."""
+    from benchmarks.fakes import BackendProfile, FakeGeminiClient, FakeRAGFlowServer
+
+    work_dir = tempfile.mkdtemp(prefix="ragai-bench-")
+    server = FakeRAGFlowServer(
+        BackendProfile(**case["ragflow"]), null_answer="", assistant_name=""
+    ).start()
+    try:
+        configure_environment(case, server.url, work_dir)
+        import redis
+        from app.config.setting import settings
+        from app.services import gemini
+        from app.tasks import process_task
+        from app.utils.metrics import ANSWERS, BACKEND_ERRORS
+
+        server.null_answer = settings.NULL_RAGFLOW_ANSWER
+        server.assistant_name = settings.TENDER_KNOWLEDGE_BASE
+        fake_gemini = FakeGeminiClient(BackendProfile(**case["gemini"]))
+        gemini._clients[settings.GEMINI_API_KEY] = fake_gemini
+
+        sheet_path = os.path.join(work_dir, f"benchmark_{case['rows']}.xlsx")
+        write_sheet(sheet_path, case["rows"], uuid.uuid4().hex[:8])
+        latencies = []
+        time_rows(process_task, latencies)
+
+        client = redis.Redis.from_url(settings.REDIS_URL)
+        try:
+            before = redis_command_calls(client)
+        except redis.ResponseError:
+            # a server without INFO commandstats, writes are not counted
+            before = None
+        runner = run_api if case["mode"] == "api" else run_process
+        (status, seconds) = runner(case, sheet_path, work_dir)
+        (writes, commands) = (
+            count_redis_commands(before, redis_command_calls(client))
+            if before is not None
+            else (None, None)
+        )
+        return {
+            "mode": case["mode"],
+            "rows": case["rows"],
+            "status": status,
+            "seconds": round(seconds, 3),
+            "rows_per_second": round(case["rows"] / seconds, 2),
+            "p50_row_seconds": percentile(latencies, 50),
+            "p95_row_seconds": percentile(latencies, 95),
+            # ru_maxrss is in kilobytes on Linux
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "redis_writes": writes,
+            "redis_commands": commands,
+            "ragflow_calls": server.completions,
+            "gemini_calls": fake_gemini.calls,
+            "answers": counter_values(ANSWERS),
+            "backend_errors": counter_values(BACKEND_ERRORS),
+        }
+    finally:
+        server.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def counter_values(counter) -> dict[str, float]:
+    """The value of every label combination of a Prometheus counter."""
+    return {
+        ".".join(sample.labels.values()): sample.value
+        for metric in counter.collect()
+        for sample in metric.samples
+        if sample.name.endswith("_total")
+    }
+
+
+def find_regressions(results: list[dict], baseline: list[dict], tolerance: float) -> list[str]:
+    """Compare the results with the cases of the same mode and size in the baseline."""
+    previous = {(result["mode"], result["rows"]): result for result in baseline}
+    regressions = []
+    for result in results:
+        base = previous.get((result["mode"], result["rows"]))
+        if base is None:
+            continue
+        case = f"{result['mode']} {result['rows']} rows"
+        if result["rows_per_second"] < base["rows_per_second"] * (1 - tolerance):
+            regressions.append(
+                f"{case}: {result['rows_per_second']} rows/s, "
+                f"baseline {base['rows_per_second']}"
+            )
+        if (
+            result["redis_writes"] is not None
+            and base.get("redis_writes") is not None
+            and result["redis_writes"] > base["redis_writes"] * (1 + tolerance)
+        ):
+            regressions.append(
+                f"{case}: {result['redis_writes']} Redis writes, "
+                f"baseline {base['redis_writes']}"
+            )
+    return regressions
+
+
+def print_report(results: list[dict]):
+    columns = [
+        ("mode", "mode", "{}"),
+        ("rows", "rows", "{}"),
+        ("status", "status", "{}"),
+        ("rows_per_second", "rows/s", "{:.1f}"),
+        ("p50_row_seconds", "p50 s", "{:.4f}"),
+        ("p95_row_seconds", "p95 s", "{:.4f}"),
+        ("peak_rss_mb", "RSS MB", "{:.1f}"),
+        ("redis_writes", "writes", "{}"),
+        ("redis_commands", "commands", "{}"),
+    ]
+    table = [[title for _, title, _ in columns]]
+    for result in results:
+        table.append(
+            [
+                "-" if result[key] is None else fmt.format(result[key])
+                for key, _, fmt in columns
+            ]
+        )
+    widths = [max(len(row[i]) for row in table) for i in range(len(columns))]
+    for row in table:
+        print("  ".join(cell.rjust(width) for cell, width in zip(row, widths)))
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Offline benchmark of process_excel and the upload API."
+    )
+    parser.add_argument("--mode", choices=["process", "api"], default="process")
+    parser.add_argument(
+        "--rows", default="10,100,1000,10000", help="comma separated sheet sizes"
+    )
+    parser.add_argument("--redis-url", help="defaults to REDIS_URL of the settings")
+    parser.add_argument("--ragflow-latency", type=float, default=0.0, help="seconds")
+    parser.add_argument("--ragflow-error-rate", type=float, default=0.0)
+    parser.add_argument("--null-ratio", type=float, default=0.0,
+                        help="share of RAGFlow answers that fall back to the public LLM")
+    parser.add_argument("--gemini-latency", type=float, default=0.0, help="seconds")
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0)
+    parser.add_argument("--gemini-null-ratio", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.5,
+                        help="latency spread, as a fraction of the latency")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--setting", action="append", default=[], metavar="KEY=VALUE",
+                        help="override a setting, e.g. RAGFLOW_MAX_CONCURRENCY=4")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--timeout", type=float, default=3600, help="seconds per api job")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare with")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    cases = [
+        {
+            "mode": args.mode,
+            "rows": int(rows),
+            "redis_url": args.redis_url,
+            "timeout": args.timeout,
+            "log_level": args.log_level,
+            "settings": dict(setting.split("=", 1) for setting in args.setting),
+            "ragflow": {
+                "latency": args.ragflow_latency,
+                "jitter": args.jitter,
+                "error_rate": args.ragflow_error_rate,
+                "null_ratio": args.null_ratio,
+                "seed": args.seed,
+            },
+            "gemini": {
+                "latency": args.gemini_latency,
+                "jitter": args.jitter,
+                "error_rate": args.gemini_error_rate,
+                "null_ratio": args.gemini_null_ratio,
+                "seed": args.seed + 1,
+            },
+        }
+        for rows in args.rows.split(",")
+    ]
+    # a fresh process per case, so peak RSS and the metrics are those of the case
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for case in cases:
+        with context.Pool(1) as pool:
+            results.append(pool.apply(run_case, (case,)))
+    print_report(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    failed = [result for result in results if result["status"] != "SUCCESS"]
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f), args.max_regression)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
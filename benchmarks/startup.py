@@ -0,0 +1,158 @@
+"""
+Import-time and startup benchmark of the API and the worker.
+
+Every sample runs in a fresh interpreter, as a new container or an AUTORELOAD
+restart would. For the API it imports app.main, then starts the app (lifespan)
+and answers a first request; for the worker it imports the Celery app and the
+task modules, as a worker does before it consumes, and preloads the configured
+LLM client libraries. No Redis nor backend is needed.
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --repeat 10 --setting PUBLIC_LLM_PROVIDER=stub
+    python -m benchmarks.startup --output startup.json
+
+Reported are the median import and startup seconds, the whole process
+wall time including the interpreter startup, and the heavy libraries loaded.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from benchmarks.run import BENCHMARK_SETTINGS
+
+# libraries the API should not need, and the worker only when it uses them
+HEAVY_MODULES = (
+    "pandas", "numpy", "openpyxl", "xlsxwriter", "ragflow_sdk", "google.genai", "openai"
+)
+TARGETS = ("api", "worker")
+
+# run in the measured interpreter: stdlib imports only before the clock starts
+CHILD_SCRIPT = """
+import json, sys, time
+target, heavy_modules = sys.argv[1], sys.argv[2].split(",")
+started = time.perf_counter()
+if target == "api":
+    from app.main import app
+    imported = time.perf_counter()
+    from fastapi.testclient import TestClient
+    with TestClient(app) as client:
+        client.get("/openapi.json").raise_for_status()
+else:
+    from app.tasks.celery_worker import celery_app, preload_llm_clients
+    celery_app.loader.import_default_modules()
+    imported = time.perf_counter()
+    celery_app.finalize(auto=True)
+    preload_llm_clients()
+ready = time.perf_counter()
+print(json.dumps({
+    "import_seconds": imported - started,
+    "startup_seconds": ready - started,
+    "modules": len(sys.modules),
+    "heavy_modules": [name for name in heavy_modules if name in sys.modules],
+}))
+"""
+
+
+def startup_environment(overrides: dict) -> dict:
+    """The environment of a measured process: settings without defaults filled in."""
+    from dotenv import dotenv_values
+
+    configured = dotenv_values(".env")
+    env = dict(os.environ)
+    for key, value in BENCHMARK_SETTINGS.items():
+        if key not in env and key not in configured:
+            env[key] = value
+    env.update(
+        {
+            "RAGFLOW_BASE_URL": env.get("RAGFLOW_BASE_URL", "http://127.0.0.1:9"),
+            "RAGFLOW_API_KEY": env.get("RAGFLOW_API_KEY", "benchmark"),
+            "GEMINI_API_KEY": env.get("GEMINI_API_KEY", "benchmark"),
+            "WORKER_METRICS_PORT": "0",
+            **overrides,
+        }
+    )
+    # multiprocess metrics would write their samples to the shared directory
+    env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+    return env
+
+
+def measure_startup(target: str, env: dict) -> dict:
+    """Start the target once in a fresh interpreter and return its timings."""
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-c", CHILD_SCRIPT, target, ",".join(HEAVY_MODULES)],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    sample = json.loads(completed.stdout.strip().splitlines()[-1])
+    return {**sample, "process_seconds": time.perf_counter() - started}
+
+
+def run_target(target: str, env: dict, repeat: int) -> dict:
+    # the first start warms the bytecode and file system caches, it is not counted
+    measure_startup(target, env)
+    samples = [measure_startup(target, env) for _ in range(repeat)]
+    return {
+        "target": target,
+        "repeat": repeat,
+        **{
+            key: statistics.median(sample[key] for sample in samples)
+            for key in ("import_seconds", "startup_seconds", "process_seconds")
+        },
+        "modules": samples[-1]["modules"],
+        "heavy_modules": samples[-1]["heavy_modules"],
+    }
+
+
+def print_report(results: list[dict]):
+    table = [["target", "import s", "startup s", "process s", "modules", "heavy modules"]]
+    for result in results:
+        table.append(
+            [
+                result["target"],
+                f"{result['import_seconds']:.3f}",
+                f"{result['startup_seconds']:.3f}",
+                f"{result['process_seconds']:.3f}",
+                str(result["modules"]),
+                ",".join(result["heavy_modules"]) or "-",
+            ]
+        )
+    widths = [max(len(row[i]) for row in table) for i in range(len(table[0]))]
+    for row in table:
+        print("  ".join(cell.rjust(width) for cell, width in zip(row, widths)))
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Import-time and startup benchmark of the API and the worker."
+    )
+    parser.add_argument("--target", choices=TARGETS, action="append")
+    parser.add_argument("--repeat", type=int, default=5, help="samples per target")
+    parser.add_argument(
+        "--setting",
+        action="append",
+        default=[],
+        help="NAME=VALUE setting override, repeatable",
+    )
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    env = startup_environment(dict(setting.split("=", 1) for setting in args.setting))
+    results = [run_target(target, env, args.repeat) for target in args.target or TARGETS]
+    print_report(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
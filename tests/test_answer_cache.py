@@ -0,0 +1,53 @@
+import json
+import redis
+from unittest.mock import MagicMock
+from app.utils.answer_cache import AnswerCache
+
+
+def make_cache(**kwargs):
+    cache = AnswerCache(redis_url="redis://localhost:6379/0", **kwargs)
+    cache._redis = MagicMock()
+    return cache
+
+
+def test_make_key_ignores_whitespace_and_case():
+    cache = make_cache()
+    assert cache.make_key("  Supports   SSO? ") == cache.make_key("supports sso?")
+    assert cache.make_key("supports sso?") != cache.make_key("supports mfa?")
+
+
+def test_make_key_depends_on_the_public_llm_provider(monkeypatch):
+    cache = make_cache()
+    key = cache.make_key("supports sso?")
+    monkeypatch.setattr("app.utils.answer_cache.settings.PUBLIC_LLM_PROVIDER", "openai")
+    assert cache.make_key("supports sso?") != key
+
+
+def test_get_many_returns_answers_in_order():
+    cache = make_cache(enabled=True)
+    answer = {"Supplier explanation / comments": "Yes", "Reference": "doc.pdf"}
+    cache._redis.mget.return_value = [None, json.dumps(answer).encode()]
+    assert cache.get_many(["q1", "q2"]) == [None, answer]
+
+
+def test_get_many_treats_redis_errors_as_misses():
+    cache = make_cache(enabled=True)
+    cache._redis.mget.side_effect = redis.ConnectionError("down")
+    assert cache.get_many(["q1", "q2"]) == [None, None]
+
+
+def test_disabled_cache_does_not_touch_redis():
+    cache = make_cache(enabled=False)
+    assert cache.get_many(["q1"]) == [None]
+    cache.set_many([("q1", {"Reference": "doc.pdf"})])
+    assert not cache._redis.method_calls
+
+
+def test_set_many_evicts_oldest_entries_beyond_max_size():
+    cache = make_cache(enabled=True, max_entries=1)
+    pipe = cache._redis.pipeline.return_value
+    pipe.execute.return_value = [True, 1, True, 1, 0, 2]
+    cache._redis.zpopmin.return_value = [(b"ragai:answer:old", 1.0)]
+    cache.set_many([("q1", {}), ("q2", {})])
+    cache._redis.zpopmin.assert_called_once_with("ragai:answer:index", 1)
+    cache._redis.delete.assert_called_once_with(b"ragai:answer:old")
@@ -0,0 +1,74 @@
+import pytest
+from app.config.setting import settings
+from app.services import gemini
+from app.services.ragflow import RAGFlowSessionPool, ask_question_to_chat_assistant
+from benchmarks.fakes import BackendProfile, FakeGeminiClient, FakeRAGFlowServer
+from benchmarks.run import count_redis_commands, find_regressions
+from benchmarks.startup import measure_startup, startup_environment
+
+
+@pytest.fixture
+def fake_ragflow():
+    def start(**profile):
+        return FakeRAGFlowServer(
+            BackendProfile(**profile),
+            null_answer=settings.NULL_RAGFLOW_ANSWER,
+            assistant_name="Benchmark",
+        )
+
+    return start
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_fake_ragflow_server_answers_through_the_session_pool(fake_ragflow, stream):
+    with fake_ragflow() as server:
+        pool = RAGFlowSessionPool(base_url=server.url, assistant_name="Benchmark")
+        with pool.session() as session:
+            response = ask_question_to_chat_assistant(session, "Is SSO supported?", stream)
+    assert response["data"]["answer"].startswith("Benchmark answer to:")
+    assert response["data"]["reference"]["doc_aggs"] == [{"doc_name": "bench.pdf"}]
+    assert server.completions == 1
+    assert server.deleted_sessions == 1
+
+
+def test_fake_ragflow_server_returns_null_answers(fake_ragflow):
+    with fake_ragflow(null_ratio=1.0) as server:
+        pool = RAGFlowSessionPool(base_url=server.url, assistant_name="Benchmark")
+        with pool.session() as session:
+            response = ask_question_to_chat_assistant(session, "Is SSO supported?")
+    assert settings.NULL_RAGFLOW_ANSWER in response["data"]["answer"].lower()
+
+
+def test_fake_gemini_client_answers_batches(monkeypatch):
+    monkeypatch.setitem(gemini._clients, "benchmark", FakeGeminiClient(BackendProfile()))
+    answers = gemini.query_google_gemini_batch(["q1", "q2"], api_key="benchmark")
+    assert answers == ["Benchmark LLM answer to: q1", "Benchmark LLM answer to: q2"]
+
+
+def test_count_redis_commands_separates_writes():
+    before = {"set": 10, "get": 4, "info": 1}
+    after = {"set": 13, "get": 9, "hset": 2, "info": 2}
+    assert count_redis_commands(before, after) == (5, 10)
+
+
+def test_find_regressions_compares_cases_of_the_same_size():
+    baseline = [{"mode": "process", "rows": 100, "rows_per_second": 100, "redis_writes": 50}]
+    results = [
+        {"mode": "process", "rows": 100, "rows_per_second": 70, "redis_writes": 80},
+        {"mode": "process", "rows": 1000, "rows_per_second": 1, "redis_writes": 1},
+    ]
+    assert len(find_regressions(results, baseline, tolerance=0.2)) == 2
+    assert find_regressions(results, baseline, tolerance=0.9) == []
+
+
+def test_api_starts_without_the_worker_libraries():
+    result = measure_startup("api", startup_environment({}))
+    assert result["heavy_modules"] == []
+    assert result["startup_seconds"] >= result["import_seconds"] > 0
+
+
+def test_worker_loads_only_the_configured_llm_library():
+    result = measure_startup("worker", startup_environment({"PUBLIC_LLM_PROVIDER": "stub"}))
+    assert "ragflow_sdk" in result["heavy_modules"]
+    assert "google.genai" not in result["heavy_modules"]
+    assert "openai" not in result["heavy_modules"]
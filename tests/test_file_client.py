@@ -0,0 +1,131 @@
+import os
+import csv
+import json
+import zipfile
+import pytest
+from openpyxl import Workbook, load_workbook
+from app.utils.file_client import (
+    extract_zip_upload,
+    write_annotated_workbook,
+    write_output,
+    write_output_sheets,
+)
+
+ANSWERS = [
+    {
+        "Requirement": "Supports SSO?",
+        "Supplier explanation / comments": "Yes",
+        "Reference": "a.pdf",
+    },
+    {"Requirement": "=1+1", "Supplier explanation / comments": "Error", "Reference": None},
+]
+
+
+@pytest.fixture
+def spool_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        "app.utils.file_client.get_upload_spool_directory", lambda: str(tmp_path)
+    )
+    return tmp_path
+
+
+def test_extract_zip_upload_keeps_only_workbooks(spool_dir):
+    zip_path = spool_dir / "upload.zip"
+    with zipfile.ZipFile(zip_path, "w") as archive:
+        archive.writestr("lots/../../a.xlsx", b"a")
+        archive.writestr("b.XLSX", b"b")
+        archive.writestr("readme.txt", b"skipped")
+        archive.writestr("__MACOSX/._a.xlsx", b"skipped")
+        archive.writestr("~$b.xlsx", b"skipped")
+    extracted = extract_zip_upload(str(zip_path))
+    assert [name for name, _ in extracted] == ["lots/../../a.xlsx", "b.XLSX"]
+    for _, path in extracted:
+        assert os.path.dirname(path) == str(spool_dir)
+    assert open(extracted[1][1], "rb").read() == b"b"
+
+
+def test_extract_zip_upload_limits_workbooks(spool_dir):
+    zip_path = spool_dir / "upload.zip"
+    with zipfile.ZipFile(zip_path, "w") as archive:
+        for i in range(3):
+            archive.writestr(f"{i}.xlsx", b"x")
+    with pytest.raises(ValueError, match="more than 2 workbooks"):
+        extract_zip_upload(str(zip_path), max_files=2)
+
+
+def test_extract_zip_upload_limits_uncompressed_size(spool_dir):
+    zip_path = spool_dir / "upload.zip"
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("a.xlsx", b"0" * 600)
+        # members that are not extracted count too
+        archive.writestr("padding.txt", b"0" * 600)
+    with pytest.raises(ValueError, match="1200 bytes uncompressed"):
+        extract_zip_upload(str(zip_path), max_bytes=1000)
+    assert os.listdir(spool_dir) == ["upload.zip"]
+    assert len(extract_zip_upload(str(zip_path), max_bytes=1200)) == 1
+
+
+def test_write_output_xlsx_keeps_strings(tmp_path):
+    path = write_output(ANSWERS, str(tmp_path / "out.xlsx"))
+    worksheet = load_workbook(path)["SeismaTender"]
+    assert list(worksheet.iter_rows(values_only=True)) == [
+        ("Requirement", "Supplier explanation / comments", "Reference"),
+        ("Supports SSO?", "Yes", "a.pdf"),
+        ("=1+1", "Error", None),
+    ]
+
+
+def test_write_output_csv_and_jsonl(tmp_path):
+    with open(write_output(ANSWERS, str(tmp_path / "out.csv"), "csv")) as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ["Requirement", "Supplier explanation / comments", "Reference"]
+    assert rows[2] == ["=1+1", "Error", ""]
+    with open(write_output(ANSWERS, str(tmp_path / "out.jsonl"), "jsonl")) as f:
+        assert [json.loads(line) for line in f] == ANSWERS
+
+
+def test_write_output_sheets_adds_sheet_column(tmp_path):
+    path = write_output_sheets(
+        [("Lot 1", ANSWERS[:1]), ("Lot 2", ANSWERS[1:])], str(tmp_path / "out.jsonl"), "jsonl"
+    )
+    with open(path) as f:
+        assert [json.loads(line)["Sheet"] for line in f] == ["Lot 1", "Lot 2"]
+    path = write_output_sheets(
+        [("Lot 1", ANSWERS[:1]), ("Lot 2", ANSWERS[1:])], str(tmp_path / "out.xlsx")
+    )
+    workbook = load_workbook(path)
+    assert workbook.sheetnames == ["Lot 1", "Lot 2"]
+
+
+def test_write_output_parquet(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    path = write_output(ANSWERS, str(tmp_path / "out.parquet"), "parquet")
+    assert pq.read_table(path).to_pylist() == ANSWERS
+
+
+def test_write_output_rejects_unknown_format(tmp_path):
+    with pytest.raises(ValueError, match="Unsupported output format"):
+        write_output(ANSWERS, str(tmp_path / "out.xml"), "xml")
+
+
+def test_write_annotated_workbook_adds_answer_columns(tmp_path):
+    source = Workbook()
+    source.active.title = "Tender"
+    for row in (["ID", "Requirement"], [1, "Supports SSO?"], [2, None], [3, "=1+1"]):
+        source.active.append(row)
+    source.create_sheet("Notes").append(["kept", 42])
+    source_path = str(tmp_path / "source.xlsx")
+    source.save(source_path)
+
+    path = write_annotated_workbook(
+        source_path, {0: ([2, 4], ANSWERS)}, str(tmp_path / "out.xlsx")
+    )
+    workbook = load_workbook(path)
+    assert workbook.sheetnames == ["Tender", "Notes"]
+    assert list(workbook["Tender"].iter_rows(values_only=True)) == [
+        ("ID", "Requirement", "Supplier explanation / comments", "Reference"),
+        (1, "Supports SSO?", "Yes", "a.pdf"),
+        (2, None, None, None),
+        (3, "=1+1", "Error", None),
+    ]
+    assert list(workbook["Notes"].iter_rows(values_only=True)) == [("kept", 42)]
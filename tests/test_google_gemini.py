@@ -1,6 +1,21 @@
+import json
 import pytest
 from unittest.mock import patch, MagicMock
-from app.services.gemini import query_google_gemini
+from app.services import gemini
+from app.services.gemini import (
+    query_google_gemini,
+    query_google_gemini_batch,
+    pack_batches,
+    parse_batch_answers,
+)
+
+
+@pytest.fixture(autouse=True)
+def clear_client_cache():
+    # clients are cached per worker; start every test without one
+    gemini._clients.clear()
+    yield
+    gemini._clients.clear()
 
 
 @pytest.fixture
@@ -11,15 +26,25 @@ def mock_settings(monkeypatch):
 def test_query_google_gemini_success(mock_settings):
     mock_response = MagicMock()
     mock_response.text = "Paris"
-    with patch("app.services.gemini.genai.Client") as mock_client_cls:
+    with patch("google.genai.Client") as mock_client_cls:
         mock_client = mock_client_cls.return_value
         mock_client.models.generate_content.return_value = mock_response
         result = query_google_gemini("What is the capital of France?")
         assert result == "Paris"
 
 
+def test_query_google_gemini_sends_the_header_as_system_instruction(mock_settings):
+    with patch("google.genai.Client") as mock_client_cls:
+        generate_content = mock_client_cls.return_value.models.generate_content
+        generate_content.return_value = MagicMock(text="Yes")
+        assert query_google_gemini("Is SSO supported?", system_instruction="Vendor: ") == "Yes"
+    kwargs = generate_content.call_args.kwargs
+    assert kwargs["contents"] == "Is SSO supported?"
+    assert kwargs["config"]["system_instruction"] == "Vendor: "
+
+
 def test_query_google_gemini_exception_logged_and_returns_none(mock_settings):
-    with patch("app.services.gemini.genai.Client") as mock_client_cls, patch(
+    with patch("google.genai.Client") as mock_client_cls, patch(
         "app.services.gemini.logger"
     ) as mock_logger:
         mock_client = mock_client_cls.return_value
@@ -32,7 +57,7 @@ def test_query_google_gemini_exception_logged_and_returns_none(mock_settings):
 def test_query_google_gemini_custom_api_key(monkeypatch):
     mock_response = MagicMock()
     mock_response.text = "Paris"
-    with patch("app.services.gemini.genai.Client") as mock_client_cls:
+    with patch("google.genai.Client") as mock_client_cls:
         mock_client = mock_client_cls.return_value
         mock_client.models.generate_content.return_value = mock_response
         result = query_google_gemini(
@@ -42,6 +67,42 @@ def test_query_google_gemini_custom_api_key(monkeypatch):
         assert result == "Paris"
 
 
+def test_query_google_gemini_reuses_client(mock_settings):
+    with patch("google.genai.Client") as mock_client_cls:
+        query_google_gemini("What is the capital of France?")
+        query_google_gemini("What is the capital of Spain?")
+        assert mock_client_cls.call_count == 1
+
+
+def test_pack_batches_respects_char_and_item_budgets():
+    assert pack_batches(["aaaa", "bbbb", "cc", "dddddddddd", "e"], 8, 10) == [
+        [0, 1],
+        [2],
+        [3],
+        [4],
+    ]
+    assert pack_batches(["a", "b", "c"], 100, 2) == [[0, 1], [2]]
+
+
+def test_parse_batch_answers_marks_invalid_entries_as_missing():
+    assert parse_batch_answers(json.dumps(["Yes", "", 3]), 3) == ["Yes", None, None]
+    assert parse_batch_answers(json.dumps(["Yes"]), 2) == [None, None]
+    assert parse_batch_answers("not json", 1) == [None]
+
+
+def test_query_google_gemini_batch_single_call(mock_settings):
+    mock_response = MagicMock()
+    mock_response.text = json.dumps(["Paris", "Madrid"])
+    with patch("google.genai.Client") as mock_client_cls:
+        mock_client = mock_client_cls.return_value
+        mock_client.models.generate_content.return_value = mock_response
+        result = query_google_gemini_batch(["France?", "Spain?"], header="Capitals: ")
+        assert result == ["Paris", "Madrid"]
+        assert mock_client.models.generate_content.call_count == 1
+        prompt = mock_client.models.generate_content.call_args.kwargs["contents"]
+        assert prompt.startswith("Capitals: ")
+
+
 def test_query_google_gemini_real_api_key_used():
     result = query_google_gemini("What is the capital of China?")
     print(f"Result: {result}")
@@ -0,0 +1,124 @@
+import time
+import pytest
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+from app.services import llm
+from app.services.llm import (
+    GeminiProvider,
+    LLMProvider,
+    OpenAICompatibleProvider,
+    get_provider,
+    query_public_llm,
+    query_public_llm_batch,
+)
+
+
+class FakeProvider(LLMProvider):
+    def __init__(self, model: str, delay: float = 0, answer: str = None):
+        super().__init__(model, timeout=1)
+        self.delay = delay
+        self.text = answer or f"answer from {model}"
+        self.calls = 0
+
+    def complete(self, prompt: str, json_output: bool = False, system: str = ""):
+        self.calls += 1
+        self.system = system
+        time.sleep(self.delay)
+        if self.text == "error":
+            raise RuntimeError("backend down")
+        return self.text
+
+
+@pytest.fixture
+def providers(monkeypatch):
+    monkeypatch.setattr(llm, "_providers", {})
+    monkeypatch.setattr(llm.settings, "PUBLIC_LLM_PROVIDER", "fake")
+    monkeypatch.setattr(llm.settings, "PUBLIC_LLM_MODEL", "primary")
+    monkeypatch.setattr(llm.settings, "PUBLIC_LLM_HEDGE_PROVIDER", "fake")
+    monkeypatch.setattr(llm.settings, "PUBLIC_LLM_HEDGE_MODEL", "hedge")
+    monkeypatch.setattr(llm.settings, "PUBLIC_LLM_HEDGE_DELAY", 0.05)
+
+    def use(primary: FakeProvider, hedge: FakeProvider):
+        by_model = {"primary": primary, "hedge": hedge}
+        monkeypatch.setitem(llm.PROVIDERS, "fake", lambda model: by_model[model])
+        return (primary, hedge)
+
+    return use
+
+
+def test_fast_public_llm_is_not_hedged(providers):
+    (primary, hedge) = providers(FakeProvider("primary"), FakeProvider("hedge"))
+    assert query_public_llm("q", system="Answer as the vendor: ") == (
+        "answer from primary",
+        "primary",
+    )
+    assert hedge.calls == 0
+    assert primary.system == "Answer as the vendor: "
+
+
+def test_slow_public_llm_is_hedged_and_first_answer_wins(providers):
+    (primary, hedge) = providers(FakeProvider("primary", delay=0.5), FakeProvider("hedge"))
+    started = time.monotonic()
+    assert query_public_llm("q") == ("answer from hedge", "hedge")
+    assert time.monotonic() - started < 0.4
+    assert primary.calls == hedge.calls == 1
+
+
+def test_failed_public_llm_is_hedged_at_once(providers):
+    (primary, hedge) = providers(
+        FakeProvider("primary", answer="error"), FakeProvider("hedge", answer="error")
+    )
+    assert query_public_llm("q") == (None, "primary")
+    assert primary.calls == hedge.calls == 1
+
+
+def test_batches_go_to_the_public_llm_only(providers):
+    (primary, hedge) = providers(
+        FakeProvider("primary", answer='["a1", ""]'), FakeProvider("hedge")
+    )
+    assert query_public_llm_batch(["q1", "q2"]) == (["a1", None], "primary")
+    assert hedge.calls == 0
+
+
+def test_stub_provider_answers_offline(monkeypatch):
+    monkeypatch.setattr(llm, "_providers", {})
+    stub = get_provider("stub", "any")
+    assert stub.answer("q") == llm.settings.STUB_LLM_ANSWER
+    assert stub.answer_batch(["q1", "q2"]) == [llm.settings.STUB_LLM_ANSWER] * 2
+    with pytest.raises(ValueError):
+        get_provider("unknown", "any")
+
+
+def test_openai_compatible_provider_parses_fenced_batches():
+    provider = OpenAICompatibleProvider("local-model", base_url="http://localhost:8000/v1")
+    message = SimpleNamespace(content='```json\n["a1", "a2"]\n```')
+    provider._client = MagicMock()
+    provider._client.chat.completions.create.return_value = SimpleNamespace(
+        choices=[SimpleNamespace(message=message)]
+    )
+    assert provider.answer_batch(["q1", "q2"]) == ["a1", "a2"]
+    assert provider._client.chat.completions.create.call_args.kwargs["model"] == "local-model"
+
+
+def test_providers_must_implement_complete(monkeypatch):
+    with pytest.raises(TypeError):
+        LLMProvider("any", timeout=1)
+    generate = MagicMock(return_value=SimpleNamespace(text='["a1"]'))
+    monkeypatch.setattr(llm, "generate_content", generate)
+    monkeypatch.setattr(llm, "get_gemini_client", lambda api_key: "client")
+    assert GeminiProvider("gemini-model").complete("prompt", json_output=True) == '["a1"]'
+    assert generate.call_args.kwargs["config"]["response_mime_type"] == "application/json"
+
+
+def test_openai_compatible_provider_sends_the_header_as_system_message():
+    provider = OpenAICompatibleProvider("local-model", base_url="http://localhost:8000/v1")
+    message = SimpleNamespace(content="Yes")
+    provider._client = MagicMock()
+    provider._client.chat.completions.create.return_value = SimpleNamespace(
+        choices=[SimpleNamespace(message=message)]
+    )
+    assert provider.answer("Is SSO supported?", system="Answer as the vendor: ") == "Yes"
+    assert provider._client.chat.completions.create.call_args.kwargs["messages"] == [
+        {"role": "system", "content": "Answer as the vendor: "},
+        {"role": "user", "content": "Is SSO supported?"},
+    ]
@@ -0,0 +1,56 @@
+import pytest
+from unittest.mock import MagicMock
+from prometheus_client import REGISTRY
+from app.utils.rate_limiter import (
+    BackendUnavailableError,
+    CircuitBreaker,
+    RedisTokenBucket,
+    RetryableBackendError,
+    call_with_resilience,
+)
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_call_with_resilience_records_latency_and_errors_per_backend(monkeypatch):
+    monkeypatch.setattr("app.utils.rate_limiter.time.sleep", lambda _: None)
+    limiter = RedisTokenBucket("metrics-test", rate=0, capacity=1)
+    breaker = CircuitBreaker("test", failure_threshold=0, reset_timeout=30)
+    calls = sample("ragai_backend_request_seconds_count", backend="metrics-test")
+    retryable = sample("ragai_backend_errors_total", backend="metrics-test", kind="retryable")
+    rejected = sample("ragai_backend_errors_total", backend="metrics-test", kind="rejected")
+
+    func = MagicMock(side_effect=[RetryableBackendError("503"), "ok"])
+    assert call_with_resilience(func, limiter, breaker, max_retries=1) == "ok"
+    with pytest.raises(ValueError):
+        call_with_resilience(MagicMock(side_effect=ValueError("400")), limiter, breaker)
+    with pytest.raises(BackendUnavailableError):
+        call_with_resilience(
+            MagicMock(side_effect=RetryableBackendError("503")),
+            limiter,
+            breaker,
+            max_retries=0,
+        )
+
+    assert sample("ragai_backend_request_seconds_count", backend="metrics-test") == calls + 4
+    assert (
+        sample("ragai_backend_errors_total", backend="metrics-test", kind="retryable")
+        == retryable + 2
+    )
+    assert (
+        sample("ragai_backend_errors_total", backend="metrics-test", kind="rejected")
+        == rejected + 1
+    )
+    assert sample("ragai_backend_errors_total", backend="metrics-test", kind="unavailable") == 1
+
+
+def test_metrics_endpoint_serves_prometheus_text():
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    response = TestClient(app).get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "ragai_backend_request_seconds" in response.text
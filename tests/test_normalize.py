@@ -0,0 +1,18 @@
+from app.config.setting import settings
+from app.utils.normalize import normalize_question, deduplicate_requirements
+
+
+def test_normalize_question_ignores_whitespace_case_and_header():
+    expected = "does the solution support sso?"
+    assert normalize_question("Does the solution\n support   SSO? ") == expected
+    assert (
+        normalize_question(settings.TENDER_QUESTION_HEADER + "Does the solution support SSO?")
+        == expected
+    )
+
+
+def test_deduplicate_requirements_groups_rows_in_input_order():
+    requirements = ["Supports SSO?", "Audit log", "supports  sso?", "Audit log", "MFA"]
+    questions, row_groups = deduplicate_requirements(requirements)
+    assert questions == ["Supports SSO?", "Audit log", "MFA"]
+    assert row_groups == [[0, 2], [1, 3], [4]]
@@ -0,0 +1,127 @@
+import os
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.utils.output_store import SWEEP_GRACE_SECONDS, OutputStore
+
+
+def write(path, content: bytes, age: float = 0):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(content)
+    if age:
+        mtime = os.path.getmtime(path) - age
+        os.utime(path, (mtime, mtime))
+    return str(path)
+
+
+def test_put_stores_identical_outputs_once(tmp_path):
+    store = OutputStore(root=str(tmp_path), retention=0, max_bytes=0)
+    first = store.put(write(tmp_path / "day" / "a.xlsx", b"same answers"))
+    second = store.put(write(tmp_path / "day" / "b.xlsx", b"same answers"))
+    other = store.put(write(tmp_path / "day" / "c.xlsx", b"other answers"))
+    assert first == second != other
+    assert first.startswith(store.objects_dir) and first.endswith(".xlsx")
+    assert os.listdir(tmp_path / "day") == []
+    assert store.etag(first) == f'"{os.path.basename(first)[:-5]}"'
+    assert store.etag(str(tmp_path / "day" / "a.xlsx")) is None
+
+
+def test_sweep_applies_retention_and_size_budget(tmp_path):
+    store = OutputStore(root=str(tmp_path), retention=3600, max_bytes=10)
+    expired = write(tmp_path / "objects" / "aa" / "expired.csv", b"12345", age=7200)
+    oldest = write(tmp_path / "objects" / "bb" / "oldest.csv", b"123456", age=1800)
+    # files younger than the grace period are kept whatever the budget
+    young = write(
+        tmp_path / "objects" / "cc" / "young.csv", b"1234567", age=SWEEP_GRACE_SECONDS / 5
+    )
+    partial = write(tmp_path / "20260101" / "partial.csv", b"12345678")
+
+    result = store.sweep()
+
+    assert [os.path.exists(p) for p in (expired, oldest, young, partial)] == [
+        False, False, True, True
+    ]
+    assert result == {"removed_files": 2, "removed_bytes": 11, "kept_files": 2, "kept_bytes": 15}
+
+
+@pytest.fixture
+def download_client(tmp_path, monkeypatch):
+    from app.routers import ragflowtasks
+
+    store = OutputStore(root=str(tmp_path), retention=0, max_bytes=0)
+    stored_path = store.put(write(tmp_path / "out.csv", b"Requirement,Answer\nq,a\n"))
+    monkeypatch.setattr(ragflowtasks, "output_store", store)
+
+    async def read_task_meta(task_id):
+        return ("SUCCESS", {"download_path": stored_path})
+
+    monkeypatch.setattr(ragflowtasks, "read_task_meta", read_task_meta)
+    app = FastAPI()
+    app.include_router(ragflowtasks.router)
+    return (TestClient(app), store.etag(stored_path))
+
+
+def test_download_supports_etag_revalidation(download_client):
+    (client, etag) = download_client
+    response = client.get("/ragflowai/download/job-1")
+    assert response.status_code == 200
+    assert response.headers["etag"] == etag
+    assert response.content == b"Requirement,Answer\nq,a\n"
+
+    response = client.get("/ragflowai/download/job-1", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+
+def test_download_supports_range_requests(download_client):
+    (client, etag) = download_client
+    response = client.get(
+        "/ragflowai/download/job-1", headers={"Range": "bytes=0-10", "If-Range": etag}
+    )
+    assert response.status_code == 206
+    assert response.content == b"Requirement"
+    assert response.headers["content-range"] == "bytes 0-10/23"
+
+
+def test_partial_download_is_written_once_per_checkpoint_version(tmp_path, monkeypatch):
+    from app.routers import ragflowtasks
+
+    answers = {0: {"Requirement": "q1"}}
+    writes = []
+
+    class FakeCheckpoint:
+        def __init__(self, key):
+            assert key == "ragai:checkpoint:job-1"
+
+        def count(self):
+            return len(answers)
+
+    def write_output(rows, output_path, output_format):
+        writes.append(len(rows))
+        return write(output_path, f"{len(rows)} rows".encode())
+
+    async def read_task_meta(task_id):
+        return (
+            "PROCESSING",
+            {"checkpoint_key": "ragai:checkpoint:job-1", "output_format": "csv"},
+        )
+
+    monkeypatch.setattr(ragflowtasks, "TaskCheckpoint", FakeCheckpoint)
+    monkeypatch.setattr(
+        ragflowtasks, "load_checkpoint_rows", lambda key: list(answers.values())
+    )
+    monkeypatch.setattr(ragflowtasks, "write_output", write_output)
+    monkeypatch.setattr(ragflowtasks, "get_processed_file_directory", lambda _: str(tmp_path))
+    monkeypatch.setattr(ragflowtasks, "read_task_meta", read_task_meta)
+    app = FastAPI()
+    app.include_router(ragflowtasks.router)
+    client = TestClient(app)
+
+    for _ in range(3):
+        assert client.get("/ragflowai/download/job-1?partial=true").content == b"1 rows"
+    answers[1] = {"Requirement": "q2"}
+    assert client.get("/ragflowai/download/job-1?partial=true").content == b"2 rows"
+    assert writes == [1, 2]
+    # the earlier version is removed once the next one is written
+    assert os.listdir(tmp_path) == ["partial_upload_job-1_v2.csv"]
@@ -0,0 +1,63 @@
+import pytest
+from io import BytesIO
+from openpyxl import Workbook
+from app.services.ragflow import parse_input_file, parse_input_sheets
+
+
+def make_workbook(rows) -> bytes:
+    workbook = Workbook()
+    worksheet = workbook.active
+    for row in rows:
+        worksheet.append(row)
+    buffer = BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def test_parse_input_file_reads_requirement_column_with_row_numbers(tmp_path):
+    contents = make_workbook(
+        [
+            ["ID", "Requirement", "Notes"],
+            [1, "Supports SSO?", "x"],
+            [2, None, "skipped"],
+            [3, "Audit log", None],
+        ]
+    )
+    path = tmp_path / "tender.xlsx"
+    path.write_bytes(contents)
+    expected = (["Supports SSO?", "Audit log"], [2, 4])
+    assert parse_input_file(str(path)) == expected
+    assert parse_input_file(contents) == expected
+
+
+def test_parse_input_file_requires_requirement_column():
+    with pytest.raises(ValueError, match="must contain a 'Requirement' column"):
+        parse_input_file(make_workbook([["Question"], ["Supports SSO?"]]))
+
+
+def test_parse_input_file_rejects_empty_requirement_column():
+    with pytest.raises(ValueError, match="empty"):
+        parse_input_file(make_workbook([["Requirement"], [None]]))
+
+
+def test_parse_input_sheets_reads_every_sheet_with_requirement_column():
+    workbook = Workbook()
+    workbook.active.title = "Lot 1"
+    workbook.active.append(["Requirement"])
+    workbook.active.append(["Supports SSO?"])
+    workbook.create_sheet("Notes").append(["Comment"])
+    lot2 = workbook.create_sheet("Lot 2")
+    for row in (["ID", "Requirement"], [1, None], [2, "Audit log"]):
+        lot2.append(row)
+    workbook.create_sheet("Lot 3").append(["Requirement"])
+    buffer = BytesIO()
+    workbook.save(buffer)
+    assert parse_input_sheets(buffer.getvalue()) == [
+        (0, "Lot 1", ["Supports SSO?"], [2]),
+        (2, "Lot 2", ["Audit log"], [3]),
+    ]
+
+
+def test_parse_input_sheets_requires_a_requirement_sheet():
+    with pytest.raises(ValueError, match="No sheet"):
+        parse_input_sheets(make_workbook([["Question"], ["Supports SSO?"]]))
@@ -0,0 +1,420 @@
+import time
+import pytest
+from unittest.mock import patch, MagicMock
+from app.config.setting import settings
+from app.tasks.process_task import answer_requirements
+
+
+def fake_ragflow_answer(session, question, stream=False):
+    # answer later questions faster so completion order differs from input order
+    time.sleep(0.01 * (5 - int(question[-1])))
+    return {"data": {"answer": f"answer to {question}", "reference": {}}}
+
+
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_answer_requirements_keeps_input_order(monkeypatch, max_workers):
+    monkeypatch.setattr(
+        "app.tasks.process_task.settings.RAGFLOW_MAX_CONCURRENCY", max_workers
+    )
+    requirements = [f"question {i}" for i in range(5)]
+    progress = []
+    with patch(
+        "app.tasks.process_task.ask_question_to_chat_assistant",
+        side_effect=fake_ragflow_answer,
+    ):
+        answers = answer_requirements(
+            MagicMock(), requirements, lambda done, total: progress.append(done)
+        )
+    assert [a["Requirement"] for a in answers] == requirements
+    assert [a["Supplier explanation / comments"] for a in answers] == [
+        f"answer to {q}" for q in requirements
+    ]
+    assert progress == [1, 2, 3, 4, 5]
+
+
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_answer_requirements_falls_back_to_public_llm(monkeypatch, max_workers):
+    monkeypatch.setattr(
+        "app.tasks.process_task.settings.RAGFLOW_MAX_CONCURRENCY", max_workers
+    )
+    null_answer = {"data": {"answer": settings.NULL_RAGFLOW_ANSWER, "reference": {}}}
+    with patch(
+        "app.tasks.process_task.ask_question_to_chat_assistant",
+        return_value=null_answer,
+    ), patch(
+        "app.tasks.process_task.query_public_llm",
+        side_effect=[("Gemini", settings.PUBLIC_LLM_MODEL), (None, settings.PUBLIC_LLM_MODEL)],
+    ):
+        answers = answer_requirements(MagicMock(), ["q1", "q2"], lambda *_: None)
+    assert sorted(a["Reference"] for a in answers) == sorted(
+        ["Error", settings.PUBLIC_LLM_MODEL]
+    )
+
+
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_answer_requirements_propagates_ragflow_failure(monkeypatch, max_workers):
+    monkeypatch.setattr(
+        "app.tasks.process_task.settings.RAGFLOW_MAX_CONCURRENCY", max_workers
+    )
+    with patch(
+        "app.tasks.process_task.ask_question_to_chat_assistant",
+        side_effect=ValueError("Failed to get response from RAG Flow API"),
+    ):
+        with pytest.raises(ValueError):
+            answer_requirements(MagicMock(), ["q1", "q2"], lambda *_: None)
+
+
+
+def test_rejected_ragflow_request_gives_an_error_row():
+    from app.utils.rate_limiter import BackendRejectedError
+
+    def ask(session, question, stream=False):
+        if question == "q2":
+            raise BackendRejectedError("Failed to get response from RAG Flow API: status 400")
+        return {"data": {"answer": f"answer to {question}", "reference": {}}}
+
+    with patch("app.tasks.process_task.ask_question_to_chat_assistant", side_effect=ask):
+        answers = answer_requirements(MagicMock(), ["q1", "q2"], lambda *_: None)
+    assert answers[0]["Supplier explanation / comments"] == "answer to q1"
+    assert answers[1]["Reference"] == "Error"
+    assert "status 400" in answers[1]["Supplier explanation / comments"]
+
+
+def test_answer_requirements_batches_public_llm_fallback(monkeypatch):
+    monkeypatch.setattr("app.tasks.process_task.settings.PUBLIC_LLM_BATCH_MODE", True)
+    null_answer = {"data": {"answer": settings.NULL_RAGFLOW_ANSWER, "reference": {}}}
+    with patch(
+        "app.tasks.process_task.ask_question_to_chat_assistant",
+        return_value=null_answer,
+    ), patch(
+        "app.tasks.process_task.query_public_llm_batch",
+        return_value=(["batch answer", None, "batch answer"], settings.PUBLIC_LLM_MODEL),
+    ) as mock_batch, patch(
+        "app.tasks.process_task.query_public_llm",
+        return_value=("single answer", settings.PUBLIC_LLM_MODEL),
+    ) as mock_single:
+        answers = answer_requirements(
+            MagicMock(), ["q1", "q2", "q3"], lambda *_: None
+        )
+    assert mock_batch.call_count == 1
+    assert mock_single.call_count == 1
+    assert [a["Supplier explanation / comments"] for a in answers] == [
+        "batch answer",
+        "single answer",
+        "batch answer",
+    ]
+
+
+def test_failed_public_llm_batch_gives_error_rows(monkeypatch):
+    monkeypatch.setattr("app.tasks.process_task.settings.PUBLIC_LLM_BATCH_MODE", True)
+    null_answer = {"data": {"answer": settings.NULL_RAGFLOW_ANSWER, "reference": {}}}
+    with patch(
+        "app.tasks.process_task.ask_question_to_chat_assistant",
+        return_value=null_answer,
+    ), patch(
+        "app.tasks.process_task.query_public_llm_batch",
+        side_effect=ValueError("Unknown public LLM provider 'nope'"),
+    ):
+        answers = answer_requirements(MagicMock(), ["q1", "q2"], lambda *_: None)
+    assert [a["Requirement"] for a in answers] == ["q1", "q2"]
+    assert all(a["Supplier explanation / comments"].startswith("Error") for a in answers)
+
+
+def test_process_excel_parks_job_when_tenant_has_no_slot(monkeypatch):
+    from celery.exceptions import Ignore
+    from app.tasks.process_task import process_excel
+
+    parked = []
+
+    def acquire(tenant_id, task_id, park=None):
+        parked.append(park)
+        return False
+
+    monkeypatch.setattr("app.tasks.process_task.tenant_slots.acquire", acquire)
+    process_excel.push_request(
+        id="job-1",
+        args=["in.xlsx"],
+        kwargs={"upload_path": "in.xlsx", "tenant_id": "acme"},
+        delivery_info={"routing_key": settings.FAST_QUEUE},
+    )
+    try:
+        with patch.object(process_excel, "update_state") as mock_update:
+            with pytest.raises(Ignore):
+                process_excel.run("in.xlsx", upload_path="in.xlsx", tenant_id="acme")
+    finally:
+        process_excel.pop_request()
+    # requeued later by the job that frees a slot, to the tail of the same queue
+    assert parked == [
+        {
+            "task": "app.tasks.process_task.process_excel",
+            "args": ["in.xlsx"],
+            "kwargs": {"upload_path": "in.xlsx", "tenant_id": "acme"},
+            "task_id": "job-1",
+            "queue": settings.FAST_QUEUE,
+        }
+    ]
+    assert mock_update.call_args.kwargs["state"] == "RETRY"
+
+
+def test_released_slot_requeues_the_parked_jobs(monkeypatch):
+    from app.tasks import process_task
+
+    message = {
+        "task": "app.tasks.process_task.process_excel",
+        "args": ["in.xlsx"],
+        "kwargs": {"tenant_id": "acme"},
+        "task_id": "job-2",
+        "queue": settings.BULK_QUEUE,
+    }
+    monkeypatch.setattr(
+        process_task.tenant_slots, "release", lambda tenant_id, task_id: [message]
+    )
+    with patch("app.utils.scheduling.celery_app.send_task") as send_task:
+        process_task._release_tenant_slot("acme", "job-1")
+    send_task.assert_called_once_with(
+        message["task"],
+        args=message["args"],
+        kwargs=message["kwargs"],
+        task_id="job-2",
+        queue=settings.BULK_QUEUE,
+    )
+
+
+def test_checkpoint_key_is_per_task():
+    from app.utils.checkpoint import make_checkpoint_key
+
+    assert make_checkpoint_key("job-1", ["q1"]) == make_checkpoint_key("job-1", ["q1"])
+    assert make_checkpoint_key("job-1", ["q1"]) != make_checkpoint_key("job-2", ["q1"])
+
+
+class FakeCheckpointRedis:
+    """In-memory stand-in for the Redis commands of TaskCheckpoint."""
+
+    def __init__(self):
+        self.hashes = {}
+        self.values = {}
+
+    def pipeline(self, transaction=False):
+        return self
+
+    def hset(self, key, mapping):
+        self.hashes.setdefault(key, {}).update(
+            {str(field).encode(): value.encode() for field, value in mapping.items()}
+        )
+
+    def expire(self, key, ttl):
+        pass
+
+    def execute(self):
+        pass
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def hlen(self, key):
+        return len(self.hashes.get(key, {}))
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value.encode()
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def exists(self, key):
+        return int(key in self.values or key in self.hashes)
+
+    def delete(self, *keys):
+        for key in keys:
+            self.hashes.pop(key, None)
+            self.values.pop(key, None)
+
+
+class FakeReporter:
+    events = []
+
+    def __init__(self, task, task_id):
+        self.task_id = task_id
+
+    def update(self, task_result, state=None, force=False):
+        self.events.append(("update", task_result.progress))
+
+    def row(self, index, rows, answer):
+        pass
+
+    def finish(self, task_result):
+        self.events.append(("finish", task_result.download_path))
+
+    def fail(self, task_result):
+        self.events.append(("fail", task_result.error))
+
+
+@pytest.fixture
+def chunked_job(tmp_path, monkeypatch):
+    from openpyxl import Workbook
+    from app.tasks import process_task
+    from app.utils.checkpoint import TaskCheckpoint
+    from app.utils.output_store import OutputStore
+
+    from celery.backends.cache import CacheBackend
+
+    # chords register their results with the result backend, kept in memory here
+    monkeypatch.setattr(
+        process_task.celery_app._local,
+        "backend",
+        CacheBackend(app=process_task.celery_app, url="memory://"),
+        raising=False,
+    )
+    checkpoints = FakeCheckpointRedis()
+    released = []
+    FakeReporter.events = []
+    monkeypatch.setattr(TaskCheckpoint, "redis", checkpoints)
+    monkeypatch.setattr(process_task, "ProgressReporter", FakeReporter)
+    monkeypatch.setattr(process_task.settings, "CHUNK_SIZE", 2)
+    monkeypatch.setattr(process_task.answer_cache, "enabled", False)
+    monkeypatch.setattr(process_task, "session_pool", MagicMock())
+    monkeypatch.setattr(process_task, "get_processed_file_directory", lambda _: str(tmp_path))
+    monkeypatch.setattr(process_task, "output_store", OutputStore(root=str(tmp_path)))
+    monkeypatch.setattr(process_task.tenant_slots, "acquire", lambda *args, **kwargs: True)
+    monkeypatch.setattr(
+        process_task.tenant_slots, "release", lambda tenant_id, task_id: released.append(task_id)
+    )
+    upload_path = str(tmp_path / "upload.xlsx")
+
+    def run(failing_question=None, questions=None, task_id="job-1"):
+        workbook = Workbook()
+        workbook.active.append(["Requirement"])
+        for question in questions or [f"question {i}" for i in range(5)]:
+            workbook.active.append([question])
+        workbook.save(upload_path)
+
+        def ask(session, question, stream=False):
+            if question.endswith(failing_question or "none"):
+                raise ValueError("Failed to get response from RAG Flow API")
+            return {"data": {"answer": f"answer to {question}", "reference": {}}}
+
+        with patch.object(process_task, "ask_question_to_chat_assistant", side_effect=ask):
+            return process_task.process_excel.apply(
+                args=("upload.xlsx",),
+                kwargs={"upload_path": upload_path, "output_format": "csv", "tenant_id": "acme"},
+                task_id=task_id,
+            )
+
+    return (run, checkpoints, released)
+
+
+def test_chunked_job_runs_as_an_eager_chord(chunked_job):
+    (run, checkpoints, released) = chunked_job
+    result = run()
+    assert result.state == "SUCCESS"
+    with open(result.result["download_path"]) as f:
+        rows = f.read().splitlines()
+    assert rows[1:] == [f"question {i},answer to question {i}," for i in range(5)]
+    assert FakeReporter.events[-1] == ("finish", result.result["download_path"])
+    # the merge cleared the answers and the job state from the checkpoint
+    assert checkpoints.hashes == checkpoints.values == {}
+    assert "job-1" in released
+
+
+def test_chunked_job_fails_when_a_chunk_fails(chunked_job):
+    (run, checkpoints, released) = chunked_job
+    result = run(failing_question="question 3")
+    assert result.state == "FAILURE"
+    assert FakeReporter.events[-1][0] == "fail"
+    assert "job-1" in released
+
+
+class FakeAnswerCache:
+    enabled = True
+
+    def __init__(self):
+        self.answers = {}
+
+    def get_many(self, questions):
+        return [self.answers.get(question) for question in questions]
+
+    def set_many(self, items):
+        self.answers.update(items)
+
+
+def test_resubmitted_failed_job_skips_the_answered_rows(chunked_job, monkeypatch):
+    from app.tasks import process_task
+
+    (run, checkpoints, released) = chunked_job
+    monkeypatch.setattr(process_task, "answer_cache", FakeAnswerCache())
+    monkeypatch.setattr(process_task.settings, "CHUNK_SIZE", 0)
+    monkeypatch.setattr(process_task.settings, "RAGFLOW_MAX_CONCURRENCY", 1)
+    assert run(failing_question="question 3").state == "FAILURE"
+    # the upload is sent again, as a new job: the rows answered before it failed are not asked
+    result = run(task_id="job-2")
+    assert result.state == "SUCCESS"
+    assert result.result["cached_rows"] == [0, 1, 2]
+    assert result.result["resumed_calls"] == 0
+
+
+def test_requirements_over_the_prompt_budget_are_not_asked(chunked_job, monkeypatch):
+    from app.tasks import process_task
+
+    (run, checkpoints, released) = chunked_job
+    monkeypatch.setattr(process_task.settings, "PROMPT_MAX_TOKENS", 20)
+    monkeypatch.setattr(process_task.settings, "TENDER_QUESTION_HEADER", "")
+    monkeypatch.setattr(process_task.settings, "VENDOR_QUESTION_HEADER", "")
+    result = run(questions=["short one", "x" * 100, "short two", "x" * 100])
+    assert result.state == "SUCCESS"
+    assert result.result["over_budget_rows"] == [1, 3]
+    with open(result.result["download_path"]) as f:
+        rows = f.read().splitlines()
+    assert rows[1] == "short one,answer to short one,"
+    assert "exceeds the prompt budget of 20 tokens" in rows[2]
+
+
+def test_failed_merge_releases_the_job_once(chunked_job, monkeypatch):
+    from app.tasks import process_task
+
+    (run, checkpoints, released) = chunked_job
+
+    def disk_full(*args, **kwargs):
+        raise OSError("No space left on device")
+
+    releases = []
+    release_job = process_task._release_job
+
+    def count_releases(task_result, layout):
+        releases.append(task_result.task_id)
+        release_job(task_result, layout)
+
+    monkeypatch.setattr(process_task, "_write_outputs", disk_full)
+    monkeypatch.setattr(process_task, "_release_job", count_releases)
+    result = run()
+    assert result.state == "FAILURE"
+    assert FakeReporter.events[-1] == ("fail", "No space left on device")
+    # released by fail_chunked_job only, not by the failed merge as well
+    assert releases == ["job-1"]
+
+
+def test_failed_chunk_errback_fails_the_job_and_releases_it(chunked_job, monkeypatch):
+    from types import SimpleNamespace
+    from app.tasks import process_task
+    from app.utils.checkpoint import TaskCheckpoint
+
+    (_, checkpoints, released) = chunked_job
+    removed = []
+    monkeypatch.setattr(process_task, "remove_spooled_upload", removed.append)
+    checkpoint = TaskCheckpoint("ragai:checkpoint:job-1")
+    checkpoint.save_job(
+        {
+            "task_meta": {
+                "task_id": "job-1",
+                "status": "PROCESSING",
+                "tenant_id": "acme",
+                "annotate": True,
+            },
+            "layout": [["in.xlsx", "/spool/in.xlsx", []]],
+        }
+    )
+    checkpoint.save(0, {"Requirement": "q"})
+    process_task.fail_chunked_job(
+        SimpleNamespace(id="job-1"), ValueError("chunk failed"), None, checkpoint.key
+    )
+    assert FakeReporter.events == [("fail", "chunk failed")]
+    assert (released, removed) == (["job-1"], ["/spool/in.xlsx"])
+    assert checkpoints.hashes == checkpoints.values == {}
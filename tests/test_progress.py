@@ -0,0 +1,48 @@
+from unittest.mock import MagicMock
+from app.models.task_schemas import TaskResult, TaskStatus
+from app.utils.progress import ProgressReporter
+
+
+def make_reporter(**kwargs):
+    task = MagicMock()
+    reporter = ProgressReporter(task, "task-1", **kwargs)
+    reporter._redis = MagicMock()
+    return (reporter, task)
+
+
+def test_reporter_coalesces_small_progress_steps():
+    reporter, task = make_reporter(interval=3600, step=10)
+    task_result = TaskResult(task_id="task-1", status=TaskStatus.STARTED)
+    reporter.update(task_result, TaskStatus.STARTED)
+    for progress in range(1, 101):
+        task_result.progress = float(progress)
+        reporter.update(task_result)
+    # STARTED, first PROCESSING, then one write per 10% step
+    assert task.update_state.call_count == 11
+    assert reporter.skipped_writes == 90
+
+
+def test_reporter_always_writes_state_changes_forced_and_final_updates():
+    reporter, task = make_reporter(interval=3600, step=100)
+    task_result = TaskResult(task_id="task-1", status=TaskStatus.STARTED)
+    reporter.update(task_result)
+    reporter.update(task_result)
+    reporter.update(task_result, force=True)
+    reporter.finish(task_result)
+    assert task.update_state.call_count == 3
+    assert task.update_state.call_args.kwargs["state"] == TaskStatus.SUCCESS
+    assert task.update_state.call_args.kwargs["meta"]["skipped_state_writes"] == 1
+
+
+def test_reporter_renews_the_tenant_slot_on_every_write(monkeypatch):
+    refreshed = []
+    monkeypatch.setattr(
+        "app.utils.progress.tenant_slots.refresh",
+        lambda tenant_id, task_id: refreshed.append((tenant_id, task_id)),
+    )
+    reporter, task = make_reporter(interval=3600, step=50)
+    task_result = TaskResult(task_id="task-1", status=TaskStatus.STARTED, tenant_id="acme")
+    for progress in (10.0, 20.0, 60.0):
+        task_result.progress = progress
+        reporter.update(task_result)
+    assert refreshed == [("acme", "task-1")] * task.update_state.call_count
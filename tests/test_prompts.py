@@ -0,0 +1,32 @@
+import pytest
+from app.utils.prompts import (
+    CHARS_PER_TOKEN,
+    PromptTooLongError,
+    budget_chars,
+    build_prompt,
+    within_budget,
+)
+
+
+def test_build_prompt_adds_the_header_once():
+    assert build_prompt("Is SSO supported?", "Answer: ") == "Answer: Is SSO supported?"
+    assert build_prompt("Answer: Is SSO supported?", "Answer: ") == "Answer: Is SSO supported?"
+    assert build_prompt("Is SSO supported?", "") == "Is SSO supported?"
+
+
+def test_build_prompt_rejects_prompts_over_the_budget():
+    with pytest.raises(PromptTooLongError):
+        build_prompt("x" * 100, "Answer: ", max_tokens=10)
+    assert build_prompt("x" * 32, "Answer: ", max_tokens=10).endswith("x" * 32)
+    assert build_prompt("x" * 100, "Answer: ", max_tokens=0).endswith("x" * 100)
+
+
+def test_within_budget_checks_every_header():
+    assert within_budget("x" * 32, ("", "Answer: "), max_tokens=10)
+    assert not within_budget("x" * 36, ("", "Answer: "), max_tokens=10)
+    assert within_budget("x" * 100, ("Answer: ",), max_tokens=0)
+
+
+def test_budget_chars_leaves_room_for_the_rest_of_the_prompt():
+    assert budget_chars("Answer: ", max_tokens=0) == 0
+    assert budget_chars("Answer: ", max_tokens=10) == (10 - 2) * CHARS_PER_TOKEN
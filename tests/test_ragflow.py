@@ -0,0 +1,179 @@
+import json
+import threading
+import pytest
+from unittest.mock import patch, MagicMock
+from app.services.ragflow import (
+    TENDER_QUESTION_HEADER,
+    RAGFlowSessionPool,
+    ask_question_to_chat_assistant,
+    parse_single_answer,
+    read_streamed_answer,
+)
+
+
+@pytest.fixture
+def mock_client_cls():
+    with patch("app.services.ragflow.PooledRAGFlow") as client_cls:
+        assistant = MagicMock()
+        assistant.create_session.side_effect = lambda name: MagicMock(name=name)
+        client_cls.return_value.list_chats.return_value = [assistant]
+        yield client_cls
+
+
+def test_session_pool_reuses_client_and_assistant_but_not_sessions(mock_client_cls):
+    pool = RAGFlowSessionPool(max_sessions=2, ttl=600)
+    assistant = mock_client_cls.return_value.list_chats.return_value[0]
+    with pool.session() as first:
+        pass
+    with pool.session() as second:
+        pass
+    # every job gets a fresh session, deleted on the server once the job ends
+    assert first is not second
+    assert [c.kwargs["ids"] for c in assistant.delete_sessions.call_args_list] == [
+        [first.id],
+        [second.id],
+    ]
+    assert mock_client_cls.call_count == 1
+    assert mock_client_cls.return_value.list_chats.call_count == 1
+
+
+def test_job_sessions_are_lent_to_one_thread_at_a_time(mock_client_cls):
+    pool = RAGFlowSessionPool(max_sessions=2, ttl=600)
+    assistant = mock_client_cls.return_value.list_chats.return_value[0]
+    lent = []
+
+    def borrow(sessions):
+        with sessions.lend() as session:
+            lent.append(session)
+
+    with pool.job_sessions() as sessions:
+        with sessions.lend() as first, sessions.lend() as second:
+            assert first is not second
+            # the pool is full: a third borrower waits for a session of the job
+            waiting = threading.Thread(target=borrow, args=(sessions,))
+            waiting.start()
+            waiting.join(0.05)
+            assert not lent
+        waiting.join(1)
+        assert lent[0] in (first, second)
+    assert assistant.delete_sessions.call_args.kwargs["ids"] == [first.id, second.id]
+    # the slots of the job are free again
+    with pool.job_sessions(timeout=0.01) as other, other.lend(), other.lend():
+        pass
+
+
+def test_session_pool_refreshes_after_ttl(mock_client_cls):
+    pool = RAGFlowSessionPool(max_sessions=2, ttl=0)
+    with pool.session() as first:
+        pass
+    with pool.session() as second:
+        pass
+    assert first is not second
+    assert mock_client_cls.call_count == 2
+
+
+def test_session_pool_invalidates_on_failure(mock_client_cls):
+    pool = RAGFlowSessionPool(max_sessions=2, ttl=600)
+    with pytest.raises(ValueError):
+        with pool.session() as first:
+            raise ValueError("Failed to get response from RAG Flow API")
+    with pool.session() as second:
+        pass
+    assert first is not second
+    assert mock_client_cls.call_count == 2
+
+
+def test_session_pool_is_bounded(mock_client_cls):
+    pool = RAGFlowSessionPool(max_sessions=1, ttl=600)
+    with pool.session():
+        with pytest.raises(TimeoutError):
+            with pool.session(timeout=0.01):
+                pass
+
+
+def sse_lines(*events):
+    return [f"data:{json.dumps(event)}".encode() for event in events] + [b""]
+
+
+def test_read_streamed_answer_assembles_cumulative_and_delta_chunks():
+    reference = {"doc_aggs": [{"doc_name": "guide.pdf"}]}
+    lines = sse_lines(
+        {"code": 0, "data": {"answer": "Yes", "reference": {}}},
+        {"code": 0, "data": {"answer": "Yes, SSO", "reference": {}}},
+        {"code": 0, "data": {"answer": " is supported.", "reference": reference}},
+        {"code": 0, "data": True},
+    )
+    assert read_streamed_answer(lines, null_answer="not found") == {
+        "code": 0,
+        "data": {"answer": "Yes, SSO is supported.", "reference": reference},
+    }
+
+
+def test_read_streamed_answer_cuts_off_on_null_answer():
+    def stream():
+        yield from sse_lines(
+            {"code": 0, "data": {"answer": "Sorry! The answer is not found", "reference": {}}}
+        )[:1]
+        raise AssertionError("read past the null answer")
+
+    result = read_streamed_answer(stream(), null_answer="the answer is not found")
+    assert result["data"]["answer"] == "Sorry! The answer is not found"
+
+
+def test_read_streamed_answer_raises_on_error_payload():
+    with pytest.raises(ValueError, match="chat not found"):
+        read_streamed_answer([b'{"code": 102, "message": "chat not found"}'])
+
+
+@pytest.fixture
+def prompt_header_chats(monkeypatch):
+    # the chats whose system prompt holds the header are remembered per worker
+    from app.services import ragflow
+
+    monkeypatch.setattr(ragflow, "prompt_header_chats", set())
+    return ragflow.prompt_header_chats
+
+
+@pytest.mark.parametrize("header_in_prompt", [False, True])
+def test_question_header_is_left_out_when_in_the_system_prompt(
+    mock_client_cls, prompt_header_chats, header_in_prompt
+):
+    assistant = mock_client_cls.return_value.list_chats.return_value[0]
+    assistant.id = "chat-1"
+    assistant.prompt.prompt = (
+        f"{TENDER_QUESTION_HEADER}\n{{knowledge}}" if header_in_prompt else "{knowledge}"
+    )
+    pool = RAGFlowSessionPool(ttl=600)
+    with pool.session() as session:
+        session.chat_id = "chat-1"
+        session.post.return_value = MagicMock(status_code=200)
+        ask_question_to_chat_assistant(session, "Is SSO supported?")
+    sent = session.post.call_args.args[1]["question"]
+    expected_header = "" if header_in_prompt else TENDER_QUESTION_HEADER
+    assert sent == f"{expected_header}Is SSO supported?"
+    assert prompt_header_chats == ({"chat-1"} if header_in_prompt else set())
+
+
+def test_parse_single_answer_strips_citations_and_joins_references():
+    response = {
+        "data": {
+            "answer": "Yes ##0$$, through SAML ##12$$.",
+            "reference": {"doc_aggs": [{"doc_name": "a.pdf"}, {"doc_name": "b.pdf"}]},
+        }
+    }
+    assert parse_single_answer(response) == {
+        "Supplier explanation / comments": "Yes , through SAML .",
+        "Reference": "a.pdf\nb.pdf",
+    }
+    plain = parse_single_answer({"data": {"answer": "No", "reference": {}}})
+    assert plain == {"Supplier explanation / comments": "No", "Reference": ""}
+
+
+def test_rejected_status_is_not_retried(mock_client_cls):
+    from app.utils.rate_limiter import BackendRejectedError
+
+    session = MagicMock(chat_id="chat-1", id="session-1")
+    session.post.return_value = MagicMock(status_code=404)
+    with pytest.raises(BackendRejectedError, match="status 404"):
+        ask_question_to_chat_assistant(session, "Is SSO supported?")
+    assert session.post.call_count == 1
@@ -0,0 +1,131 @@
+import pytest
+import redis
+from unittest.mock import patch, MagicMock
+from app.utils.rate_limiter import (
+    BackendUnavailableError,
+    CircuitBreaker,
+    RedisTokenBucket,
+    RetryableBackendError,
+    call_with_resilience,
+    retry_after_seconds,
+)
+
+
+@pytest.fixture(autouse=True)
+def no_sleep():
+    with patch("app.utils.rate_limiter.time.sleep") as mock_sleep:
+        yield mock_sleep
+
+
+def unlimited():
+    return RedisTokenBucket("test", rate=0, capacity=1)
+
+
+def test_retries_transient_failures_then_succeeds(no_sleep):
+    func = MagicMock(side_effect=[RetryableBackendError("429"), "ok"])
+    breaker = CircuitBreaker("test", failure_threshold=5, reset_timeout=30)
+    assert call_with_resilience(func, unlimited(), breaker, max_retries=3) == "ok"
+    assert func.call_count == 2
+    assert no_sleep.call_count == 1
+
+
+def test_gives_up_after_max_retries():
+    func = MagicMock(side_effect=RetryableBackendError("503"))
+    breaker = CircuitBreaker("test", failure_threshold=0, reset_timeout=30)
+    with pytest.raises(BackendUnavailableError):
+        call_with_resilience(func, unlimited(), breaker, max_retries=2)
+    assert func.call_count == 3
+
+
+def test_non_retryable_errors_are_raised_unchanged():
+    func = MagicMock(side_effect=ValueError("400"))
+    breaker = CircuitBreaker("test", failure_threshold=5, reset_timeout=30)
+    with pytest.raises(ValueError):
+        call_with_resilience(func, unlimited(), breaker, max_retries=3)
+    assert func.call_count == 1
+
+
+def test_open_circuit_fails_fast_and_half_opens_after_timeout():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=30)
+    func = MagicMock(side_effect=RetryableBackendError("503"))
+    with pytest.raises(BackendUnavailableError):
+        call_with_resilience(func, unlimited(), breaker, max_retries=5)
+    assert func.call_count == 2
+    assert breaker.is_open()
+
+    func = MagicMock(return_value="ok")
+    with pytest.raises(BackendUnavailableError):
+        call_with_resilience(func, unlimited(), breaker)
+    assert not func.called
+
+    breaker._opened_at -= 30
+    assert call_with_resilience(func, unlimited(), breaker) == "ok"
+    assert not breaker.is_open()
+
+
+def test_half_open_circuit_lets_a_single_probe_through():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker._opened_at -= 30
+    assert not breaker.is_open()
+    assert breaker.half_open
+    # the other callers wait for the outcome of the probe
+    assert breaker.is_open() and breaker.is_open()
+
+    # a failed probe opens the circuit again at once
+    breaker.record_failure()
+    assert breaker.is_open() and not breaker.half_open
+
+    # a probe with no outcome is replaced once reset_timeout has passed again
+    breaker._opened_at -= 30
+    assert not breaker.is_open()
+    breaker._opened_at -= 30
+    assert not breaker.is_open()
+    breaker.record_success()
+    assert not breaker.is_open() and not breaker.half_open
+
+
+def test_token_bucket_fails_open_without_redis():
+    limiter = RedisTokenBucket("test", rate=1, capacity=1)
+    limiter._script = MagicMock(side_effect=redis.ConnectionError("down"))
+    assert limiter.acquire()
+
+
+def test_token_bucket_waits_for_token(no_sleep):
+    limiter = RedisTokenBucket("test", rate=1, capacity=1)
+    limiter._script = MagicMock(side_effect=[250, 0])
+    assert limiter.acquire()
+    no_sleep.assert_called_once_with(0.25)
+
+
+def test_throttling_slows_the_bucket_and_honors_retry_after(no_sleep):
+    limiter = RedisTokenBucket("test", rate=10, capacity=1, backoff_factor=0.5)
+    limiter._script = MagicMock(return_value=0)
+    limiter._throttle_script = MagicMock(return_value=b"5")
+    throttled = RetryableBackendError("429", throttled=True, retry_after=12)
+    func = MagicMock(side_effect=[throttled, RetryableBackendError("503"), "ok"])
+    breaker = CircuitBreaker("test", failure_threshold=5, reset_timeout=30)
+    assert call_with_resilience(func, limiter, breaker, max_delay=1) == "ok"
+    # only the throttling response lowers the rate, to half of it, and pauses the bucket
+    limiter._throttle_script.assert_called_once_with(
+        keys=[limiter.key], args=[10, 0.5, 10 * 0.05, 12000, limiter.recovery]
+    )
+    assert no_sleep.call_args_list[0].args[0] == 12
+
+
+def test_throttle_fails_open_and_skips_unlimited_buckets():
+    limiter = RedisTokenBucket("test", rate=1, capacity=1)
+    limiter._throttle_script = MagicMock(side_effect=redis.ConnectionError("down"))
+    limiter.throttle(5)
+    unlimited_limiter = unlimited()
+    unlimited_limiter._throttle_script = MagicMock()
+    unlimited_limiter.throttle(5)
+    assert not unlimited_limiter._throttle_script.called
+
+
+def test_retry_after_seconds_reads_delays_only():
+    assert retry_after_seconds({"Retry-After": "7"}) == 7.0
+    assert retry_after_seconds({"Retry-After": "Wed, 21 Oct 2026 07:28:00 GMT"}) is None
+    assert retry_after_seconds({}) is None
+    assert retry_after_seconds(None) is None
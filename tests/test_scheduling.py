@@ -0,0 +1,63 @@
+import pytest
+import redis
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+from app.config.setting import settings
+from app.models.task_schemas import JobPriority
+from app.tasks.celery_worker import QUEUE_CONCURRENCY, celery_app, set_queue_concurrency
+from app.utils.scheduling import (
+    TENANT_SLOT_SCRIPT,
+    TENANT_WAKE_SCRIPT,
+    TenantSlots,
+    choose_queue,
+)
+
+
+def test_choose_queue_routes_by_size_and_priority(monkeypatch):
+    monkeypatch.setattr(settings, "FAST_LANE_MAX_ROWS", 200)
+    assert choose_queue(10) == settings.FAST_QUEUE
+    assert choose_queue(201) == settings.BULK_QUEUE
+    assert choose_queue(None) == settings.BULK_QUEUE
+    assert choose_queue(5000, JobPriority.INTERACTIVE) == settings.FAST_QUEUE
+    assert choose_queue(10, JobPriority.BULK) == settings.BULK_QUEUE
+
+
+def test_tenant_slots_limit_running_jobs():
+    slots = TenantSlots(limit=1, ttl=60, redis_url="redis://localhost:6379/0")
+    script = MagicMock(return_value=0)
+    slots._scripts[TENANT_SLOT_SCRIPT] = script
+    assert slots.acquire(None, "job") is True
+    assert slots.acquire("acme", "job", park={"task_id": "job"}) is False
+    script.assert_called_once_with(
+        keys=["ragai:tenant:acme:active", "ragai:tenant:acme:waiting", "ragai:tenant:acme:parked"],
+        args=["job", 1, 60, '{"task_id": "job"}'],
+    )
+    script.side_effect = redis.ConnectionError("down")
+    assert slots.acquire("acme", "job") is True
+
+
+def test_released_tenant_slot_wakes_parked_jobs():
+    slots = TenantSlots(limit=1, ttl=60, redis_url="redis://localhost:6379/0")
+    script = MagicMock(return_value=[b'{"task_id": "job-2"}'])
+    slots._scripts[TENANT_WAKE_SCRIPT] = script
+    assert slots.release("acme", "job-1") == [{"task_id": "job-2"}]
+    assert script.call_args.kwargs["args"] == ["job-1", 1, 60]
+    assert slots.release(None, "job-1") == []
+    script.side_effect = redis.ConnectionError("down")
+    assert slots.wake("acme") == []
+
+
+def test_worker_concurrency_follows_consumed_queues():
+    conf = SimpleNamespace(worker_concurrency=None)
+    set_queue_concurrency("fast@host", conf, {"queues": [settings.FAST_QUEUE]})
+    assert conf.worker_concurrency == QUEUE_CONCURRENCY[settings.FAST_QUEUE]
+    set_queue_concurrency("all@host", conf, {"queues": None})
+    assert conf.worker_concurrency == sum(QUEUE_CONCURRENCY.values())
+    set_queue_concurrency("custom@host", conf, {"concurrency": 8})
+    assert conf.worker_concurrency == sum(QUEUE_CONCURRENCY.values())
+
+
+@pytest.mark.parametrize("task", ["sweep_processed_files", "wake_parked_jobs"])
+def test_maintenance_tasks_run_from_the_fast_queue(task):
+    route = celery_app.amqp.router.route({}, f"app.tasks.maintenance.{task}")
+    assert route["queue"].name == settings.FAST_QUEUE
@@ -0,0 +1,70 @@
+import json
+import numpy as np
+from unittest.mock import MagicMock
+from app.utils.semantic_index import HashingEmbedder, SemanticIndex, load_embedder
+
+ANSWER = {"Supplier explanation / comments": "Yes", "Reference": "sso.pdf"}
+
+
+def make_index(values, seq, **kwargs):
+    index = SemanticIndex(
+        redis_url="redis://localhost:6379/0", enabled=True, threshold=0.8, **kwargs
+    )
+    pipe = MagicMock()
+    pipe.get.return_value = str(seq).encode()
+    pipe.llen.return_value = len(values)
+    pipe.execute.return_value = [[json.dumps(value).encode() for value in values]]
+    index._redis = MagicMock()
+    index._redis.pipeline.return_value.__enter__.return_value = pipe
+    return (index, pipe)
+
+
+def test_hashing_embedder_ranks_rewordings_above_other_requirements():
+    vectors = HashingEmbedder()(
+        [
+            "Does the solution support single sign-on (SSO) with SAML 2.0?",
+            "Does the proposed solution support single sign on (SSO) with SAML 2.0",
+            "Describe your data retention policy.",
+        ]
+    )
+    assert np.allclose(np.linalg.norm(vectors, axis=1), 1)
+    assert vectors[0] @ vectors[1] > 0.8 > vectors[0] @ vectors[2]
+
+
+def test_search_many_reuses_answers_above_threshold():
+    (index, _) = make_index(
+        [["Does the solution support SSO with SAML 2.0?", ANSWER]], seq=1
+    )
+    matches = index.search_many(
+        ["does the solution support SSO with SAML 2.0", "Describe your backup policy."]
+    )
+    (question, answer, similarity) = matches[0]
+    assert (question, answer) == ("Does the solution support SSO with SAML 2.0?", ANSWER)
+    assert similarity > 0.99
+    assert matches[1] is None
+
+
+def test_sync_fetches_only_new_entries_and_mirrors_trimming():
+    (index, pipe) = make_index([["q1", ANSWER], ["q2", ANSWER]], seq=2, max_entries=2)
+    index.search_many(["q1"])
+    pipe.lrange.assert_called_with(index.entries_key, 0, -1)
+
+    pipe.get.return_value = b"3"
+    pipe.execute.return_value = [[json.dumps(["q3", ANSWER]).encode()]]
+    index.search_many(["q1"])
+    pipe.lrange.assert_called_with(index.entries_key, 1, -1)
+    assert [question for question, _ in index._entries] == ["q2", "q3"]
+    assert index._matrix.shape[0] == 2
+
+
+def test_load_embedder_accepts_a_factory():
+    embedder = load_embedder("app.utils.semantic_index:HashingEmbedder")
+    assert isinstance(embedder, HashingEmbedder)
+
+
+def test_disabled_index_does_not_touch_redis():
+    index = SemanticIndex(redis_url="redis://localhost:6379/0", enabled=False)
+    index._redis = MagicMock()
+    assert index.search_many(["q1"]) == [None]
+    index.add_many([("q1", ANSWER)])
+    assert not index._redis.method_calls
@@ -0,0 +1,207 @@
+import io
+import json
+import pytest
+from types import SimpleNamespace
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.utils.redis_client import redis_client
+from app.utils.upload_dedup import upload_key
+
+
+class FakeRedis:
+    def __init__(self):
+        self.values = {}
+
+    async def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value.encode()
+        return True
+
+    async def get(self, key):
+        return self.values.get(key)
+
+    async def delete(self, key):
+        self.values.pop(key, None)
+
+    async def llen(self, key):
+        return 0
+
+    async def exists(self, key):
+        return int(key in self.values)
+
+    def pubsub(self):
+        return self.channel
+
+
+class FakePubSub:
+    def __init__(self):
+        self.messages = []
+        self.closed = False
+
+    async def subscribe(self, channel):
+        self.channel = channel
+
+    async def get_message(self, ignore_subscribe_messages=False, timeout=None):
+        return self.messages.pop(0) if self.messages else None
+
+    async def aclose(self):
+        self.closed = True
+
+
+@pytest.fixture
+def upload_client(tmp_path, monkeypatch):
+    from app.routers import ragflowtasks
+
+    monkeypatch.setattr(
+        "app.utils.file_client.get_upload_spool_directory", lambda: str(tmp_path)
+    )
+    fake_redis = FakeRedis()
+    fake_redis.channel = FakePubSub()
+    monkeypatch.setattr(redis_client, "redis_client", fake_redis)
+    queued = []
+
+    def send_task(name, args, kwargs, task_id, queue):
+        queued.append(task_id)
+        return SimpleNamespace(id=task_id)
+
+    monkeypatch.setattr(ragflowtasks.celery_app, "send_task", send_task)
+    states = {}
+
+    async def read_task_meta(task_id):
+        return states.get(task_id, ("PENDING", None))
+
+    monkeypatch.setattr(ragflowtasks, "read_task_meta", read_task_meta)
+    app = FastAPI()
+    app.include_router(ragflowtasks.router)
+    return (TestClient(app), queued, states)
+
+
+def upload(client, content=b"workbook bytes", **params):
+    files = {"file": ("tender.xlsx", io.BytesIO(content))}
+    return client.post("/ragflowai/upload", files=files, params=params).json()
+
+
+def test_upload_key_depends_on_content_and_options():
+    key = upload_key("abc", output_format="xlsx", annotate=False)
+    assert key == upload_key("abc", annotate=False, output_format="xlsx")
+    assert key != upload_key("abd", output_format="xlsx", annotate=False)
+    assert key != upload_key("abc", output_format="csv", annotate=False)
+
+
+def test_identical_upload_returns_the_running_job(upload_client):
+    (client, queued, states) = upload_client
+    first = upload(client)
+    states[first["task_id"]] = ("PROCESSING", {"progress": 10})
+    second = upload(client)
+    assert second == {"task_id": first["task_id"], "status": "PROCESSING", "reused": True}
+    assert upload(client, content=b"other bytes")["task_id"] != first["task_id"]
+    assert upload(client, output_format="csv")["task_id"] != first["task_id"]
+    assert len(queued) == 3
+
+
+def test_identical_upload_returns_the_finished_job_unless_forced(upload_client, tmp_path):
+    (client, queued, states) = upload_client
+    first = upload(client)
+    output = tmp_path / "out.xlsx"
+    output.write_bytes(b"answers")
+    states[first["task_id"]] = ("SUCCESS", {"download_path": str(output)})
+    assert upload(client)["download_url"].endswith(first["task_id"])
+
+    forced = upload(client, force=True)
+    assert forced["task_id"] != first["task_id"] and "queue" in forced
+    # the forced job replaces the finished one for later uploads
+    assert upload(client)["task_id"] == forced["task_id"]
+    assert len(queued) == 2
+
+
+def test_failed_or_expired_jobs_are_queued_again(upload_client, tmp_path):
+    (client, queued, states) = upload_client
+    first = upload(client)
+    states[first["task_id"]] = ("FAILURE", None)
+    second = upload(client)
+    assert second["task_id"] != first["task_id"]
+    states[second["task_id"]] = ("SUCCESS", {"download_path": str(tmp_path / "swept.xlsx")})
+    assert upload(client)["task_id"] not in (first["task_id"], second["task_id"])
+    assert len(queued) == 3
+
+
+def test_upload_that_could_not_be_queued_is_not_reused(upload_client, monkeypatch):
+    from app.routers import ragflowtasks
+
+    (client, queued, states) = upload_client
+    send_task = ragflowtasks.celery_app.send_task
+
+    def broker_down(*args, **kwargs):
+        raise ConnectionError("broker down")
+
+    monkeypatch.setattr(ragflowtasks.celery_app, "send_task", broker_down)
+    with pytest.raises(ConnectionError):
+        upload(client)
+    assert redis_client.redis_client.values == {}
+    monkeypatch.setattr(ragflowtasks.celery_app, "send_task", send_task)
+    assert "queue" in upload(client)
+    assert len(queued) == 1
+
+
+def test_batch_that_could_not_be_queued_removes_its_uploads(upload_client, monkeypatch, tmp_path):
+    from app.routers import ragflowtasks
+
+    (client, queued, states) = upload_client
+
+    def broker_down(*args, **kwargs):
+        raise ConnectionError("broker down")
+
+    monkeypatch.setattr(ragflowtasks.celery_app, "send_task", broker_down)
+    files = [("files", (f"tender{i}.xlsx", io.BytesIO(b"workbook bytes"))) for i in range(2)]
+    with pytest.raises(ConnectionError):
+        client.post("/ragflowai/upload/batch", files=files)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_status_of_a_retrying_job_is_queued(upload_client):
+    from celery.exceptions import Retry
+
+    (client, queued, states) = upload_client
+    states["job-1"] = ("RETRY", Retry("backend busy"))
+    response = client.get("/ragflowai/status/job-1")
+    assert response.status_code == 200
+    assert response.json()["status"] == "RETRY"
+    assert response.json()["progress"] == 0
+
+
+def read_events(response):
+    return [
+        (block.split("\n")[0].removeprefix("event: "), block.split("data: ", 1)[-1])
+        for block in response.text.strip().split("\n\n")
+    ]
+
+
+def test_events_of_an_unknown_task_are_not_found(upload_client):
+    (client, queued, states) = upload_client
+    assert client.get("/ragflowai/events/no-such-job").status_code == 404
+
+
+def test_events_of_a_queued_job_stream_until_it_is_done(upload_client):
+    (client, queued, states) = upload_client
+    task_id = upload(client)["task_id"]
+    pubsub = redis_client.redis_client.channel
+    pubsub.messages = [
+        None,
+        {"data": json.dumps({"event": "row", "data": {"index": 0}})},
+        {"data": json.dumps({"event": "done", "data": {"task_id": task_id}})},
+    ]
+    response = client.get(f"/ragflowai/events/{task_id}")
+    assert response.status_code == 200
+    events = read_events(response)
+    assert [event for (event, _) in events] == ["progress", ": keepalive", "row", "done"]
+    assert json.loads(events[0][1])["status"] == "PENDING"
+    assert pubsub.channel.endswith(task_id) and pubsub.closed
+
+
+def test_events_of_a_finished_job_end_at_once(upload_client):
+    (client, queued, states) = upload_client
+    states["job-1"] = ("SUCCESS", {"task_id": "job-1"})
+    events = read_events(client.get("/ragflowai/events/job-1"))
+    assert [event for (event, _) in events] == ["done"]
+    assert json.loads(events[0][1])["download_url"].endswith("job-1")